@@ -0,0 +1,164 @@
+"""
+Account Lookup Cache
+Bounded in-process LRU with TTL in front of ``crud.get_email_account`` so the
+mail endpoints can authenticate a poll without a database round trip. With
+the shared cache enabled, workers also see each other's invalidations. The
+records themselves stay in process: they hold the password and access token,
+which are never written to the shared directory.
+"""
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, Optional
+
+from sqlalchemy.orm import Session
+
+import config as app_config
+import crud
+import shared_cache
+
+
+@dataclass(frozen=True)
+class AccountRecord:
+    """Detached, immutable copy of an ``EmailAccount`` row."""
+
+    id: int
+    mail_id: str
+    email: str
+    password: str
+    imap_server: str
+    access_token: str
+    default_sender_filter: Optional[str]
+    folders: Optional[str] = None
+
+    @classmethod
+    def from_model(cls, account) -> "AccountRecord":
+        return cls(
+            id=account.id,
+            mail_id=account.mail_id,
+            email=account.email,
+            password=account.password,
+            imap_server=account.imap_server,
+            access_token=account.access_token,
+            default_sender_filter=account.default_sender_filter,
+            folders=account.folders,
+        )
+
+    def token_matches(self, token: str) -> bool:
+        # Constant-time comparison so the token cannot be guessed by timing
+        return secrets.compare_digest((self.access_token or "").encode(), (token or "").encode())
+
+
+class AccountCache:
+    def __init__(self, max_size: int = None, ttl: float = None):
+        self.max_size = app_config.ACCOUNT_CACHE_SIZE if max_size is None else max_size
+        self.ttl = app_config.ACCOUNT_CACHE_TTL if ttl is None else ttl
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # mail_id -> (AccountRecord, expires_at)
+        self._mail_ids = {}  # account id -> mail_id
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._version = 0
+
+    def lookup(self, mail_id: str) -> Optional[AccountRecord]:
+        """Return the cached record for ``mail_id`` without touching the database."""
+        with self._lock:
+            entry = self._entries.get(mail_id)
+            if entry is not None:
+                record, expires_at, generation = entry
+                # Another worker may have invalidated the account since it was cached
+                if expires_at > time.monotonic() and generation == shared_cache.cache.generation(record.id):
+                    self._entries.move_to_end(mail_id)
+                    self.hits += 1
+                    return record
+                self._remove_locked(mail_id)
+            self.misses += 1
+            return None
+
+    def load(self, db: Session, mail_id: str) -> Optional[AccountRecord]:
+        """Read ``mail_id`` from the database and cache it."""
+        version = self._version
+        account = crud.get_email_account(db, mail_id=mail_id)
+        if not account:
+            return None
+        record = AccountRecord.from_model(account)
+        self.put(record, version)
+        return record
+
+    def get(self, db: Session, mail_id: str) -> Optional[AccountRecord]:
+        return self.lookup(mail_id) or self.load(db, mail_id)
+
+    def get_many(self, db: Session, mail_ids) -> Dict[str, AccountRecord]:
+        """Records for ``mail_ids``; all cache misses are read with one query."""
+        records, missing = {}, []
+        for mail_id in dict.fromkeys(mail_ids):
+            record = self.lookup(mail_id)
+            if record is not None:
+                records[mail_id] = record
+            else:
+                missing.append(mail_id)
+        if missing:
+            version = self._version
+            for account in crud.get_email_accounts_by_mail_ids(db, missing):
+                record = AccountRecord.from_model(account)
+                self.put(record, version)
+                records[record.mail_id] = record
+        return records
+
+    def put(self, record: AccountRecord, version: int = None, generation: int = None):
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            if version is not None and version != self._version:
+                # An admin change landed while the row was being read
+                return
+            self._remove_locked(self._mail_ids.get(record.id))
+            if generation is None:
+                generation = shared_cache.cache.generation(record.id)
+            self._entries[record.mail_id] = (record, time.monotonic() + self.ttl, generation)
+            self._entries.move_to_end(record.mail_id)
+            self._mail_ids[record.id] = record.mail_id
+            while len(self._entries) > self.max_size:
+                self._remove_locked(next(iter(self._entries)))
+                self.evictions += 1
+
+    def invalidate(self, account_id: int = None, mail_id: str = None):
+        with self._lock:
+            self._version += 1
+            if account_id is not None:
+                self._remove_locked(self._mail_ids.get(account_id))
+            if mail_id is not None:
+                self._remove_locked(mail_id)
+        if account_id is not None:
+            # Drops the account's entries in the other workers too
+            shared_cache.cache.bump(account_id)
+
+    def clear(self):
+        with self._lock:
+            self._version += 1
+            self._entries.clear()
+            self._mail_ids.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+    def _remove_locked(self, mail_id: Optional[str]):
+        entry = self._entries.pop(mail_id, None) if mail_id is not None else None
+        if entry is not None and self._mail_ids.get(entry[0].id) == mail_id:
+            del self._mail_ids[entry[0].id]
+
+
+cache = AccountCache()
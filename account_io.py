@@ -0,0 +1,301 @@
+"""
+Bulk Account Import / Export
+Imports CSV or NDJSON uploads as a stream: rows are validated and checked
+for duplicate emails / mail_ids one chunk at a time (one query per chunk)
+and missing IDs and tokens are generated for the whole chunk. Nothing is
+written while the body is still arriving; once the whole upload has been
+checked, the accepted rows are inserted with one ``executemany`` per chunk
+in a single short transaction, and only if no row failed. A bad upload
+leaves no partial state, and the write lock is held only for the inserts
+instead of for as long as the client takes to send the body. The accepted
+rows are buffered in memory until then, so an upload is limited to
+``ACCOUNT_IMPORT_MAX_ROWS`` rows. Exports walk the table by primary key in
+pages and leave out passwords and access tokens unless asked for them.
+"""
+import codecs
+import csv
+import io
+import json
+import logging
+import secrets
+from typing import List, Optional, Tuple
+
+import shortuuid
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+
+import config as app_config
+import database
+import models
+
+logger = logging.getLogger(__name__)
+
+FIELDS = ("mail_id", "email", "password", "imap_server", "access_token", "default_sender_filter", "folders")
+REQUIRED_FIELDS = ("email", "password", "imap_server")
+FORMATS = ("csv", "ndjson")
+MEDIA_TYPES = {"csv": "text/csv; charset=utf-8", "ndjson": "application/x-ndjson"}
+# Errors listed in the report; the total is always returned as error_count
+MAX_REPORTED_ERRORS = 100
+
+
+def detect_format(requested: Optional[str], content_type: str) -> Optional[str]:
+    if requested:
+        return requested.lower() if requested.lower() in FORMATS else None
+    content_type = (content_type or "").lower()
+    if "csv" in content_type:
+        return "csv"
+    if "ndjson" in content_type or "jsonl" in content_type or "json" in content_type:
+        return "ndjson"
+    return None
+
+
+async def read_lines(chunks):
+    """Decode an async stream of byte chunks into lines (line endings kept)."""
+    decoder = codecs.getincrementaldecoder("utf-8-sig")(errors="replace")
+    pending = ""
+    async for chunk in chunks:
+        pending += decoder.decode(chunk)
+        lines = pending.splitlines(keepends=True)
+        # The last piece may be a line cut in half by the chunk boundary
+        pending = lines.pop() if lines and not lines[-1].endswith(("\n", "\r")) else ""
+        for line in lines:
+            yield line
+    pending += decoder.decode(b"", final=True)
+    if pending:
+        yield pending
+
+
+async def csv_records(lines):
+    """Yield ``(line_number, row, error)``; the first record is the header."""
+    header = None
+    buffered: List[str] = []
+    line_number = start = quotes = 0
+    async for line in lines:
+        line_number += 1
+        if not buffered:
+            start = line_number
+        buffered.append(line)
+        quotes += line.count('"')
+        # A quoted field may span lines; wait until the quotes are balanced
+        if quotes % 2:
+            continue
+        quotes = 0
+        text, buffered = "".join(buffered), []
+        if not text.strip():
+            continue
+        values = next(csv.reader([text]))
+        if header is None:
+            header = [name.strip().lower() for name in values]
+            missing = [name for name in REQUIRED_FIELDS if name not in header]
+            if missing:
+                yield start, None, f"CSV header is missing columns: {', '.join(missing)}"
+                return
+            continue
+        if len(values) > len(header):
+            yield start, None, f"Expected {len(header)} columns, got {len(values)}"
+            continue
+        yield start, dict(zip(header, values)), None
+    if buffered:
+        yield start, None, "Unterminated quoted field"
+
+
+async def ndjson_records(lines):
+    """Yield ``(line_number, row, error)`` for each non-blank line."""
+    line_number = 0
+    async for line in lines:
+        line_number += 1
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as e:
+            yield line_number, None, f"Invalid JSON: {e}"
+            continue
+        if not isinstance(row, dict):
+            yield line_number, None, "Expected a JSON object"
+            continue
+        yield line_number, row, None
+
+
+def _clean(row: dict) -> dict:
+    values = {}
+    for name in FIELDS:
+        value = row.get(name)
+        if value is not None and not isinstance(value, str):
+            value = str(value)
+        value = value.strip() if value is not None else None
+        values[name] = value or None
+    return values
+
+
+class AccountImporter:
+    def __init__(self, dry_run: bool = False, skip_existing: bool = False, chunk_size: int = None, max_rows: int = None):
+        self.dry_run = dry_run
+        self.skip_existing = skip_existing
+        self.chunk_size = chunk_size or app_config.ACCOUNT_IMPORT_CHUNK_SIZE
+        self.max_rows = max_rows or app_config.ACCOUNT_IMPORT_MAX_ROWS
+        self.accepted = 0
+        self.skipped = 0
+        self.error_count = 0
+        self.errors: List[dict] = []
+        self._emails = set()
+        self._mail_ids = set()
+        self._pending: List[Tuple[int, dict]] = []  # Accepted rows, inserted by _finish
+
+    async def run(self, db, records) -> dict:
+        chunk = []
+        rows = 0
+        async for line_number, row, error in records:
+            rows += 1
+            if rows > self.max_rows:
+                # Stop reading: the checked rows would have to stay in memory
+                self._error(line_number, f"Upload exceeds {self.max_rows} rows, split it into several imports")
+                break
+            if error is not None:
+                self._error(line_number, error)
+                continue
+            chunk.append((line_number, row))
+            if len(chunk) >= self.chunk_size:
+                await database.run_sync(db, self._import_chunk, chunk)
+                chunk = []
+        if chunk:
+            await database.run_sync(db, self._import_chunk, chunk)
+        await database.run_sync(db, self._finish)
+        return self.report()
+
+    def report(self) -> dict:
+        committed = not self.dry_run and not self.error_count
+        return {
+            "dry_run": self.dry_run,
+            "committed": committed,
+            "accepted": self.accepted,
+            "created": self.accepted if committed else 0,
+            "skipped": self.skipped,
+            "error_count": self.error_count,
+            "errors": self.errors,
+        }
+
+    def _error(self, line_number: int, message: str):
+        self.error_count += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({"line": line_number, "error": message})
+
+    def _import_chunk(self, db, chunk):
+        try:
+            self._check_chunk(db, chunk)
+        finally:
+            db.rollback()  # Do not hold a read transaction while the next chunk arrives
+
+    def _check_chunk(self, db, chunk):
+        rows = []
+        for line_number, raw in chunk:
+            values = _clean(raw)
+            missing = [name for name in REQUIRED_FIELDS if not values[name]]
+            if missing:
+                self._error(line_number, f"Missing {', '.join(missing)}")
+                continue
+            if values["email"] in self._emails:
+                self._error(line_number, f"Duplicate email in upload: {values['email']}")
+                continue
+            if values["mail_id"] and values["mail_id"] in self._mail_ids:
+                self._error(line_number, f"Duplicate mail_id in upload: {values['mail_id']}")
+                continue
+            self._emails.add(values["email"])
+            if values["mail_id"]:
+                self._mail_ids.add(values["mail_id"])
+            rows.append((line_number, values))
+        if not rows:
+            return
+
+        rows = self._drop_existing(db, rows)
+        if not rows:
+            return
+        for _, values in rows:
+            if not values["mail_id"]:
+                values["mail_id"] = shortuuid.uuid()
+            if not values["access_token"]:
+                values["access_token"] = secrets.token_urlsafe(16)
+
+        self.accepted += len(rows)
+        # After the first failure nothing will be written; keep validating only
+        if self.dry_run or self.error_count:
+            self._pending = []
+        else:
+            self._pending.extend(rows)
+
+    def _drop_existing(self, db, rows):
+        """Remove rows whose email or mail_id is already stored (one query each)."""
+        emails = [values["email"] for _, values in rows]
+        mail_ids = [values["mail_id"] for _, values in rows if values["mail_id"]]
+        table = models.EmailAccount.__table__
+        existing_emails = set(db.execute(select(table.c.email).where(table.c.email.in_(emails))).scalars())
+        existing_ids = set()
+        if mail_ids:
+            existing_ids = set(db.execute(select(table.c.mail_id).where(table.c.mail_id.in_(mail_ids))).scalars())
+        if not existing_emails and not existing_ids:
+            return rows
+
+        kept = []
+        for line_number, values in rows:
+            if values["email"] in existing_emails and self.skip_existing:
+                self.skipped += 1
+            elif values["email"] in existing_emails:
+                self._error(line_number, f"Email already exists: {values['email']}")
+            elif values["mail_id"] in existing_ids:
+                self._error(line_number, f"mail_id already exists: {values['mail_id']}")
+            else:
+                kept.append((line_number, values))
+        return kept
+
+    def _finish(self, db):
+        if self.dry_run or self.error_count:
+            self._pending = []
+            return
+        table = models.EmailAccount.__table__
+        try:
+            for start in range(0, len(self._pending), self.chunk_size):
+                rows = self._pending[start:start + self.chunk_size]
+                db.execute(table.insert(), [values for _, values in rows])
+            db.commit()
+        except IntegrityError as e:
+            # Only possible if another writer raced us since the rows were checked
+            db.rollback()
+            self._error(rows[0][0], f"Insert failed for lines {rows[0][0]}-{rows[-1][0]}: {e.orig}")
+        finally:
+            self._pending = []
+
+
+def export_rows(file_format: str, include_secrets: bool = False, page_size: int = None):
+    """Yield the accounts table as CSV or NDJSON text, one page per chunk.
+
+    Uses its own session, since the response body is produced after the
+    request's dependencies have been closed.
+    """
+    page_size = page_size or app_config.ACCOUNT_IMPORT_CHUNK_SIZE
+    fields = FIELDS if include_secrets else tuple(name for name in FIELDS if name not in ("password", "access_token"))
+    table = models.EmailAccount.__table__
+    columns = [table.c.id] + [table.c[name] for name in fields]
+    db = database.SessionLocal()
+    try:
+        if file_format == "csv":
+            yield _csv_line(fields)
+        last_id = 0
+        while True:
+            # Keyset paging: each page is an index range scan, however deep
+            page = db.execute(select(*columns).where(table.c.id > last_id).order_by(table.c.id).limit(page_size)).all()
+            db.rollback()  # Do not hold a read transaction between pages
+            if not page:
+                break
+            last_id = page[-1][0]
+            if file_format == "csv":
+                yield "".join(_csv_line(row[1:]) for row in page)
+            else:
+                yield "".join(json.dumps(dict(zip(fields, row[1:])), ensure_ascii=False) + "\n" for row in page)
+    finally:
+        db.close()
+
+
+def _csv_line(values) -> str:
+    buffer = io.StringIO()
+    csv.writer(buffer, lineterminator="\n").writerow(["" if value is None else value for value in values])
+    return buffer.getvalue()
@@ -0,0 +1,395 @@
+"""
+Asyncio IMAP Client
+Minimal IMAP4rev1 client built on asyncio streams. Command results use the
+same ``(typ, data)`` shapes as :mod:`imaplib` so the response parsing helpers
+in ``mail_service`` work for both clients.
+"""
+import asyncio
+import base64
+import re
+import ssl
+
+import config as app_config
+
+IMAP_SSL_PORT = 993
+
+LITERAL_PATTERN = re.compile(rb"\{(\d+)\}$")
+TAGGED_PATTERN = re.compile(rb"^(?P<tag>[A-Z]\d+) (?P<type>[A-Z]+) ?(?P<text>.*)$")
+UNTAGGED_PATTERN = re.compile(rb"^\* (?P<type>[A-Z-]+)(?: (?P<data>.*))?$")
+UNTAGGED_STATUS_PATTERN = re.compile(rb"^\* (?P<data>\d+) (?P<type>[A-Z-]+)(?: (?P<data2>.*))?$")
+RESPONSE_CODE_PATTERN = re.compile(rb"\[(?P<type>[A-Z-]+)(?: (?P<data>[^\]]*))?\]")
+# Untagged data and response codes that describe the mailbox a SELECT opened
+SELECT_RESPONSES = ("EXISTS", "RECENT", "FLAGS", "PERMANENTFLAGS", "UIDVALIDITY", "UIDNEXT", "HIGHESTMODSEQ")
+
+
+class ImapError(Exception):
+    """Raised when the server answers a command with NO or BAD."""
+
+
+class ImapAbort(ImapError):
+    """Raised when the connection is closed or the server sent BYE."""
+
+
+class AsyncImapClient:
+    def __init__(self, host: str, port: int = None, use_ssl: bool = True, timeout: float = None, ssl_context=None):
+        self.host = host
+        self.use_ssl = use_ssl
+        self.ssl_context = ssl_context
+        self.port = port or (IMAP_SSL_PORT if use_ssl else 143)
+        self.timeout = app_config.IMAP_TIMEOUT if timeout is None else timeout
+        self.capabilities = set()
+        self.untagged_responses = {}
+        self.state = "LOGOUT"
+        self._reader = None
+        self._writer = None
+        self._tag_counter = 0
+        self._idle_tag = None
+        # One dict of SELECT_RESPONSES per SELECT of the last pipeline
+        self.select_responses = []
+
+    async def connect(self):
+        ssl_context = (self.ssl_context or ssl.create_default_context()) if self.use_ssl else None
+        self._reader, self._writer = await asyncio.wait_for(
+            asyncio.open_connection(self.host, self.port, ssl=ssl_context),
+            self.timeout,
+        )
+        greeting = await self._read_line()
+        if greeting.startswith(b"* BYE"):
+            raise ImapAbort(greeting.decode(errors="replace"))
+        self._store_untagged(greeting)
+        self.state = "NONAUTH"
+        if "CAPABILITY" not in self.untagged_responses:
+            await self.capability()
+        else:
+            self._load_capabilities()
+        return self
+
+    @property
+    def closed(self) -> bool:
+        return self._writer is None or self._writer.is_closing()
+
+    async def capability(self):
+        typ, data = await self._simple_command("CAPABILITY")
+        self._load_capabilities()
+        return typ, data
+
+    async def login(self, user: str, password: str):
+        self.untagged_responses.pop("CAPABILITY", None)
+        typ, data = await self._simple_command("LOGIN", quote(user), quote(password))
+        if typ != "OK":
+            raise ImapError(data[-1].decode(errors="replace") if data else "LOGIN failed")
+        self.state = "AUTH"
+        # Servers commonly advertise extra capabilities after authentication,
+        # most of them in the OK response code, which saves a round trip
+        if "CAPABILITY" in self.untagged_responses:
+            self._load_capabilities()
+        else:
+            await self.capability()
+        return typ, data
+
+    async def select(self, mailbox: str = "INBOX", readonly: bool = False):
+        return await self._single("select", (mailbox, readonly))
+
+    async def status(self, mailbox: str, names: str):
+        return await self._single("status", (mailbox, names))
+
+    async def noop(self):
+        return await self._simple_command("NOOP")
+
+    async def search(self, charset, *criteria):
+        return await self._single("search", (charset,) + criteria)
+
+    async def fetch(self, message_set: str, message_parts: str):
+        return await self._single("fetch", (message_set, message_parts))
+
+    async def uid(self, command: str, *args):
+        return await self._single("uid", (command,) + args)
+
+    async def pipeline(self, commands):
+        """Send ``commands`` back to back, then read all of their results.
+
+        ``commands`` are ``(method, args)`` pairs for :meth:`select`,
+        :meth:`status`, :meth:`uid`, :meth:`search`, :meth:`fetch` or
+        :meth:`noop`; results are returned in order, shaped as the method
+        would return them. Only the first command waits for a network round
+        trip. A command the server rejects with BAD yields ``("BAD", [text])``
+        instead of raising, so the responses of the commands after it are
+        still consumed. Each SELECT also appends its UIDVALIDITY etc. to
+        :attr:`select_responses`, since a later SELECT in the same pipeline
+        replaces them in ``untagged_responses``.
+        """
+        self.select_responses = []
+        pending = []
+        for method, args in commands:
+            name, command_args, response_type = self._command_spec(method, args)
+            if method == "select":
+                self.untagged_responses.clear()
+            else:
+                self.untagged_responses.pop(response_type, None)
+            pending.append((method, self._queue_command(name, *command_args), response_type))
+        await self._flush()
+
+        results = []
+        for method, tag, response_type in pending:
+            if method == "select":
+                for name in SELECT_RESPONSES:
+                    self.untagged_responses.pop(name, None)
+            try:
+                typ, tagged = await self._read_until_tagged(tag)
+            except ImapError as exc:
+                if isinstance(exc, ImapAbort):
+                    raise
+                if method == "select":
+                    self.select_responses.append({})
+                results.append(("BAD", [str(exc).encode()]))
+                continue
+            if method == "select":
+                if typ == "OK":
+                    self.state = "SELECTED"
+                self.select_responses.append(
+                    {name: self.untagged_responses[name][-1] for name in SELECT_RESPONSES if name in self.untagged_responses}
+                )
+                results.append((typ, self.untagged_responses.get("EXISTS", [None])))
+            elif typ != "OK" or response_type is None:
+                results.append((typ, tagged))
+            else:
+                results.append((typ, self.untagged_responses.pop(response_type, [None])))
+        return results
+
+    async def _single(self, method: str, args):
+        typ, data = (await self.pipeline([(method, args)]))[0]
+        if typ == "BAD":
+            raise ImapError(data[0].decode(errors="replace"))
+        return typ, data
+
+    @staticmethod
+    def _command_spec(method: str, args):
+        """IMAP command name, arguments and the untagged type holding its data."""
+        if method == "select":
+            mailbox = args[0] if args else "INBOX"
+            readonly = len(args) > 1 and args[1]
+            return ("EXAMINE" if readonly else "SELECT"), (quote_mailbox(mailbox),), "EXISTS"
+        if method == "status":
+            return "STATUS", (quote_mailbox(args[0]), args[1]), "STATUS"
+        if method == "uid":
+            command, rest = args[0].upper(), tuple(args[1:])
+            if command == "SEARCH" and rest and str(rest[0]).upper().startswith("RETURN"):
+                response_type = "ESEARCH"
+            else:
+                response_type = "FETCH" if command in ("FETCH", "STORE") else command
+            return "UID", (command,) + rest, response_type
+        if method == "search":
+            return "SEARCH", _with_charset(args[0], args[1:]), "SEARCH"
+        if method == "fetch":
+            return "FETCH", tuple(args), "FETCH"
+        if method == "noop":
+            return "NOOP", (), None
+        raise ValueError(f"{method} cannot be pipelined")
+
+    def response(self, code: str):
+        """Pop the untagged ``code`` responses received so far (as imaplib does)."""
+        return code, self.untagged_responses.pop(code.upper(), [None])
+
+    async def close(self):
+        typ, data = await self._simple_command("CLOSE")
+        self.state = "AUTH"
+        return typ, data
+
+    async def logout(self):
+        try:
+            if not self.closed:
+                await asyncio.wait_for(self._simple_command("LOGOUT"), self.timeout)
+        except (ImapError, OSError, asyncio.TimeoutError):
+            pass
+        finally:
+            self.shutdown()
+
+    def shutdown(self):
+        self.state = "LOGOUT"
+        if self._writer is not None:
+            self._writer.close()
+
+    async def idle_start(self):
+        """Send IDLE and wait for the continuation request."""
+        if "IDLE" not in self.capabilities:
+            raise ImapError("Server does not support IDLE")
+        self._idle_tag = self._next_tag()
+        await self._send(self._idle_tag + b" IDLE")
+        while True:
+            line = await self._read_line()
+            if line.startswith(b"+"):
+                return
+            if line.startswith(self._idle_tag):
+                self._idle_tag = None
+                raise ImapError(line.decode(errors="replace"))
+            self._store_untagged(line)
+
+    async def idle_wait(self, timeout: float):
+        """Wait up to ``timeout`` seconds for an untagged response during IDLE.
+
+        Returns the ``(type, data)`` of the response, or ``None`` on timeout.
+        """
+        try:
+            line = await asyncio.wait_for(self._read_line(), timeout)
+        except asyncio.TimeoutError:
+            return None
+        return self._store_untagged(line)
+
+    async def idle_done(self):
+        tag, self._idle_tag = self._idle_tag, None
+        await self._send(b"DONE")
+        typ, _ = await self._read_until_tagged(tag)
+        return typ
+
+    def _next_tag(self) -> bytes:
+        self._tag_counter += 1
+        return b"A%d" % self._tag_counter
+
+    def _load_capabilities(self):
+        raw = self.untagged_responses.pop("CAPABILITY", [b""])[-1] or b""
+        self.capabilities = {cap.upper() for cap in raw.decode(errors="replace").split()}
+
+    async def _simple_command(self, name: str, *args):
+        tag = await self._send_command(name, *args)
+        return await self._read_until_tagged(tag)
+
+    async def _send_command(self, name: str, *args) -> bytes:
+        tag = self._queue_command(name, *args)
+        await self._flush()
+        return tag
+
+    def _queue_command(self, name: str, *args) -> bytes:
+        tag = self._next_tag()
+        parts = [tag, name.encode()]
+        parts.extend(arg if isinstance(arg, bytes) else str(arg).encode() for arg in args)
+        self._write(b" ".join(parts))
+        return tag
+
+    async def _send(self, line: bytes):
+        self._write(line)
+        await self._flush()
+
+    def _write(self, line: bytes):
+        if self.closed:
+            raise ImapAbort("connection closed")
+        self._writer.write(line + b"\r\n")
+
+    async def _flush(self):
+        await asyncio.wait_for(self._writer.drain(), self.timeout)
+
+    async def _read_until_tagged(self, tag: bytes):
+        while True:
+            response = await asyncio.wait_for(self._read_response(), self.timeout)
+            if isinstance(response, bytes) and response.startswith(tag + b" "):
+                match = TAGGED_PATTERN.match(response)
+                typ = match.group("type").decode() if match else "BAD"
+                text = match.group("text") if match else response
+                self._store_response_code(text)
+                if typ == "BAD":
+                    raise ImapError(text.decode(errors="replace"))
+                return typ, [text]
+            self._store_untagged(response)
+
+    async def _read_response(self):
+        """Read one response, returning bytes or a list of literal tuples."""
+        line = await self._read_line()
+        literal = LITERAL_PATTERN.search(line)
+        if not literal:
+            return line
+        parts = []
+        while literal:
+            size = int(literal.group(1))
+            data = await self._reader.readexactly(size)
+            parts.append((line, data))
+            line = await self._read_line()
+            literal = LITERAL_PATTERN.search(line)
+        parts.append(line)
+        return parts
+
+    async def _read_line(self) -> bytes:
+        try:
+            line = await self._reader.readline()
+        except (ConnectionError, asyncio.IncompleteReadError) as exc:
+            raise ImapAbort(f"socket error: {exc}") from exc
+        if not line:
+            raise ImapAbort("socket error: EOF")
+        return line.rstrip(b"\r\n")
+
+    def _store_untagged(self, response):
+        head = response[0][0] if isinstance(response, list) else response
+        if head.startswith(b"* BYE") and self.state != "LOGOUT":
+            self.shutdown()
+            raise ImapAbort(head.decode(errors="replace"))
+
+        match = UNTAGGED_STATUS_PATTERN.match(head)
+        if match:
+            typ = match.group("type").decode()
+            if isinstance(response, list):
+                # Keep imaplib's shape: the first tuple starts with the
+                # sequence number, e.g. (b'12 (UID 40 BODY[] {310}', literal)
+                first_prefix, first_data = response[0]
+                first_prefix = match.group("data") + b" " + (match.group("data2") or b"")
+                response = [(first_prefix, first_data)] + response[1:]
+                self.untagged_responses.setdefault(typ, []).extend(response)
+                return typ, response
+            data = match.group("data")
+            if match.group("data2"):
+                data += b" " + match.group("data2")
+            self.untagged_responses.setdefault(typ, []).append(data)
+            return typ, data
+
+        match = UNTAGGED_PATTERN.match(head)
+        if not match:
+            return None, head
+        typ = match.group("type").decode()
+        data = match.group("data") or b""
+        if typ in ("OK", "NO", "BAD"):
+            self._store_response_code(data)
+        self.untagged_responses.setdefault(typ, []).append(data)
+        return typ, data
+
+    def _store_response_code(self, text: bytes):
+        match = RESPONSE_CODE_PATTERN.search(text or b"")
+        if match:
+            typ = match.group("type").decode()
+            self.untagged_responses.setdefault(typ, []).append(match.group("data"))
+
+
+def quote(value: str) -> str:
+    escaped = str(value).replace("\\", "\\\\").replace('"', '\\"')
+    return f'"{escaped}"'
+
+
+def encode_mailbox(name: str) -> str:
+    """``name`` in the modified UTF-7 of mailbox names (RFC 3501 section 5.1.3).
+
+    Printable ASCII is sent as is (``&`` as ``&-``); other characters are
+    UTF-16 in base64 with ``,`` for ``/``, between ``&`` and ``-``.
+    """
+    encoded, pending = [], []
+
+    def flush():
+        if pending:
+            data = base64.b64encode("".join(pending).encode("utf-16-be")).decode().rstrip("=")
+            encoded.append("&" + data.replace("/", ",") + "-")
+            pending.clear()
+
+    for char in name:
+        if " " <= char <= "~":
+            flush()
+            encoded.append("&-" if char == "&" else char)
+        else:
+            pending.append(char)
+    flush()
+    return "".join(encoded)
+
+
+def quote_mailbox(name: str) -> str:
+    """Mailbox argument for SELECT/STATUS; used by both this client and ``imap_pool``."""
+    return quote(encode_mailbox(name))
+
+
+def _with_charset(charset, criteria):
+    if charset:
+        return ("CHARSET", charset) + tuple(criteria)
+    return tuple(criteria)
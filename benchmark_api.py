@@ -0,0 +1,381 @@
+"""
+Load-test benchmark: /api/mail/messages and the admin APIs.
+
+Starts ``fake_imap_server`` (TLS through a throwaway ``openssl`` certificate
+unless --plain) and the application in-process against a temporary SQLite
+database, creates accounts through the admin API, then drives each scenario
+at the requested concurrency. Reports p50/p95/p99 latency, requests per
+second and IMAP commands per request, and writes the results as JSON so
+runs can be compared with --compare.
+
+Usage: python benchmark_api.py [--accounts 20] [--concurrency 16] [--requests 2000]
+                               [--mailbox-size 500] [--latency 0.005] [--failure-rate 0]
+                               [--idle] [--output results.json] [--compare baseline.json]
+"""
+import argparse
+import base64
+import datetime
+import functools
+import http.client
+import imaplib
+import json
+import os
+import platform
+import random
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+SCENARIOS = ("messages", "admin_list", "admin_stats", "admin_update")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--accounts", type=int, default=20, help="mail accounts created through the admin API")
+    parser.add_argument("--concurrency", type=int, default=16, help="client threads per scenario")
+    parser.add_argument("--requests", type=int, default=2000, help="requests per scenario")
+    parser.add_argument("--duration", type=float, default=0, help="seconds per scenario instead of --requests")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help=f"comma-separated subset of {SCENARIOS}")
+    parser.add_argument("--mailbox-size", type=int, default=500, help="messages generated per fake mailbox")
+    parser.add_argument("--latency", type=float, default=0.0, help="fake IMAP network round trip per command (seconds)")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="share of IMAP commands answered by a dropped connection")
+    parser.add_argument("--stall-rate", type=float, default=0.0, help="share of IMAP commands that hang for --stall-seconds")
+    parser.add_argument("--stall-seconds", type=float, default=5.0)
+    parser.add_argument("--imap-timeout", type=int, default=3, help="IMAP_TIMEOUT for the application under test")
+    parser.add_argument("--new-mail-rate", type=float, default=0.0, help="messages per second delivered during the messages scenario")
+    parser.add_argument("--idle", action="store_true", help="enable IMAP IDLE watchers")
+    parser.add_argument("--plain", action="store_true", help="plain TCP instead of TLS between the app and the fake server")
+    parser.add_argument("--log-level", default="WARNING", help="LOG_LEVEL of the application under test")
+    parser.add_argument("--output", help="write results to this JSON file")
+    parser.add_argument("--compare", help="previous results JSON to compare against")
+    parser.add_argument("--max-regression", type=float, default=0.2, help="allowed p95/throughput regression before exiting with 1")
+    return parser.parse_args()
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def percentile(values, fraction: float) -> float:
+    if not values:
+        return float("nan")
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(fraction * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+class Client:
+    """Keep-alive HTTP client for one worker thread."""
+
+    def __init__(self, port: int, auth: str):
+        self.port = port
+        self.auth = auth
+        self.conn = None
+
+    def request(self, method: str, path: str, body=None, admin: bool = False):
+        headers = {"Authorization": self.auth} if admin else {}
+        payload = None
+        if body is not None:
+            payload = json.dumps(body).encode()
+            headers["Content-Type"] = "application/json"
+        for attempt in range(2):
+            if self.conn is None:
+                self.conn = http.client.HTTPConnection("127.0.0.1", self.port, timeout=120)
+            try:
+                self.conn.request(method, path, payload, headers)
+                response = self.conn.getresponse()
+                return response.status, response.read()
+            except (http.client.HTTPException, OSError):
+                self.conn.close()
+                self.conn = None
+                if attempt:
+                    raise
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+
+
+def run_scenario(name: str, port: int, auth: str, accounts: list, args, fake, deliver=None) -> dict:
+    """Run ``name`` with ``args.concurrency`` threads and summarize the samples."""
+    lock = threading.Lock()
+    issued = [0]
+    samples = []  # (latency, ok)
+    stop = threading.Event()
+    deadline = time.perf_counter() + args.duration if args.duration else None
+
+    def next_index():
+        with lock:
+            if stop.is_set() or (deadline is None and issued[0] >= args.requests):
+                return None
+            issued[0] += 1
+            return issued[0]
+
+    def call(client: Client, index: int) -> bool:
+        account = accounts[index % len(accounts)]
+        if name == "messages":
+            status, body = client.request(
+                "GET", f"/api/mail/messages?mail_id={account['mail_id']}&token={account['access_token']}"
+            )
+            return status == 200 and isinstance(json.loads(body), list)
+        if name == "admin_list":
+            status, _ = client.request("GET", "/admin/accounts", admin=True)
+        elif name == "admin_stats":
+            status, _ = client.request("GET", "/admin/api/cache/stats", admin=True)
+        else:
+            # Same value as before, so the update exercises the write path
+            # without changing what the messages scenario fetches
+            status, _ = client.request(
+                "PUT", f"/admin/accounts/{account['id']}",
+                {"default_sender_filter": account["default_sender_filter"]}, admin=True,
+            )
+        return status == 200
+
+    def worker():
+        client = Client(port, auth)
+        local = []
+        try:
+            while True:
+                index = next_index()
+                if index is None:
+                    break
+                started = time.perf_counter()
+                try:
+                    ok = call(client, index)
+                except Exception:
+                    ok = False
+                local.append((time.perf_counter() - started, ok))
+        finally:
+            client.close()
+            with lock:
+                samples.extend(local)
+
+    def mail_feed():
+        interval = 1.0 / args.new_mail_rate
+        while not stop.wait(interval):
+            account = random.choice(accounts)
+            fake.add_message(account["email"], account["sender"], f"New message {time.time():.3f}")
+            with lock:
+                deliver[0] += 1
+
+    commands_before = fake.stats()["total_commands"]
+    threads = [threading.Thread(target=worker) for _ in range(args.concurrency)]
+    feeder = None
+    if name == "messages" and args.new_mail_rate > 0:
+        feeder = threading.Thread(target=mail_feed, daemon=True)
+        feeder.start()
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    if deadline is not None:
+        time.sleep(max(0.0, deadline - time.perf_counter()))
+        stop.set()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    stop.set()
+    if feeder is not None:
+        feeder.join()
+
+    latencies = [latency for latency, _ in samples]
+    errors = sum(1 for _, ok in samples if not ok)
+    imap_commands = fake.stats()["total_commands"] - commands_before
+    return {
+        "requests": len(samples),
+        "errors": errors,
+        "seconds": round(elapsed, 3),
+        "rps": round(len(samples) / elapsed, 1) if elapsed else 0.0,
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 2),
+        "mean_ms": round(statistics.fmean(latencies) * 1000, 2) if latencies else float("nan"),
+        "imap_commands": imap_commands,
+        "imap_commands_per_request": round(imap_commands / len(samples), 3) if samples else 0.0,
+    }
+
+
+def compare(results: dict, baseline_path: str, max_regression: float) -> bool:
+    """Print deltas against ``baseline_path``; False when a scenario regressed."""
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = json.load(f)
+    print(f"\nCompared with {baseline_path} ({baseline.get('git_commit') or 'unknown commit'}, {baseline.get('timestamp')})")
+    passed = True
+    for name, current in results["scenarios"].items():
+        previous = baseline.get("scenarios", {}).get(name)
+        if not previous:
+            continue
+        p95_change = current["p95_ms"] / previous["p95_ms"] - 1 if previous["p95_ms"] else 0.0
+        rps_change = current["rps"] / previous["rps"] - 1 if previous["rps"] else 0.0
+        regressed = p95_change > max_regression or rps_change < -max_regression
+        passed = passed and not regressed
+        print(
+            f"  {name:<14} p95 {previous['p95_ms']:8.2f} -> {current['p95_ms']:8.2f} ms ({p95_change:+.0%})  "
+            f"rps {previous['rps']:8.1f} -> {current['rps']:8.1f} ({rps_change:+.0%})"
+            f"{'  REGRESSION' if regressed else ''}"
+        )
+    return passed
+
+
+def main():
+    args = parse_args()
+    scenarios = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        sys.exit(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+
+    workdir = tempfile.mkdtemp(prefix="recv-vcode-bench-")
+    # The application reads its settings at import time
+    os.environ.update({
+        "DATABASE_URL": f"sqlite:///{os.path.join(workdir, 'bench.db')}",
+        "ASYNC_DATABASE_URL": "",
+        "IMAP_TIMEOUT": str(args.imap_timeout),
+        "IDLE_WATCHERS_ENABLED": "true" if args.idle else "false",
+        "LOG_LEVEL": args.log_level,
+        "ADMIN_USERNAME": "bench",
+        "ADMIN_PASSWORD": "bench",
+    })
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import uvicorn
+
+    import fake_imap_server
+    import idle_watcher
+    import imap_pool
+    import main as app_main
+    from aioimap import AsyncImapClient
+
+    certfile = keyfile = None
+    if not args.plain:
+        if shutil.which("openssl") is None:
+            sys.exit("openssl is needed for the TLS fake server; install it or pass --plain")
+        certfile, keyfile = fake_imap_server.generate_self_signed_cert(workdir)
+    fake = fake_imap_server.FakeImapServer(
+        mailbox_size=args.mailbox_size,
+        latency=args.latency,
+        failure_rate=args.failure_rate,
+        stall_rate=args.stall_rate,
+        stall_seconds=args.stall_seconds,
+        certfile=certfile,
+        keyfile=keyfile,
+    ).start()
+
+    if args.plain:
+        def connect(account, timeout):
+            conn = imaplib.IMAP4(account.imap_server, fake.port, timeout=timeout)
+            conn.login(account.email, account.password)
+            return conn
+
+        async def connect_async(account, timeout):
+            client = AsyncImapClient(account.imap_server, fake.port, use_ssl=False, timeout=timeout)
+            await client.connect()
+            await client.login(account.email, account.password)
+            return client
+    else:
+        context = fake_imap_server.client_ssl_context()
+        connect = functools.partial(imap_pool.open_connection, port=fake.port, ssl_context=context)
+        connect_async = functools.partial(imap_pool.open_async_connection, port=fake.port, ssl_context=context)
+    imap_pool.pool._connect = connect
+    imap_pool.async_pool._connect = connect_async
+    idle_watcher.manager.connect = connect_async
+
+    port = free_port()
+    server = uvicorn.Server(uvicorn.Config(app_main.app, host="127.0.0.1", port=port, log_level="warning", access_log=False))
+    server_thread = threading.Thread(target=server.run, daemon=True)
+    server_thread.start()
+    while not server.started:
+        time.sleep(0.05)
+
+    auth = "Basic " + base64.b64encode(b"bench:bench").decode()
+    setup = Client(port, auth)
+    accounts = []
+    for index in range(args.accounts):
+        sender = fake.senders[index % len(fake.senders)]
+        status, body = setup.request("POST", "/admin/accounts", {
+            "email": f"user{index}@bench.test",
+            "password": "secret",
+            "imap_server": "127.0.0.1",
+            "default_sender_filter": sender,
+        }, admin=True)
+        if status != 200:
+            sys.exit(f"Creating account {index} failed: {status} {body[:200]!r}")
+        account = json.loads(body)
+        account["sender"] = sender
+        accounts.append(account)
+
+    # First fetch of every account is a full sync; report it separately
+    commands_before = fake.stats()["total_commands"]
+    cold = []
+    for account in accounts:
+        started = time.perf_counter()
+        setup.request("GET", f"/api/mail/messages?mail_id={account['mail_id']}&token={account['access_token']}")
+        cold.append(time.perf_counter() - started)
+    setup.close()
+    cold_commands = fake.stats()["total_commands"] - commands_before
+
+    print(
+        f"{args.accounts} accounts, {args.mailbox_size} messages each, concurrency {args.concurrency}, "
+        f"{'TLS' if not args.plain else 'plain'} fake IMAP on :{fake.port}, latency {args.latency * 1000:.1f} ms, "
+        f"failure rate {args.failure_rate:.1%}, IDLE {'on' if args.idle else 'off'}"
+    )
+    print(
+        f"cold sync      p50 {percentile(cold, 0.5) * 1000:8.2f} ms  p95 {percentile(cold, 0.95) * 1000:8.2f} ms  "
+        f"imap cmds/req {cold_commands / len(cold):6.2f}" if cold else "cold sync      skipped"
+    )
+
+    delivered = [0]
+    results = {
+        "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+        "git_commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "options": vars(args),
+        "cold_sync": {
+            "requests": len(cold),
+            "p50_ms": round(percentile(cold, 0.5) * 1000, 2),
+            "p95_ms": round(percentile(cold, 0.95) * 1000, 2),
+            "imap_commands_per_request": round(cold_commands / len(cold), 3) if cold else 0.0,
+        },
+        "scenarios": {},
+    }
+    for name in scenarios:
+        summary = run_scenario(name, port, auth, accounts, args, fake, delivered)
+        results["scenarios"][name] = summary
+        print(
+            f"{name:<14} {summary['requests']:6d} req  {summary['rps']:8.1f} req/s  "
+            f"p50 {summary['p50_ms']:8.2f}  p95 {summary['p95_ms']:8.2f}  p99 {summary['p99_ms']:8.2f} ms  "
+            f"errors {summary['errors']:4d}  imap cmds/req {summary['imap_commands_per_request']:6.2f}"
+        )
+    results["new_messages_delivered"] = delivered[0]
+    results["fake_imap"] = fake.stats()
+
+    server.should_exit = True
+    server_thread.join(timeout=10)
+    fake.stop()
+    shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2, ensure_ascii=False)
+        print(f"Results written to {args.output}")
+    if args.compare and not compare(results, args.compare, args.max_regression):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""
+Micro-benchmark: verification code extraction.
+
+Compares the BeautifulSoup path used by ``imap_client.get_email_content``
+(full RFC822 message, soup over every HTML part) with the partial-body path
+used by the API (first CODE_FETCH_BYTES of the body, streaming stripper,
+precompiled patterns).
+
+Usage: python benchmark_code_extraction.py [iterations]
+"""
+import base64
+import email
+import re
+import sys
+import timeit
+
+from bs4 import BeautifulSoup
+
+import code_extractor
+import config
+
+HTML_BODY = (
+    "<html><head><style>"
+    + ".c{font-family:Arial;color:#333;padding:4px}" * 40
+    + "</style><title>Account security</title></head><body><table>"
+    + "<tr><td class='c'>Hi there,</td></tr>"
+    + "<tr><td class='c'>您的验证码是：<b>482913</b>，10 分钟内有效。</td></tr>"
+    + "".join(f"<tr><td class='c'><a href='https://example.com/p/{i}'>Offer {i}</a> &nbsp;&middot; details</td></tr>" for i in range(600))
+    + "</table></body></html>"
+)
+
+
+def build_message() -> bytes:
+    encoded = base64.encodebytes(HTML_BODY.encode()).decode().replace("\n", "\r\n")
+    return (
+        "From: Example <noreply@example.com>\r\n"
+        "Subject: Sign-in verification\r\n"
+        "Date: Sat, 17 Oct 2026 10:00:00 +0000\r\n"
+        "MIME-Version: 1.0\r\n"
+        'Content-Type: multipart/alternative; boundary="b1"\r\n\r\n'
+        "--b1\r\nContent-Type: text/html; charset=utf-8\r\nContent-Transfer-Encoding: base64\r\n\r\n"
+        f"{encoded}\r\n--b1--\r\n"
+    ).encode()
+
+
+def soup_path(raw: bytes):
+    msg = email.message_from_bytes(raw)
+    body = ""
+    for part in msg.walk():
+        payload = part.get_payload(decode=True)
+        if not payload:
+            continue
+        if part.get_content_type() == "text/html":
+            body += BeautifulSoup(payload.decode(), "html.parser").get_text()
+        elif part.get_content_type() == "text/plain":
+            body += payload.decode()
+    for pattern in code_extractor.DEFAULT_CODE_PATTERNS:
+        match = re.search(pattern, body, re.IGNORECASE)
+        if match:
+            return match.group(1)
+    return None
+
+
+def partial_path(header: bytes, body: bytes):
+    text = code_extractor.message_text(header, body[: config.CODE_FETCH_BYTES])
+    return code_extractor.extractor.extract("noreply@example.com", "Sign-in verification", text)
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    raw = build_message()
+    header, body = raw.split(b"\r\n\r\n", 1)
+    header = b"\r\n".join(line for line in header.split(b"\r\n") if line.lower().startswith(b"content-")) + b"\r\n\r\n"
+
+    print(f"Message size: {len(raw)} bytes, partial fetch: {config.CODE_FETCH_BYTES} bytes, iterations: {iterations}")
+    print(f"Codes: soup={soup_path(raw)!r}, partial={partial_path(header, body)!r}")
+
+    results = {
+        "BeautifulSoup (RFC822)": timeit.timeit(lambda: soup_path(raw), number=iterations),
+        "Streaming stripper (partial)": timeit.timeit(lambda: partial_path(header, body), number=iterations),
+        "HTML->text only, BeautifulSoup": timeit.timeit(
+            lambda: BeautifulSoup(HTML_BODY, "html.parser").get_text(), number=iterations
+        ),
+        "HTML->text only, stripper": timeit.timeit(lambda: code_extractor.html_to_text(HTML_BODY), number=iterations),
+    }
+    for name, total in results.items():
+        print(f"{name:<32} {total / iterations * 1000:8.3f} ms/message")
+    baseline = results["BeautifulSoup (RFC822)"]
+    print(f"Speedup: {baseline / results['Streaming stripper (partial)']:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+"""
+Concurrency benchmark: mail cache reads vs. writes on SQLite.
+
+Runs reader threads (``mail_service.load_cached_result``, what every poll
+does) alongside writer threads (``crud.save_mailbox_cache``, what every new
+message does) against a temporary database, once with SQLite's default
+rollback journal and once with the WAL settings from ``database.py``.
+
+Usage: python benchmark_database.py [seconds] [readers] [writers]
+"""
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+
+import config
+import crud
+import mail_service
+import models
+
+ACCOUNTS = 50
+WINDOW = 5
+
+MODES = {
+    "rollback journal (default)": {"journal_mode": "DELETE", "synchronous": "FULL", "busy_timeout": 5000},
+    "WAL (database.py)": {
+        "journal_mode": config.SQLITE_JOURNAL_MODE,
+        "synchronous": config.SQLITE_SYNCHRONOUS,
+        "busy_timeout": config.SQLITE_BUSY_TIMEOUT,
+        "cache_size": config.SQLITE_CACHE_SIZE,
+    },
+}
+
+
+def make_engine(path: str, pragmas: dict):
+    engine = create_engine(
+        f"sqlite:///{path}",
+        connect_args={"check_same_thread": False},
+        pool_size=config.DB_POOL_SIZE,
+        max_overflow=config.DB_MAX_OVERFLOW,
+    )
+
+    @event.listens_for(engine, "connect")
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+        cursor.close()
+
+    return engine
+
+
+def message(uid: int) -> dict:
+    return {"uid": uid, "subject": f"Subject {uid}", "sender": "noreply@example.com", "date": "", "code": "123456"}
+
+
+def seed(Session):
+    db = Session()
+    try:
+        for account_id in range(1, ACCOUNTS + 1):
+            crud.save_mailbox_cache(db, account_id, '["noreply@example.com"]', 1, WINDOW,
+                                    [message(uid) for uid in range(WINDOW, 0, -1)])
+    finally:
+        db.close()
+
+
+def run_mode(pragmas: dict, seconds: float, readers: int, writers: int) -> dict:
+    with tempfile.TemporaryDirectory() as directory:
+        engine = make_engine(os.path.join(directory, "bench.db"), pragmas)
+        models.Base.metadata.create_all(bind=engine)
+        Session = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+        seed(Session)
+
+        stop = threading.Event()
+        read_latencies, write_latencies, errors = [], [], []
+        next_uid = [WINDOW]
+        uid_lock = threading.Lock()
+
+        def reader(index: int):
+            db = Session()
+            account_id = index % ACCOUNTS + 1
+            try:
+                while not stop.is_set():
+                    started = time.perf_counter()
+                    try:
+                        mail_service.load_cached_result(db, account_id, WINDOW)
+                        db.rollback()
+                    except Exception as e:
+                        errors.append(str(e))
+                        db.rollback()
+                        continue
+                    read_latencies.append(time.perf_counter() - started)
+                    account_id = account_id % ACCOUNTS + 1
+            finally:
+                db.close()
+
+        def writer(index: int):
+            db = Session()
+            account_id = index % ACCOUNTS + 1
+            try:
+                while not stop.is_set():
+                    with uid_lock:
+                        next_uid[0] += 1
+                        uid = next_uid[0]
+                    started = time.perf_counter()
+                    try:
+                        crud.save_mailbox_cache(db, account_id, '["noreply@example.com"]', 1, uid,
+                                                [message(u) for u in range(uid, uid - WINDOW, -1)])
+                    except Exception as e:
+                        errors.append(str(e))
+                        db.rollback()
+                        continue
+                    write_latencies.append(time.perf_counter() - started)
+                    account_id = account_id % ACCOUNTS + 1
+            finally:
+                db.close()
+
+        threads = [threading.Thread(target=reader, args=(i,)) for i in range(readers)]
+        threads += [threading.Thread(target=writer, args=(i,)) for i in range(writers)]
+        for thread in threads:
+            thread.start()
+        time.sleep(seconds)
+        stop.set()
+        for thread in threads:
+            thread.join()
+        engine.dispose()
+
+    def p95(values):
+        return statistics.quantiles(values, n=20)[-1] * 1000 if len(values) >= 20 else float("nan")
+
+    return {
+        "reads_per_s": len(read_latencies) / seconds,
+        "writes_per_s": len(write_latencies) / seconds,
+        "read_p95_ms": p95(read_latencies),
+        "write_p95_ms": p95(write_latencies),
+        "errors": len(errors),
+    }
+
+
+def main():
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 5
+    readers = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+    writers = int(sys.argv[3]) if len(sys.argv) > 3 else 4
+    print(f"{readers} reader / {writers} writer threads, {seconds:.0f}s per mode, {ACCOUNTS} accounts")
+    for name, pragmas in MODES.items():
+        result = run_mode(pragmas, seconds, readers, writers)
+        print(
+            f"{name:<28} reads/s {result['reads_per_s']:8.0f}  read p95 {result['read_p95_ms']:7.2f} ms  "
+            f"writes/s {result['writes_per_s']:7.0f}  write p95 {result['write_p95_ms']:7.2f} ms  "
+            f"errors {result['errors']}"
+        )
+
+
+if __name__ == "__main__":
+    main()
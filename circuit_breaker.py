@@ -0,0 +1,232 @@
+"""
+IMAP Host Circuit Breaker
+Tracks connection errors and timeouts per IMAP host so that requests for a
+provider that is down fail fast instead of each waiting the full
+IMAP_TIMEOUT, and remembers rejected credentials per account so a bad
+password does not hammer the provider with LOGIN attempts.
+"""
+import contextvars
+import logging
+import threading
+import time
+from collections import deque
+
+import config as app_config
+
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+# Half-open probes granted to the current request, by host: only the
+# outcome of its own probe may close or reopen a half-open circuit
+_probes: contextvars.ContextVar = contextvars.ContextVar("circuit_probes", default={})
+
+
+class HostCircuit:
+    """Closed/open/half-open state of one IMAP host.
+
+    Outcomes are kept for a sliding window; the circuit opens when at least
+    ``min_requests`` calls in the window failed at ``failure_rate`` or more.
+    After ``open_seconds`` a single probe is let through (half-open): its
+    success closes the circuit, its failure opens it again. Outcomes of other
+    calls, such as ones started before the circuit opened, are ignored while
+    half-open; a probe that never reports back is replaced after
+    ``open_seconds``.
+    """
+
+    def __init__(self, host: str, failure_rate: float, min_requests: int, window: float, open_seconds: float):
+        self.host = host
+        self.failure_rate = failure_rate
+        self.min_requests = min_requests
+        self.window = window
+        self.open_seconds = open_seconds
+        self.state = CLOSED
+        self.opened_at = 0.0
+        self.probe = None  # id of the outstanding half-open probe
+        self.probe_started = 0.0
+        self.probes = 0
+        self.rejected = 0
+        self._outcomes = deque()  # (timestamp, ok)
+
+    def allow(self, now: float) -> bool:
+        if self.state == OPEN:
+            if now - self.opened_at < self.open_seconds:
+                self.rejected += 1
+                return False
+            self.state = HALF_OPEN
+            self.probe = None
+            logger.info("[CIRCUIT] %s half-open, probing", self.host)
+        if self.state == HALF_OPEN:
+            if self.probe is not None and now - self.probe_started < self.open_seconds:
+                self.rejected += 1
+                return False
+            self.probes += 1
+            self.probe = self.probes
+            self.probe_started = now
+        return True
+
+    def record(self, ok: bool, now: float, probe: int = None):
+        """Count the outcome of a call; ``probe`` is the probe id it held, if any."""
+        if self.state == HALF_OPEN:
+            if probe is None or probe != self.probe:
+                return
+            self.probe = None
+            if ok:
+                self.state = CLOSED
+                self._outcomes.clear()
+                logger.info("[CIRCUIT] %s recovered, circuit closed", self.host)
+            else:
+                self._open(now)
+            return
+
+        self._outcomes.append((now, ok))
+        while self._outcomes and now - self._outcomes[0][0] > self.window:
+            self._outcomes.popleft()
+        if ok or self.state == OPEN:
+            return
+        failures = sum(1 for _, succeeded in self._outcomes if not succeeded)
+        if len(self._outcomes) >= self.min_requests and failures / len(self._outcomes) >= self.failure_rate:
+            self._open(now)
+
+    def retry_after(self, now: float) -> float:
+        if self.state != OPEN:
+            return 0.0
+        return max(0.0, self.open_seconds - (now - self.opened_at))
+
+    def stats(self, now: float) -> dict:
+        failures = sum(1 for _, ok in self._outcomes if not ok)
+        return {
+            "state": self.state,
+            "requests": len(self._outcomes),
+            "failures": failures,
+            "rejected": self.rejected,
+            "retry_after": round(self.retry_after(now), 1),
+        }
+
+    def _open(self, now: float):
+        self.state = OPEN
+        self.opened_at = now
+        self._outcomes.clear()
+        logger.warning("[CIRCUIT] %s failing, circuit open for %.0fs", self.host, self.open_seconds)
+
+
+class CircuitBreaker:
+    """Registry of :class:`HostCircuit` objects keyed by IMAP host."""
+
+    def __init__(
+        self,
+        enabled: bool = None,
+        failure_rate: float = None,
+        min_requests: int = None,
+        window: float = None,
+        open_seconds: float = None,
+    ):
+        self.enabled = app_config.CIRCUIT_BREAKER_ENABLED if enabled is None else enabled
+        self.failure_rate = app_config.CIRCUIT_FAILURE_RATE if failure_rate is None else failure_rate
+        self.min_requests = app_config.CIRCUIT_MIN_REQUESTS if min_requests is None else min_requests
+        self.window = app_config.CIRCUIT_WINDOW if window is None else window
+        self.open_seconds = app_config.CIRCUIT_OPEN_SECONDS if open_seconds is None else open_seconds
+        self._lock = threading.Lock()
+        self._circuits = {}
+
+    def allow(self, host: str) -> bool:
+        """Whether a connection to ``host`` may be attempted now."""
+        if not self.enabled:
+            return True
+        with self._lock:
+            circuit = self._circuit(host)
+            if not circuit.allow(time.monotonic()):
+                return False
+            if circuit.state == HALF_OPEN:
+                # The call let through a half-open circuit is its probe
+                _probes.set({**_probes.get(), circuit.host: circuit.probe})
+            return True
+
+    def record_success(self, host: str):
+        self._record(host, True)
+
+    def record_failure(self, host: str):
+        self._record(host, False)
+
+    def retry_after(self, host: str) -> float:
+        with self._lock:
+            circuit = self._circuits.get(self._key(host))
+            return circuit.retry_after(time.monotonic()) if circuit else 0.0
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        with self._lock:
+            return {host: circuit.stats(now) for host, circuit in self._circuits.items()}
+
+    def reset(self):
+        with self._lock:
+            self._circuits.clear()
+
+    def _record(self, host: str, ok: bool):
+        if not self.enabled:
+            return
+        key = self._key(host)
+        probes = _probes.get()
+        if key in probes:
+            _probes.set({k: v for k, v in probes.items() if k != key})
+        with self._lock:
+            self._circuit(host).record(ok, time.monotonic(), probes.get(key))
+
+    @staticmethod
+    def _key(host: str) -> str:
+        return (host or "").strip().lower()
+
+    def _circuit(self, host: str) -> HostCircuit:
+        key = self._key(host)
+        circuit = self._circuits.get(key)
+        if circuit is None:
+            circuit = self._circuits[key] = HostCircuit(
+                key, self.failure_rate, self.min_requests, self.window, self.open_seconds
+            )
+        return circuit
+
+
+class AuthFailureCache:
+    """Negative cache of accounts whose credentials the server rejected.
+
+    Entries are keyed by the pool's account key and credential generation,
+    so editing an account in the admin backend clears its entry implicitly.
+    """
+
+    def __init__(self, ttl: float = None):
+        self.ttl = app_config.AUTH_FAILURE_TTL if ttl is None else ttl
+        self._lock = threading.Lock()
+        self._entries = {}  # (account key, generation) -> (message, expires_at)
+
+    def get(self, key):
+        """Cached rejection message for ``key``, or ``None``."""
+        if self.ttl <= 0:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            message, expires_at = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                return None
+            return message
+
+    def put(self, key, message: str):
+        if self.ttl <= 0:
+            return
+        now = time.monotonic()
+        with self._lock:
+            self._entries = {k: v for k, v in self._entries.items() if v[1] > now}
+            self._entries[key] = (message, now + self.ttl)
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        with self._lock:
+            return {"entries": sum(1 for _, expires_at in self._entries.values() if expires_at > now), "ttl": self.ttl}
+
+
+breaker = CircuitBreaker()
+auth_failures = AuthFailureCache()
@@ -0,0 +1,226 @@
+"""
+Verification Code Extraction
+Turns the partial body fetched with the message headers into plain text and
+runs precompiled code patterns over it. HTML is stripped with a small
+incremental tokenizer instead of building a BeautifulSoup tree, since the
+body is only scanned once for a short code.
+"""
+import base64
+import binascii
+import email
+import email.utils
+import html
+import json
+import logging
+import re
+from typing import Dict, List, Optional
+
+import config as app_config
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CODE_PATTERNS = [
+    # A keyword followed by the code, e.g. "验证码：123456", "Your code is AB12CD"
+    r"(?<![A-Z])(?:验证码|校验码|动态码|确认码|驗證碼|code|otp|passcode|pin)\W{0,3}(?:(?:is|为|是)\W{0,3})?"
+    r"(?<![A-Z0-9])((?=[A-Z]*\d)[A-Z0-9]{4,8})(?![A-Z0-9])",
+    # Any standalone 6-digit number that is not part of a date, time or phone number
+    r"(?<![\d.:/+-])(\d{6})(?![\d.:/-])",
+]
+
+SKIPPED_TAGS = {"script", "style", "head", "title", "noscript"}
+BREAK_TAGS = {"br", "p", "div", "tr", "li", "table", "h1", "h2", "h3", "h4", "h5", "h6", "section", "td", "th"}
+TAG_PATTERN = re.compile(r"<(/?)([A-Za-z][A-Za-z0-9]*)\b(?:[^>\"']|\"[^\"]*\"|'[^']*')*>|<!--.*?-->|<![^>]*>|<\?[^>]*>", re.S)
+SPACE_PATTERN = re.compile(r"[ \t\r\f\v\xa0]+")
+
+
+class HtmlTextStripper:
+    """Incremental HTML-to-text conversion without building a document tree.
+
+    Markup may be fed in arbitrary chunks; an unterminated tag at the end of
+    a chunk is kept until the next one. A tag left open when :meth:`close`
+    is called (e.g. because the body was fetched partially) is dropped.
+    """
+
+    def __init__(self):
+        self._pending = ""
+        self._skipping: Optional[str] = None
+        self._parts: List[str] = []
+
+    def feed(self, chunk: str):
+        data = self._pending + chunk
+        pos = 0
+        while True:
+            start = data.find("<", pos)
+            if start == -1:
+                self._text(data[pos:])
+                self._pending = ""
+                return
+            self._text(data[pos:start])
+            match = TAG_PATTERN.match(data, start)
+            if match is None:
+                if self._may_be_incomplete(data, start):
+                    self._pending = data[start:]
+                    return
+                self._text("<")
+                pos = start + 1
+                continue
+            self._tag(match)
+            pos = match.end()
+
+    def close(self) -> str:
+        self._pending = ""
+        text = html.unescape("".join(self._parts))
+        lines = (SPACE_PATTERN.sub(" ", line).strip() for line in text.split("\n"))
+        return "\n".join(line for line in lines if line)
+
+    @staticmethod
+    def _may_be_incomplete(data: str, start: int) -> bool:
+        if data.startswith("<!--", start):
+            return data.find("-->", start) == -1
+        return data.find(">", start) == -1 and len(data) - start < 4096
+
+    def _text(self, text: str):
+        if text and self._skipping is None:
+            self._parts.append(text)
+
+    def _tag(self, match):
+        name = (match.group(2) or "").lower()
+        if not name:
+            return
+        closing = bool(match.group(1))
+        if self._skipping is not None:
+            if closing and name == self._skipping:
+                self._skipping = None
+            return
+        if name in SKIPPED_TAGS and not closing and not match.group(0).endswith("/>"):
+            self._skipping = name
+        elif name in BREAK_TAGS:
+            self._parts.append("\n" if name not in ("td", "th") else " ")
+
+
+def html_to_text(markup: str) -> str:
+    stripper = HtmlTextStripper()
+    stripper.feed(markup)
+    return stripper.close()
+
+
+def _decode_part(part) -> str:
+    encoding = part.get("Content-Transfer-Encoding", "").strip().lower()
+    payload = part.get_payload(decode=False)
+    if isinstance(payload, list):
+        return ""
+    if encoding == "base64":
+        # The fetch may cut the body mid-quantum; decode only whole quanta
+        compact = re.sub(rb"[^A-Za-z0-9+/=]", b"", payload.encode("ascii", "ignore"))
+        compact = compact[: len(compact) - len(compact) % 4]
+        try:
+            data = base64.b64decode(compact)
+        except (binascii.Error, ValueError):
+            return ""
+    else:
+        # get_payload() already decodes 8bit text with the charset; decode=True
+        # returns the raw bytes (or unquotes quoted-printable) instead
+        data = part.get_payload(decode=True) or b""
+
+    charset = part.get_content_charset() or "utf-8"
+    try:
+        return data.decode(charset, errors="replace")
+    except LookupError:
+        return data.decode("utf-8", errors="replace")
+
+
+def message_text(header: bytes, body: bytes) -> str:
+    """Plain text of a message from its content headers and a (partial) body.
+
+    ``header`` must contain the Content-Type and Content-Transfer-Encoding
+    fields. ``text/plain`` parts are preferred; HTML is only stripped when
+    the message has no plain-text part.
+    """
+    if not body:
+        return ""
+    msg = email.message_from_bytes(header.rstrip(b"\r\n") + b"\r\n\r\n" + body)
+    plain, rich = [], []
+    for part in msg.walk():
+        if part.is_multipart() or part.get_content_maintype() != "text":
+            continue
+        if "attachment" in str(part.get("Content-Disposition", "")).lower():
+            continue
+        if part.get_content_subtype() == "html":
+            rich.append(part)
+        else:
+            plain.append(part)
+    if plain:
+        return "\n".join(_decode_part(part) for part in plain)
+    return "\n".join(html_to_text(_decode_part(part)) for part in rich)
+
+
+def _compile(patterns, source: str) -> List[re.Pattern]:
+    compiled = []
+    for pattern in patterns:
+        try:
+            compiled.append(re.compile(pattern, re.IGNORECASE))
+        except re.error as e:
+            logger.warning("[CODE] Ignoring invalid pattern from %s %r: %s", source, pattern, e)
+    return compiled
+
+
+def _load_json(raw: str, source: str, expected: type):
+    if not raw:
+        return None
+    try:
+        value = json.loads(raw)
+    except ValueError as e:
+        logger.warning("[CODE] Ignoring %s, not valid JSON: %s", source, e)
+        return None
+    if not isinstance(value, expected):
+        logger.warning("[CODE] Ignoring %s, expected a JSON %s", source, expected.__name__)
+        return None
+    return value
+
+
+class CodeExtractor:
+    """Finds a verification code with patterns precompiled per sender.
+
+    ``sender_patterns`` maps a sender address, ``@domain`` or ``domain`` to
+    one pattern or a list of patterns. They are tried before the default
+    patterns. The first capture group is the code (the whole match when the
+    pattern has no group).
+    """
+
+    def __init__(self, patterns: List[str] = None, sender_patterns: Dict[str, object] = None):
+        self.default_patterns = _compile(patterns or DEFAULT_CODE_PATTERNS, "CODE_PATTERNS")
+        self.sender_patterns: Dict[str, List[re.Pattern]] = {}
+        for sender, values in (sender_patterns or {}).items():
+            if isinstance(values, str):
+                values = [values]
+            self.sender_patterns[sender.strip().lower()] = _compile(values, f"CODE_SENDER_PATTERNS[{sender}]")
+
+    @classmethod
+    def from_config(cls) -> "CodeExtractor":
+        return cls(
+            patterns=_load_json(app_config.CODE_PATTERNS, "CODE_PATTERNS", list),
+            sender_patterns=_load_json(app_config.CODE_SENDER_PATTERNS, "CODE_SENDER_PATTERNS", dict),
+        )
+
+    def patterns_for(self, sender: str) -> List[re.Pattern]:
+        address = email.utils.parseaddr(sender or "")[1].lower()
+        domain = address.rpartition("@")[2]
+        specific = (
+            self.sender_patterns.get(address)
+            or self.sender_patterns.get(f"@{domain}")
+            or self.sender_patterns.get(domain)
+            or []
+        )
+        return specific + self.default_patterns
+
+    def extract(self, sender: str, *texts: str) -> Optional[str]:
+        patterns = self.patterns_for(sender)
+        for pattern in patterns:
+            for text in texts:
+                match = pattern.search(text) if text else None
+                if match:
+                    return match.group(1) if pattern.groups else match.group(0)
+        return None
+
+
+extractor = CodeExtractor.from_config()
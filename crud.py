@@ -1,5 +1,8 @@
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy import and_, or_, select
 from sqlalchemy.orm import Session
 import models, schemas
+import imap_pool
 
 import uuid
 import secrets
@@ -8,12 +11,61 @@ import shortuuid
 def get_email_account(db: Session, mail_id: str):
     return db.query(models.EmailAccount).filter(models.EmailAccount.mail_id == mail_id).first()
 
+def get_email_accounts_by_mail_ids(db: Session, mail_ids):
+    return db.query(models.EmailAccount).filter(models.EmailAccount.mail_id.in_(list(mail_ids))).all()
+
 def get_email_account_by_email(db: Session, email: str):
     return db.query(models.EmailAccount).filter(models.EmailAccount.email == email).first()
 
 def get_email_accounts(db: Session, skip: int = 0, limit: int = 100):
     return db.query(models.EmailAccount).offset(skip).limit(limit).all()
 
+ACCOUNT_LIST_FIELDS = ("id", "mail_id", "email", "imap_server", "default_sender_filter", "folders")
+ACCOUNT_SECRET_FIELDS = ("password", "access_token")
+
+def _prefix_match(column, prefix: str):
+    # A range instead of LIKE 'x%' so the column index is used on every backend
+    return and_(column >= prefix, column < prefix + "\U0010ffff")
+
+def list_email_accounts(
+    db: Session,
+    after_id: int = None,
+    limit: int = 50,
+    email: str = None,
+    mail_id: str = None,
+    imap_server: str = None,
+    sender: str = None,
+    q: str = None,
+    include_secrets: bool = False,
+):
+    """One keyset page of accounts ordered by id: ``(rows, next_cursor)``.
+
+    ``email`` and ``mail_id`` are prefix filters and ``imap_server`` an exact
+    match, all served by indexes; ``sender`` and ``q`` are substring searches.
+    """
+    table = models.EmailAccount.__table__
+    fields = ACCOUNT_LIST_FIELDS + (ACCOUNT_SECRET_FIELDS if include_secrets else ())
+    query = select(*[table.c[name] for name in fields])
+    if after_id is not None:
+        query = query.where(table.c.id > after_id)
+    if email:
+        query = query.where(_prefix_match(table.c.email, email))
+    if mail_id:
+        query = query.where(_prefix_match(table.c.mail_id, mail_id))
+    if imap_server:
+        query = query.where(table.c.imap_server == imap_server)
+    if sender:
+        query = query.where(table.c.default_sender_filter.contains(sender, autoescape=True))
+    if q:
+        query = query.where(or_(
+            table.c.email.contains(q, autoescape=True),
+            table.c.mail_id.contains(q, autoescape=True),
+        ))
+    # One extra row tells whether another page exists
+    rows = [dict(row._mapping) for row in db.execute(query.order_by(table.c.id).limit(limit + 1))]
+    next_cursor = rows[limit - 1]["id"] if len(rows) > limit else None
+    return rows[:limit], next_cursor
+
 def create_email_account(db: Session, account: schemas.EmailAccountCreate):
     account_data = account.dict()
     if not account_data.get("mail_id"):
@@ -32,46 +84,143 @@ def update_email_account(db: Session, account_id: int, account_update: schemas.E
     if not db_account:
         return None
     
+    previous_key = (db_account.email, db_account.imap_server)
     update_data = account_update.dict(exclude_unset=True)
     for key, value in update_data.items():
         setattr(db_account, key, value)
     
     db.commit()
     db.refresh(db_account)
+
+    # Pooled IMAP sessions are logged in with the old credentials
+    if update_data.keys() & {"email", "password", "imap_server"}:
+        imap_pool.invalidate(*previous_key)
     return db_account
 
 def delete_email_account(db: Session, account_id: int):
     db_account = db.query(models.EmailAccount).filter(models.EmailAccount.id == account_id).first()
     if db_account:
+        account_key = (db_account.email, db_account.imap_server)
+        delete_mailbox_cache(db, account_id)
         db.delete(db_account)
         db.commit()
+        imap_pool.invalidate(*account_key)
         return True
     return False
 
 
-def get_email_cache(db: Session, account_id: int):
-    return db.query(models.EmailCache).filter(models.EmailCache.account_id == account_id).first()
+def list_email_caches(db: Session):
+    return db.query(models.EmailCache).all()
+
+
+def delete_email_cache(db: Session, cache_entry: models.EmailCache):
+    db.delete(cache_entry)
+    db.commit()
+
+
+def get_mailbox_sync_state(db: Session, account_id: int, folder: str = imap_pool.DEFAULT_MAILBOX):
+    return (
+        db.query(models.MailboxSyncState)
+        .filter(models.MailboxSyncState.account_id == account_id, models.MailboxSyncState.folder == folder)
+        .first()
+    )
+
+
+def get_cached_messages(db: Session, account_id: int, limit: int = None, folder: str = imap_pool.DEFAULT_MAILBOX):
+    query = (
+        db.query(models.CachedMessage)
+        .filter(models.CachedMessage.account_id == account_id, models.CachedMessage.folder == folder)
+        .order_by(models.CachedMessage.uid.desc())
+    )
+    if limit:
+        query = query.limit(limit)
+    return query.all()
 
 
-def upsert_email_cache(
+def save_mailbox_cache(
     db: Session,
     account_id: int,
-    serialized_ids: str,
-    serialized_payload: str,
+    serialized_filters: str,
+    uidvalidity: int,
+    last_uid: int,
+    messages: list,
+    folder: str = imap_pool.DEFAULT_MAILBOX,
+    uidnext: int = None,
+    message_count: int = None,
+    search_limit: int = None,
+    highestmodseq: int = None,
 ):
-    cache_entry = get_email_cache(db, account_id)
-
-    if cache_entry:
-        cache_entry.message_ids = serialized_ids
-        cache_entry.payload = serialized_payload
-    else:
-        cache_entry = models.EmailCache(
-            account_id=account_id,
-            message_ids=serialized_ids,
-            payload=serialized_payload,
-        )
-        db.add(cache_entry)
+    """Store the sync state and cached window of one folder of an account.
+
+    ``messages`` are dicts with the ``CachedMessage`` columns. Messages
+    already cached are left untouched, new ones are inserted and cached
+    messages missing from ``messages`` (expunged or pushed out of the
+    window) are deleted.
+    """
+    args = (
+        db, account_id, serialized_filters, uidvalidity, last_uid, messages,
+        folder, uidnext, message_count, search_limit, highestmodseq,
+    )
+    try:
+        return _save_mailbox_cache(*args)
+    except IntegrityError:
+        # Another writer (e.g. an IDLE watcher) inserted the same rows first
+        db.rollback()
+        return _save_mailbox_cache(*args)
+
+
+def _save_mailbox_cache(
+    db, account_id, serialized_filters, uidvalidity, last_uid, messages, folder, uidnext, message_count, search_limit,
+    highestmodseq,
+):
+    state = get_mailbox_sync_state(db, account_id, folder)
+    cached_messages = db.query(models.CachedMessage).filter(
+        models.CachedMessage.account_id == account_id, models.CachedMessage.folder == folder
+    )
+    if state is None:
+        state = models.MailboxSyncState(account_id=account_id, folder=folder)
+        db.add(state)
+    elif state.uidvalidity != uidvalidity:
+        # UIDs from another UIDVALIDITY may refer to different messages
+        cached_messages.delete(synchronize_session=False)
+
+    state.filters = serialized_filters
+    state.uidvalidity = uidvalidity
+    state.last_uid = last_uid
+    state.uidnext = uidnext
+    state.message_count = message_count
+    state.search_limit = search_limit
+    state.highestmodseq = highestmodseq
+
+    keep_uids = {message["uid"] for message in messages}
+    existing_uids = {uid for (uid,) in cached_messages.with_entities(models.CachedMessage.uid)}
+    stale_uids = existing_uids - keep_uids
+    if stale_uids:
+        cached_messages.filter(models.CachedMessage.uid.in_(stale_uids)).delete(synchronize_session=False)
+    db.add_all(
+        models.CachedMessage(account_id=account_id, folder=folder, **message)
+        for message in messages
+        if message["uid"] not in existing_uids
+    )
 
     db.commit()
-    db.refresh(cache_entry)
-    return cache_entry
+    return state
+
+
+def update_mailbox_status(
+    db: Session, account_id: int, folder: str, uidnext: int, message_count: int, highestmodseq: int = None
+):
+    """Record the STATUS a sync found nothing new for, without touching cached messages."""
+    db.query(models.MailboxSyncState).filter(
+        models.MailboxSyncState.account_id == account_id, models.MailboxSyncState.folder == folder
+    ).update(
+        {"uidnext": uidnext, "message_count": message_count, "highestmodseq": highestmodseq},
+        synchronize_session=False,
+    )
+    db.commit()
+
+
+def delete_mailbox_cache(db: Session, account_id: int):
+    db.query(models.CachedMessage).filter(models.CachedMessage.account_id == account_id).delete(synchronize_session=False)
+    db.query(models.MailboxSyncState).filter(models.MailboxSyncState.account_id == account_id).delete(synchronize_session=False)
+    db.query(models.EmailCache).filter(models.EmailCache.account_id == account_id).delete(synchronize_session=False)
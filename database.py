@@ -1,19 +1,166 @@
-from sqlalchemy import create_engine
+from contextlib import asynccontextmanager
+
+from sqlalchemy import create_engine, event, inspect, text
+from sqlalchemy.schema import CreateColumn
+from sqlalchemy.engine import make_url
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from starlette.concurrency import run_in_threadpool
+
+import config
+
+SQLALCHEMY_DATABASE_URL = config.DATABASE_URL
+
+
+def _engine_options(url) -> dict:
+    url = make_url(url)
+    if url.get_backend_name() != "sqlite":
+        return {
+            "pool_size": config.DB_POOL_SIZE,
+            "max_overflow": config.DB_MAX_OVERFLOW,
+            "pool_timeout": config.DB_POOL_TIMEOUT,
+            "pool_recycle": config.DB_POOL_RECYCLE,
+            "pool_pre_ping": True,
+        }
+    options = {"connect_args": {"check_same_thread": False}}
+    if url.database and url.database != ":memory:":
+        # In-memory databases need a single shared connection; files can pool
+        options.update(
+            pool_size=config.DB_POOL_SIZE,
+            max_overflow=config.DB_MAX_OVERFLOW,
+            pool_timeout=config.DB_POOL_TIMEOUT,
+        )
+    return options
+
+
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    # WAL lets readers proceed while a cache write is committing
+    cursor.execute(f"PRAGMA journal_mode={config.SQLITE_JOURNAL_MODE}")
+    cursor.execute(f"PRAGMA synchronous={config.SQLITE_SYNCHRONOUS}")
+    cursor.execute(f"PRAGMA busy_timeout={int(config.SQLITE_BUSY_TIMEOUT)}")
+    cursor.execute(f"PRAGMA cache_size={int(config.SQLITE_CACHE_SIZE)}")
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.close()
+
+
+def _configure(engine):
+    if engine.dialect.name == "sqlite":
+        event.listen(engine, "connect", _set_sqlite_pragmas)
+    return engine
 
-SQLALCHEMY_DATABASE_URL = "sqlite:///./mail_app.db"
 
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
-)
+engine = _configure(create_engine(SQLALCHEMY_DATABASE_URL, **_engine_options(SQLALCHEMY_DATABASE_URL)))
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 Base = declarative_base()
 
+# Optional async engine (e.g. sqlite+aiosqlite:// or postgresql+asyncpg://).
+# Needs the async driver and greenlet installed; unset keeps everything sync.
+async_engine = None
+AsyncSessionLocal = None
+if config.ASYNC_DATABASE_URL:
+    from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+    async_engine = create_async_engine(config.ASYNC_DATABASE_URL, **_engine_options(config.ASYNC_DATABASE_URL))
+    _configure(async_engine.sync_engine)
+    AsyncSessionLocal = async_sessionmaker(async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+
+
+def _is_async(db) -> bool:
+    return AsyncSessionLocal is not None and isinstance(db, AsyncSession)
+
+
 def get_db():
     db = SessionLocal()
     try:
         yield db
     finally:
         db.close()
+
+
+async def get_async_db():
+    """Session for async endpoints: an ``AsyncSession`` when an async URL is
+    configured, otherwise a regular ``Session``. Use :func:`run_sync` to run
+    ORM code against either."""
+    if AsyncSessionLocal is None:
+        db = SessionLocal()
+        try:
+            yield db
+        finally:
+            await run_in_threadpool(db.close)
+        return
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+# get_async_db as an ``async with`` block, for background tasks outside requests
+async_session = asynccontextmanager(get_async_db)
+
+
+def create_missing_indexes(metadata, bind=None):
+    """Create indexes added to models after their table already existed.
+
+    ``create_all`` skips existing tables entirely, so new indexes would
+    otherwise only appear on fresh databases.
+    """
+    bind = bind or engine
+    for table in metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=bind, checkfirst=True)
+
+
+def add_missing_columns(metadata, bind=None):
+    """``ALTER TABLE ... ADD COLUMN`` for columns added to existing tables.
+
+    New columns must be nullable or have a ``server_default``.
+    """
+    bind = bind or engine
+    inspector = inspect(bind)
+    existing_tables = set(inspector.get_table_names())
+    with bind.begin() as conn:
+        for table in metadata.sorted_tables:
+            if table.name not in existing_tables:
+                continue
+            existing = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in existing:
+                    ddl = CreateColumn(column).compile(dialect=bind.dialect)
+                    conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {ddl}"))
+
+
+def drop_stale_indexes(metadata, bind=None):
+    """Drop ``ix_`` indexes that a model no longer declares.
+
+    Needed when an index is replaced by a wider one (e.g. a unique index
+    gaining a column), since the old one would keep rejecting rows.
+    """
+    bind = bind or engine
+    inspector = inspect(bind)
+    existing_tables = set(inspector.get_table_names())
+    with bind.begin() as conn:
+        for table in metadata.sorted_tables:
+            if table.name not in existing_tables:
+                continue
+            declared = {index.name for index in table.indexes}
+            for index in inspector.get_indexes(table.name):
+                if index["name"].startswith("ix_") and index["name"] not in declared:
+                    conn.execute(text(f"DROP INDEX {index['name']}"))
+
+
+async def run_sync(db, fn, *args, **kwargs):
+    """Await ``fn(session, *args)`` without blocking the event loop.
+
+    Sync sessions run in the threadpool; async sessions run ``fn`` on the
+    async connection via ``AsyncSession.run_sync``.
+    """
+    if _is_async(db):
+        return await db.run_sync(fn, *args, **kwargs)
+    return await run_in_threadpool(fn, db, *args, **kwargs)
+
+
+async def close_session(db):
+    if _is_async(db):
+        await db.close()
+    else:
+        await run_in_threadpool(db.close)
@@ -0,0 +1,195 @@
+"""
+DB Browser
+Backs the admin SQLite browser. Table names, columns and primary keys are
+read with an inspector once and cached; pages are fetched by primary key
+(keyset) instead of OFFSET; row counts are cached and refreshed by a
+background thread, with a cheap estimate shown until the first count
+finishes; exports stream rows from a server-side cursor.
+"""
+import csv
+import io
+import json
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import column, func, inspect, select, table, text, tuple_
+
+import config as app_config
+import database
+
+logger = logging.getLogger(__name__)
+
+EXPORT_BATCH_SIZE = 500
+
+
+@dataclass(frozen=True)
+class TableInfo:
+    name: str
+    columns: Tuple[str, ...]
+    primary_key: Tuple[str, ...]
+
+    def selectable(self):
+        return table(self.name, *[column(name) for name in self.columns])
+
+
+class TableCatalog:
+    """Schema metadata cached for ``ttl`` seconds instead of inspecting per request."""
+
+    def __init__(self, engine=None, ttl: float = None):
+        self.engine = engine or database.engine
+        self.ttl = app_config.DB_BROWSER_METADATA_TTL if ttl is None else ttl
+        self._lock = threading.Lock()
+        self._tables: Dict[str, TableInfo] = {}
+        self._loaded_at = None
+
+    def tables(self) -> List[str]:
+        return list(self._current())
+
+    def get(self, name: str) -> Optional[TableInfo]:
+        return self._current().get(name)
+
+    def invalidate(self):
+        with self._lock:
+            self._loaded_at = None
+
+    def _current(self) -> Dict[str, TableInfo]:
+        with self._lock:
+            if self._loaded_at is None or time.monotonic() - self._loaded_at > self.ttl:
+                self._tables = self._load()
+                self._loaded_at = time.monotonic()
+            return self._tables
+
+    def _load(self) -> Dict[str, TableInfo]:
+        inspector = inspect(self.engine)
+        tables = {}
+        for name in inspector.get_table_names():
+            columns = tuple(col["name"] for col in inspector.get_columns(name))
+            primary_key = tuple(inspector.get_pk_constraint(name).get("constrained_columns") or ())
+            tables[name] = TableInfo(name, columns, primary_key)
+        return tables
+
+
+class RowCounter:
+    """Cached ``COUNT(*)`` per table, refreshed in the background once stale."""
+
+    def __init__(self, engine=None, ttl: float = None):
+        self.engine = engine or database.engine
+        self.ttl = app_config.DB_BROWSER_COUNT_TTL if ttl is None else ttl
+        self._lock = threading.Lock()
+        self._counts: Dict[str, Tuple[int, float]] = {}
+        self._refreshing = set()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="db-count")
+
+    def get(self, info: TableInfo) -> Tuple[Optional[int], bool]:
+        """``(count, approximate)``; never blocks on a full table scan."""
+        with self._lock:
+            cached = self._counts.get(info.name)
+            stale = cached is None or time.monotonic() - cached[1] > self.ttl
+            if stale and info.name not in self._refreshing:
+                self._refreshing.add(info.name)
+                self._executor.submit(self._refresh, info)
+        if cached is not None:
+            return cached[0], stale
+        return self._estimate(info), True
+
+    def _refresh(self, info: TableInfo):
+        try:
+            with self.engine.connect() as conn:
+                count = conn.execute(select(func.count()).select_from(info.selectable())).scalar() or 0
+            with self._lock:
+                self._counts[info.name] = (count, time.monotonic())
+        except Exception as e:
+            logger.warning("[DB] Failed to count rows of %s: %s", info.name, e)
+        finally:
+            with self._lock:
+                self._refreshing.discard(info.name)
+
+    def _estimate(self, info: TableInfo) -> Optional[int]:
+        try:
+            with self.engine.connect() as conn:
+                if self.engine.dialect.name == "postgresql":
+                    estimate = conn.execute(
+                        text("SELECT reltuples FROM pg_class WHERE oid = to_regclass(:name)"), {"name": info.name}
+                    ).scalar()
+                    return max(int(estimate), 0) if estimate is not None else None
+                if len(info.primary_key) == 1:
+                    # MAX of an integer key is an index lookup; deleted rows make it an upper bound
+                    estimate = conn.execute(select(func.max(column(info.primary_key[0]))).select_from(info.selectable())).scalar()
+                    if estimate is None:
+                        return 0  # Empty table
+                    return estimate if isinstance(estimate, int) else None
+        except Exception as e:
+            logger.warning("[DB] Failed to estimate rows of %s: %s", info.name, e)
+        return None
+
+
+def encode_cursor(info: TableInfo, row: dict) -> str:
+    return json.dumps([row[name] for name in info.primary_key], default=str)
+
+
+def decode_cursor(info: TableInfo, cursor: str) -> list:
+    try:
+        values = json.loads(cursor)
+    except ValueError:
+        values = None
+    if not isinstance(values, list) or len(values) != len(info.primary_key):
+        raise ValueError("Invalid cursor")
+    return values
+
+
+def fetch_page(info: TableInfo, limit: int, cursor: str = None, offset: int = 0) -> Tuple[List[dict], Optional[str]]:
+    """One page ordered by primary key, plus the cursor of the next page.
+
+    Tables without a primary key fall back to LIMIT/OFFSET.
+    """
+    source = info.selectable()
+    query = select(source)
+    if info.primary_key:
+        key = [source.c[name] for name in info.primary_key]
+        if cursor:
+            values = decode_cursor(info, cursor)
+            query = query.where(key[0] > values[0] if len(key) == 1 else tuple_(*key) > tuple_(*values))
+        query = query.order_by(*key)
+    if offset and not cursor:
+        query = query.offset(offset)
+
+    with database.engine.connect() as conn:
+        rows = [dict(row._mapping) for row in conn.execute(query.limit(limit + 1))]
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(info, rows[-1]) if info.primary_key else None
+    return rows, next_cursor
+
+
+def export_rows(info: TableInfo, file_format: str):
+    """Yield the whole table as CSV or NDJSON, read through a server-side cursor."""
+    source = info.selectable()
+    query = select(source)
+    if info.primary_key:
+        query = query.order_by(*[source.c[name] for name in info.primary_key])
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    with database.engine.connect() as conn:
+        result = conn.execution_options(stream_results=True, yield_per=EXPORT_BATCH_SIZE).execute(query)
+        if file_format == "csv":
+            writer.writerow(info.columns)
+        for partition in result.partitions():
+            if file_format == "csv":
+                writer.writerows(["" if value is None else value for value in row] for row in partition)
+            else:
+                for row in partition:
+                    buffer.write(json.dumps(dict(row._mapping), ensure_ascii=False, default=str) + "\n")
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+        if buffer.tell():
+            yield buffer.getvalue()
+
+
+catalog = TableCatalog()
+counter = RowCounter()
@@ -0,0 +1,644 @@
+"""
+Fake IMAP Server
+In-process IMAP4rev1 server for benchmarks and local experiments. Each login
+gets its own generated mailbox; the server speaks the subset of the protocol
+used by ``mail_service`` and ``idle_watcher`` (SELECT, STATUS, UID SEARCH
+incl. ESEARCH, UID FETCH with BODYSTRUCTURE and partial bodies or body
+parts, IDLE) over TLS or plain TCP,
+and can inject latency, dropped connections, stalls and rejected logins.
+Besides the generated INBOX, each user has the (initially empty) extra
+``folders`` passed to the server; their names must be sent in modified
+UTF-7, as real servers expect.
+"""
+import asyncio
+import base64
+import datetime
+import email.message
+import email.utils
+import os
+import random
+import re
+import ssl
+import subprocess
+import threading
+import urllib.parse
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+DEFAULT_SENDERS = ("noreply@example.com", "alerts@example.org", "news@example.net")
+CAPABILITIES = "IMAP4rev1 IDLE ESEARCH UIDPLUS"
+MONTHS = {name: index for index, name in enumerate(
+    ("Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov", "Dec"), 1
+)}
+TOKEN_PATTERN = re.compile(r'\(|\)|"(?:[^"\\]|\\.)*"|[^\s()]+')
+STATUS_ITEMS_PATTERN = re.compile(r"MESSAGES|UIDNEXT|UIDVALIDITY|RECENT|UNSEEN|HIGHESTMODSEQ", re.I)
+FETCH_ITEM_PATTERN = re.compile(r"BODY(?:\.PEEK)?\[([^\]]*)\](?:<(\d+)\.(\d+)>)?|RFC822|BODYSTRUCTURE", re.I)
+SECTION_PATTERN = re.compile(r"^\d+(?:\.\d+)*$")
+MUTF7_PATTERN = re.compile(r"&([A-Za-z0-9+,]*)-")
+
+
+def generate_self_signed_cert(directory: str):
+    """Create a throwaway certificate with the ``openssl`` CLI; returns ``(certfile, keyfile)``."""
+    certfile = os.path.join(directory, "fake-imap.crt")
+    keyfile = os.path.join(directory, "fake-imap.key")
+    subprocess.run(
+        [
+            "openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "1",
+            "-subj", "/CN=localhost", "-keyout", keyfile, "-out", certfile,
+        ],
+        check=True,
+        capture_output=True,
+    )
+    return certfile, keyfile
+
+
+def client_ssl_context() -> ssl.SSLContext:
+    """Client context that accepts the fake server's self-signed certificate."""
+    context = ssl.create_default_context()
+    context.check_hostname = False
+    context.verify_mode = ssl.CERT_NONE
+    return context
+
+
+class Message:
+    __slots__ = ("uid", "sender", "subject", "day", "header", "body", "_mime")
+
+    def __init__(self, uid: int, sender: str, subject: str, body: str, day: datetime.date, raw: bytes = None):
+        self.uid = uid
+        self.sender = sender
+        self.subject = subject
+        self.day = day
+        self._mime = None
+        if raw is not None:
+            header, _, self.body = raw.partition(b"\r\n\r\n")
+            self.header = header + b"\r\n\r\n"
+            return
+        moment = datetime.datetime.combine(day, datetime.time(12, 0), tzinfo=datetime.timezone.utc)
+        self.header = (
+            f"From: {sender}\r\nSubject: {subject}\r\nDate: {email.utils.format_datetime(moment)}\r\n"
+            "MIME-Version: 1.0\r\nContent-Type: text/plain; charset=utf-8\r\n"
+            "Content-Transfer-Encoding: 8bit\r\n\r\n"
+        ).encode()
+        self.body = body.encode()
+
+    @property
+    def mime(self) -> email.message.Message:
+        if self._mime is None:
+            self._mime = email.message_from_bytes(self.header + self.body)
+        return self._mime
+
+    def section(self, section: str) -> Optional[bytes]:
+        """Content of body part ``section`` (e.g. ``1.2``), still transfer-encoded."""
+        part = self.mime
+        for index in section.split("."):
+            if part.is_multipart():
+                children = part.get_payload()
+                if int(index) > len(children):
+                    return None
+                part = children[int(index) - 1]
+            elif index != "1":
+                return None
+        return _part_body(part)
+
+
+class Mailbox:
+    def __init__(self, uidvalidity: int):
+        self.uidvalidity = uidvalidity
+        self.next_uid = 1
+        self.modseq = 1
+        self.messages: List[Message] = []
+        self.idlers = set()
+
+    def add(self, sender: str, subject: str, body: str, day: datetime.date = None, raw: bytes = None) -> int:
+        uid = self.next_uid
+        self.next_uid += 1
+        self.modseq += 1
+        self.messages.append(Message(uid, sender, subject, body, day or datetime.date.today(), raw))
+        for notify in list(self.idlers):
+            notify(len(self.messages))
+        return uid
+
+
+class FakeImapServer:
+    """Threaded asyncio IMAP server; call :meth:`start` and connect to ``port``.
+
+    ``latency`` models the network round trip: each answer is sent
+    ``latency`` seconds after its command arrived, so commands a client
+    pipelines share one delay. ``failure_rate`` drops the connection before
+    answering a command,
+    ``stall_rate`` delays the answer by ``stall_seconds`` (use more than the
+    client timeout to simulate a hanging provider), and logins with a
+    password starting with ``bad`` are rejected.
+    """
+
+    def __init__(
+        self,
+        mailbox_size: int = 100,
+        senders=DEFAULT_SENDERS,
+        latency: float = 0.0,
+        failure_rate: float = 0.0,
+        stall_rate: float = 0.0,
+        stall_seconds: float = 60.0,
+        certfile: str = None,
+        keyfile: str = None,
+        capabilities: str = CAPABILITIES,
+        seed: int = 0,
+        folders=(),
+    ):
+        self.mailbox_size = mailbox_size
+        self.folders = ["INBOX"] + [folder for folder in folders if folder.upper() != "INBOX"]
+        self.senders = list(senders)
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.stall_rate = stall_rate
+        self.stall_seconds = stall_seconds
+        self.capabilities = capabilities
+        self.certfile = certfile
+        self.keyfile = keyfile
+        self.host = "127.0.0.1"
+        self.port: Optional[int] = None
+        self.commands = Counter()
+        self.connections = 0
+        self.logins = 0
+        self.injected_failures = 0
+        self._mailboxes: Dict[Tuple[str, str], Mailbox] = {}
+        self._random = random.Random(seed)
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._server = None
+        self._thread = None
+
+    @property
+    def use_ssl(self) -> bool:
+        return bool(self.certfile)
+
+    def start(self) -> "FakeImapServer":
+        ready = threading.Event()
+        errors = []
+
+        def run():
+            self._loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(self._loop)
+            context = None
+            if self.use_ssl:
+                context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+                context.load_cert_chain(self.certfile, self.keyfile)
+            try:
+                self._server = self._loop.run_until_complete(
+                    asyncio.start_server(self._handle, self.host, 0, ssl=context, backlog=1024)
+                )
+            except Exception as e:
+                errors.append(e)
+                ready.set()
+                return
+            self.port = self._server.sockets[0].getsockname()[1]
+            ready.set()
+            self._loop.run_forever()
+
+        self._thread = threading.Thread(target=run, name="fake-imap", daemon=True)
+        self._thread.start()
+        ready.wait()
+        if errors:
+            raise errors[0]
+        return self
+
+    def stop(self):
+        if self._loop is None:
+            return
+        self._loop.call_soon_threadsafe(self._server.close)
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(timeout=5)
+
+    def add_message(
+        self,
+        user: str,
+        sender: str,
+        subject: str,
+        body: str = "Your verification code is 482913",
+        folder: str = "INBOX",
+        raw: bytes = None,
+    ) -> int:
+        """Deliver a message to ``user``'s ``folder``; IDLE sessions get an EXISTS.
+
+        ``raw`` (a complete RFC 5322 message, e.g. multipart) replaces the
+        generated one; SEARCH still matches ``sender`` and ``subject``.
+        """
+        future = asyncio.run_coroutine_threadsafe(self._add(user, sender, subject, body, folder, raw), self._loop)
+        return future.result()
+
+    def stats(self) -> dict:
+        return {
+            "connections": self.connections,
+            "logins": self.logins,
+            "commands": dict(self.commands),
+            "total_commands": sum(self.commands.values()),
+            "injected_failures": self.injected_failures,
+        }
+
+    def reset_stats(self):
+        self.commands.clear()
+        self.connections = self.logins = self.injected_failures = 0
+
+    async def _add(self, user, sender, subject, body, folder, raw=None):
+        return self._mailbox(user, folder).add(sender, subject, body, raw=raw)
+
+    def _mailbox(self, user: str, folder: str = "INBOX") -> Optional[Mailbox]:
+        folder = "INBOX" if folder.upper() == "INBOX" else folder
+        if folder not in self.folders:
+            return None
+        mailbox = self._mailboxes.get((user, folder))
+        if mailbox is None:
+            mailbox = self._mailboxes[(user, folder)] = Mailbox(uidvalidity=1000 + len(self._mailboxes))
+            if folder != "INBOX":
+                return mailbox
+            today = datetime.date.today()
+            for index in range(self.mailbox_size):
+                # Oldest first, spread over roughly a year
+                age = (self.mailbox_size - index) * 365 // max(self.mailbox_size, 1)
+                sender = self.senders[index % len(self.senders)]
+                mailbox.add(
+                    sender,
+                    f"Message {index + 1} from {sender}",
+                    f"Hello,\r\nyour code is {100000 + index}.\r\n",
+                    today - datetime.timedelta(days=age),
+                )
+        return mailbox
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.connections += 1
+        session = _Session(self, writer)
+        session.write("* OK [CAPABILITY " + self.capabilities + "] fake IMAP ready")
+        # Lines are read (and timestamped) as they arrive, independently of
+        # how long earlier commands take to answer
+        lines: asyncio.Queue = asyncio.Queue()
+
+        async def receive():
+            try:
+                while True:
+                    line = await reader.readline()
+                    await lines.put((line, asyncio.get_running_loop().time()))
+                    if not line:
+                        return
+            except (ConnectionError, asyncio.IncompleteReadError, ssl.SSLError):
+                await lines.put((b"", 0.0))
+
+        receiver = asyncio.ensure_future(receive())
+        try:
+            while True:
+                line, arrived = await lines.get()
+                if not line:
+                    break
+                if not await session.handle(line.decode(errors="replace").rstrip("\r\n"), arrived):
+                    break
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError, ssl.SSLError):
+            pass
+        finally:
+            receiver.cancel()
+            session.close()
+            writer.close()
+
+
+class _Session:
+    def __init__(self, server: FakeImapServer, writer: asyncio.StreamWriter):
+        self.server = server
+        self.writer = writer
+        self.mailbox: Optional[Mailbox] = None
+        self.user: Optional[str] = None
+        self.idle_tag: Optional[str] = None
+
+    def write(self, line):
+        self.writer.write(line if isinstance(line, bytes) else (line + "\r\n").encode())
+
+    def close(self):
+        if self.mailbox is not None:
+            self.mailbox.idlers.discard(self._on_exists)
+
+    def _on_exists(self, count: int):
+        if self.idle_tag:
+            self.write(f"* {count} EXISTS")
+
+    async def handle(self, line: str, arrived: float = None) -> bool:
+        server = self.server
+        if self.idle_tag:
+            if line.upper() == "DONE":
+                self.write(f"{self.idle_tag} OK IDLE terminated")
+                self.idle_tag = None
+            return True
+
+        tag, _, rest = line.partition(" ")
+        command, _, args = rest.partition(" ")
+        command = command.upper()
+        uid_mode = command == "UID"
+        if uid_mode:
+            command, _, args = args.partition(" ")
+            command = command.upper()
+        server.commands[command] += 1
+
+        if server.latency:
+            loop = asyncio.get_running_loop()
+            await asyncio.sleep(max(0.0, (loop.time() if arrived is None else arrived) + server.latency - loop.time()))
+        if server.failure_rate and server._random.random() < server.failure_rate:
+            server.injected_failures += 1
+            return False
+        if server.stall_rate and server._random.random() < server.stall_rate:
+            server.injected_failures += 1
+            await asyncio.sleep(server.stall_seconds)
+
+        handler = getattr(self, f"_cmd_{command.lower()}", None)
+        if handler is None:
+            self.write(f"{tag} BAD unknown command {command}")
+            return True
+        return handler(tag, args, uid_mode) is not False
+
+    def _cmd_capability(self, tag, args, uid_mode):
+        self.write("* CAPABILITY " + self.server.capabilities)
+        self.write(f"{tag} OK CAPABILITY completed")
+
+    def _cmd_login(self, tag, args, uid_mode):
+        self.server.logins += 1
+        parts = [part.strip('"') for part in TOKEN_PATTERN.findall(args)]
+        if len(parts) < 2 or parts[1].startswith("bad"):
+            self.write(f"{tag} NO [AUTHENTICATIONFAILED] Invalid credentials")
+            return
+        self.user = parts[0]
+        self.write(f"{tag} OK [CAPABILITY {self.server.capabilities}] LOGIN completed")
+
+    def _cmd_select(self, tag, args, uid_mode):
+        if self.user is None:
+            self.write(f"{tag} BAD not authenticated")
+            return
+        self.close()
+        if not args.isascii():
+            self.write(f"{tag} BAD mailbox names must be sent in modified UTF-7")
+            return
+        self.mailbox = self.server._mailbox(self.user, _mailbox_name(args))
+        if self.mailbox is None:
+            self.write(f"{tag} NO [NONEXISTENT] no such mailbox")
+            return
+        self.mailbox.idlers.add(self._on_exists)
+        self.write(f"* {len(self.mailbox.messages)} EXISTS")
+        self.write("* 0 RECENT")
+        self.write(f"* OK [UIDVALIDITY {self.mailbox.uidvalidity}] UIDs valid")
+        self.write(f"* OK [UIDNEXT {self.mailbox.next_uid}] Predicted next UID")
+        self.write(f"{tag} OK [READ-WRITE] SELECT completed")
+
+    _cmd_examine = _cmd_select
+
+    def _cmd_status(self, tag, args, uid_mode):
+        if self.user is None:
+            self.write(f"{tag} BAD not authenticated")
+            return
+        if not args.isascii():
+            self.write(f"{tag} BAD mailbox names must be sent in modified UTF-7")
+            return
+        mailbox = self.server._mailbox(self.user, _mailbox_name(args))
+        if mailbox is None:
+            self.write(f"{tag} NO [NONEXISTENT] no such mailbox")
+            return
+        values = {
+            "MESSAGES": len(mailbox.messages),
+            "UIDNEXT": mailbox.next_uid,
+            "UIDVALIDITY": mailbox.uidvalidity,
+            "RECENT": 0,
+            "UNSEEN": len(mailbox.messages),
+            "HIGHESTMODSEQ": mailbox.modseq,
+        }
+        items = [item.upper() for item in STATUS_ITEMS_PATTERN.findall(args.partition("(")[2])]
+        self.write(f"* STATUS {TOKEN_PATTERN.findall(args)[0]} (" + " ".join(f"{item} {values[item]}" for item in items) + ")")
+        self.write(f"{tag} OK STATUS completed")
+
+    def _cmd_noop(self, tag, args, uid_mode):
+        self.write(f"{tag} OK NOOP completed")
+
+    def _cmd_idle(self, tag, args, uid_mode):
+        self.idle_tag = tag
+        self.write("+ idling")
+
+    def _cmd_close(self, tag, args, uid_mode):
+        self.close()
+        self.mailbox = None
+        self.write(f"{tag} OK CLOSE completed")
+
+    def _cmd_logout(self, tag, args, uid_mode):
+        self.write("* BYE logging out")
+        self.write(f"{tag} OK LOGOUT completed")
+        return False
+
+    def _cmd_search(self, tag, args, uid_mode):
+        if self.mailbox is None:
+            self.write(f"{tag} BAD no mailbox selected")
+            return
+        returns = None
+        match = re.match(r"RETURN \(([^)]*)\) (.*)", args, re.I)
+        if match:
+            returns, args = match.group(1).upper().split(), match.group(2)
+        messages = self.mailbox.messages
+        predicate = _SearchParser(TOKEN_PATTERN.findall(args), self.mailbox.next_uid - 1).parse_all()
+        found = [
+            str(message.uid if uid_mode else index)
+            for index, message in enumerate(messages, 1)
+            if predicate(message)
+        ]
+        if returns is None:
+            self.write("* SEARCH " + " ".join(found) if found else "* SEARCH")
+        else:
+            line = f'* ESEARCH (TAG "{tag}")' + (" UID" if uid_mode else "")
+            if found and "MIN" in returns:
+                line += f" MIN {found[0]}"
+            if found and "MAX" in returns:
+                line += f" MAX {found[-1]}"
+            if "COUNT" in returns:
+                line += f" COUNT {len(found)}"
+            if found and "ALL" in returns:
+                line += " ALL " + ",".join(found)
+            self.write(line)
+        self.write(f"{tag} OK SEARCH completed")
+
+    def _cmd_fetch(self, tag, args, uid_mode):
+        if self.mailbox is None:
+            self.write(f"{tag} BAD no mailbox selected")
+            return
+        sequence_set, _, items = args.partition(" ")
+        messages = self.mailbox.messages
+        highest = self.mailbox.next_uid - 1 if uid_mode else len(messages)
+        for index, message in enumerate(messages, 1):
+            if not _in_sequence_set(message.uid if uid_mode else index, sequence_set, highest):
+                continue
+            line = f"* {index} FETCH (UID {message.uid}"
+            for name, data in _fetch_items(message, items):
+                if isinstance(data, str):
+                    line += f" {name} {data}"
+                    continue
+                self.write(f"{line} {name} {{{len(data)}}}")
+                self.write(data)
+                line = ""
+            self.write(line + ")")
+        self.write(f"{tag} OK FETCH completed")
+
+
+def _fetch_items(message: Message, items: str):
+    for match in FETCH_ITEM_PATTERN.finditer(items):
+        if match.group(0).upper() == "RFC822":
+            yield "RFC822", message.header + message.body
+            continue
+        if match.group(0).upper() == "BODYSTRUCTURE":
+            yield "BODYSTRUCTURE", _bodystructure(message.mime)
+            continue
+        section = match.group(1).upper()
+        if section.startswith("HEADER.FIELDS"):
+            wanted = set(re.search(r"\(([^)]*)\)", section).group(1).split())
+            lines = [
+                line for line in message.header.split(b"\r\n")
+                if line.split(b":", 1)[0].upper().decode() in wanted
+            ]
+            data = b"\r\n".join(lines) + b"\r\n\r\n"
+        elif section == "TEXT":
+            data = message.body
+        elif section == "HEADER":
+            data = message.header
+        elif SECTION_PATTERN.match(section):
+            data = message.section(section) or b""
+        else:
+            data = message.header + message.body
+        name = f"BODY[{match.group(1)}]"
+        if match.group(2):
+            start, length = int(match.group(2)), int(match.group(3))
+            data = data[start:start + length]
+            name += f"<{start}>"
+        yield name, data
+
+
+def _part_body(part: email.message.Message) -> bytes:
+    if part.is_multipart():
+        return part.as_bytes().partition(b"\n\n")[2]
+    if (part.get("Content-Transfer-Encoding") or "").strip().lower() in ("base64", "quoted-printable"):
+        return part.get_payload().encode("ascii")
+    # 7bit/8bit bodies are stored as is; decoding returns their raw bytes
+    return part.get_payload(decode=True) or b""
+
+
+def _quote(value: str) -> str:
+    return '"' + value.replace("\\", "\\\\").replace('"', '\\"') + '"'
+
+
+def _parameters(pairs) -> str:
+    items = []
+    for name, value in pairs:
+        if value.isascii():
+            items.append(f"{_quote(name.upper())} {_quote(value)}")
+        else:
+            # Like real servers, pass RFC 2231 parameters through encoded
+            encoded = "utf-8''" + urllib.parse.quote(value)
+            items.append(f"{_quote(name.upper() + '*')} {_quote(encoded)}")
+    return "(" + " ".join(items) + ")" if items else "NIL"
+
+
+def _bodystructure(part: email.message.Message) -> str:
+    if part.is_multipart():
+        children = "".join(_bodystructure(child) for child in part.get_payload())
+        boundary = _parameters([("boundary", part.get_boundary() or "")])
+        return f"({children} {_quote(part.get_content_subtype().upper())} {boundary} NIL NIL NIL)"
+    data = _part_body(part)
+    params = [(name, email.utils.collapse_rfc2231_value(value)) for name, value in (part.get_params() or [])[1:]]
+    encoding = (part.get("Content-Transfer-Encoding") or "7bit").strip().upper()
+    fields = (
+        f"{_quote(part.get_content_maintype().upper())} {_quote(part.get_content_subtype().upper())} "
+        f"{_parameters(params)} NIL NIL {_quote(encoding)} {len(data)}"
+    )
+    if part.get_content_maintype() == "text":
+        fields += " %d" % data.count(b"\n")
+    disposition = "NIL"
+    if part.get_content_disposition():
+        filename = part.get_filename()
+        disposition = (
+            f"({_quote(part.get_content_disposition().upper())} "
+            f"{_parameters([('filename', filename)] if filename else [])})"
+        )
+    return f"({fields} NIL {disposition} NIL NIL)"
+
+
+def _mailbox_name(args: str) -> str:
+    tokens = TOKEN_PATTERN.findall(args)
+    if not tokens:
+        return ""
+    name = tokens[0]
+    if name.startswith('"'):
+        name = re.sub(r"\\(.)", r"\1", name[1:-1])
+    return MUTF7_PATTERN.sub(_decode_mutf7, name)
+
+
+def _decode_mutf7(match) -> str:
+    # "&-" is a literal "&"; anything else is base64 (with "," for "/") of UTF-16
+    data = match.group(1)
+    if not data:
+        return "&"
+    data = data.replace(",", "/")
+    return base64.b64decode(data + "=" * (-len(data) % 4)).decode("utf-16-be")
+
+
+def _in_sequence_set(number: int, sequence_set: str, highest: int) -> bool:
+    for part in sequence_set.split(","):
+        if ":" in part:
+            low, high = (highest if value == "*" else int(value) for value in part.split(":", 1))
+            if min(low, high) <= number <= max(low, high):
+                return True
+        elif (highest if part == "*" else int(part)) == number:
+            return True
+    return False
+
+
+class _SearchParser:
+    """Compiles the search keys used by the service into one predicate."""
+
+    def __init__(self, tokens: List[str], highest_uid: int):
+        self.tokens = tokens
+        self.position = 0
+        self.highest_uid = highest_uid
+
+    def parse_all(self):
+        predicates = []
+        while self.position < len(self.tokens):
+            predicates.append(self.parse())
+        return lambda message: all(predicate(message) for predicate in predicates)
+
+    def _next(self) -> str:
+        token = self.tokens[self.position]
+        self.position += 1
+        return token
+
+    def parse(self):
+        token = self._next()
+        if token == "(":
+            predicates = []
+            while self.tokens[self.position] != ")":
+                predicates.append(self.parse())
+            self.position += 1
+            return lambda message: all(predicate(message) for predicate in predicates)
+        key = token.upper()
+        if key == "ALL":
+            return lambda message: True
+        if key == "OR":
+            left, right = self.parse(), self.parse()
+            return lambda message: left(message) or right(message)
+        if key == "NOT":
+            inner = self.parse()
+            return lambda message: not inner(message)
+        if key == "FROM":
+            value = self._next().strip('"').lower()
+            return lambda message: value in message.sender.lower()
+        if key == "SUBJECT":
+            value = self._next().strip('"').lower()
+            return lambda message: value in message.subject.lower()
+        if key == "UID":
+            sequence_set, highest = self._next(), self.highest_uid
+            return lambda message: _in_sequence_set(message.uid, sequence_set, highest)
+        if key in ("SINCE", "BEFORE", "ON"):
+            day_text, month, year = self._next().strip('"').split("-")
+            day = datetime.date(int(year), MONTHS[month.capitalize()], int(day_text))
+            if key == "SINCE":
+                return lambda message: message.day >= day
+            if key == "BEFORE":
+                return lambda message: message.day < day
+            return lambda message: message.day == day
+        # Flags and other keys the service never sends match everything
+        return lambda message: True
@@ -0,0 +1,291 @@
+"""
+IMAP IDLE Watchers
+Optional background subsystem that keeps one IMAP IDLE session open per
+recently active account and refreshes its cached messages as soon as the
+server reports new mail, so API requests can be answered from the cache.
+"""
+import asyncio
+import logging
+import random
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, Optional
+
+import config as app_config
+import database
+import imap_pool
+import mail_service
+import shared_cache
+from aioimap import ImapError
+
+logger = logging.getLogger(__name__)
+
+@dataclass(frozen=True)
+class WatchedAccount:
+    id: int
+    email: str
+    password: str
+    imap_server: str
+    default_sender_filter: Optional[str]
+
+    @classmethod
+    def from_model(cls, account) -> "WatchedAccount":
+        return cls(
+            id=account.id,
+            email=account.email,
+            password=account.password,
+            imap_server=account.imap_server,
+            default_sender_filter=account.default_sender_filter,
+        )
+
+
+def client_key(account: WatchedAccount):
+    return imap_pool.account_key(account.email, account.imap_server)
+
+
+class AccountWatcher:
+    """Holds one IDLE session for an account and syncs the cache on EXISTS."""
+
+    def __init__(self, manager: "IdleWatcherManager", account: WatchedAccount):
+        self.manager = manager
+        self.account = account
+        self.filters = mail_service.parse_sender_filters(account.default_sender_filter)
+        self.generation = imap_pool.generation(client_key(account))
+        self.synced = False
+        self.task: Optional[asyncio.Task] = None
+        self._cached: Optional[dict] = None
+
+    @property
+    def credentials_changed(self) -> bool:
+        return imap_pool.generation(client_key(self.account)) != self.generation
+
+    async def run(self):
+        backoff = self.manager.backoff_min
+        while True:
+            session = None
+            try:
+                async with self.manager.connect_slots:
+                    client = await self.manager.connect(self.account, self.manager.timeout)
+                    session = imap_pool.AsyncPooledSession(client_key(self.account), client, self.generation)
+                    if self._cached is None:
+                        self._cached = await asyncio.to_thread(self._load)
+                    await self._sync(session)
+                backoff = self.manager.backoff_min
+                await self._idle_loop(session)
+            except Exception as e:
+                delay = backoff * random.uniform(0.8, 1.2)
+                backoff = min(backoff * 2, self.manager.backoff_max)
+                logger.warning("[IDLE] Watcher for %s failed (%s), reconnecting in %.1fs", self.account.email, e, delay)
+            finally:
+                self.synced = False
+                if session is not None:
+                    session.shutdown()
+            await asyncio.sleep(delay)
+
+    async def _idle_loop(self, session: imap_pool.AsyncPooledSession):
+        client = session.conn
+        while True:
+            await client.idle_start()
+            self.synced = True
+            deadline = time.monotonic() + self.manager.renew_interval
+            changed = False
+            while not changed:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                response = await client.idle_wait(remaining)
+                if response is None:
+                    break
+                typ, _ = response
+                changed = typ in ("EXISTS", "EXPUNGE")
+
+            if changed:
+                self.synced = False
+            if await client.idle_done() != "OK":
+                raise ImapError("IDLE was not terminated cleanly")
+            if changed:
+                async with self.manager.connect_slots:
+                    await self._sync(session)
+
+    async def _sync(self, session: imap_pool.AsyncPooledSession):
+        """Run the regular incremental fetch; only new headers are fetched.
+
+        This is the request path's single-folder flow, so the stored entry
+        keeps the STATUS fields that let other workers skip SELECT and SEARCH.
+        """
+        if self.filters:
+            flow = mail_service.single_folder_flow(
+                self.account, imap_pool.DEFAULT_MAILBOX, self.filters, [], self.manager.limit,
+                self.manager.timeout, self._cached, session.capabilities,
+            )
+            result, cache_updates = await mail_service.run_flow_async(flow, session)
+            if isinstance(result, dict) and "error" in result:
+                raise ImapError(result["error"])
+            if cache_updates:
+                self._cached = await asyncio.to_thread(self._store, cache_updates)
+                cached = len(self._cached["ids"]) if self._cached else 0
+                logger.info("[IDLE] Cache refreshed for %s (%s message(s))", self.account.email, cached)
+                # Other workers must not keep serving their shared copy of the old list
+                shared_cache.cache.bump(self.account.id)
+                self.manager.notify(self.account.id)
+        # IDLE reports changes of the selected mailbox; an unchanged STATUS skips the SELECT
+        status, _ = await session.select(imap_pool.DEFAULT_MAILBOX)
+        if status != "OK":
+            raise ImapError(f"SELECT {imap_pool.DEFAULT_MAILBOX} failed: {status}")
+
+    def _load(self):
+        db = database.SessionLocal()
+        try:
+            return mail_service.load_cached_result(db, self.account.id, self.manager.limit)
+        finally:
+            db.close()
+
+    def _store(self, cache_updates: dict) -> Optional[dict]:
+        """Write ``cache_updates`` and return the folder's cache as stored."""
+        db = database.SessionLocal()
+        try:
+            mail_service.store_cache_updates(db, self.account.id, cache_updates)
+            return mail_service.load_cached_result(db, self.account.id, self.manager.limit)
+        finally:
+            db.close()
+
+
+class IdleWatcherManager:
+    """Starts IDLE watchers for accounts polled recently and stops idle ones.
+
+    :meth:`touch` is called from request handlers (any thread); everything
+    else runs on the application's event loop.
+    """
+
+    def __init__(
+        self,
+        enabled: bool = None,
+        max_watchers: int = None,
+        connect_concurrency: int = None,
+        account_ttl: int = None,
+        renew_interval: int = None,
+        backoff_min: float = None,
+        backoff_max: float = None,
+        limit: int = 5,
+        timeout: int = None,
+        connect=imap_pool.open_async_connection,
+    ):
+        self.enabled = app_config.IDLE_WATCHERS_ENABLED if enabled is None else enabled
+        self.max_watchers = app_config.IDLE_MAX_WATCHERS if max_watchers is None else max_watchers
+        self.connect_concurrency = (
+            app_config.IDLE_CONNECT_CONCURRENCY if connect_concurrency is None else connect_concurrency
+        )
+        self.account_ttl = app_config.IDLE_ACCOUNT_TTL if account_ttl is None else account_ttl
+        self.renew_interval = app_config.IDLE_RENEW_INTERVAL if renew_interval is None else renew_interval
+        self.backoff_min = app_config.IDLE_BACKOFF_MIN if backoff_min is None else backoff_min
+        self.backoff_max = app_config.IDLE_BACKOFF_MAX if backoff_max is None else backoff_max
+        self.limit = limit
+        self.timeout = app_config.IMAP_TIMEOUT if timeout is None else timeout
+        self.connect = connect
+        self.connect_slots: Optional[asyncio.Semaphore] = None
+        self._lock = threading.Lock()
+        self._active: Dict[int, tuple] = {}  # account id -> (WatchedAccount, last seen)
+        self._watchers: Dict[int, AccountWatcher] = {}
+        self._supervisor: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._listeners = []
+
+    @property
+    def running(self) -> bool:
+        return self._supervisor is not None and not self._supervisor.done()
+
+    def touch(self, account):
+        """Record that ``account`` was polled so it gets (or keeps) a watcher."""
+        if not self.enabled:
+            return
+        record = WatchedAccount.from_model(account)
+        with self._lock:
+            previous = self._active.get(record.id)
+            self._active[record.id] = (record, time.monotonic())
+        if previous is None or previous[0] != record:
+            self._wake()
+
+    def is_fresh(self, account_id: int) -> bool:
+        """True when a watcher is idling on an up-to-date cache for the account."""
+        watcher = self._watchers.get(account_id)
+        return bool(watcher and watcher.synced and not watcher.credentials_changed)
+
+    def add_listener(self, callback):
+        """Call ``callback(account_id)`` on the event loop after a watcher refreshed the cache."""
+        self._listeners.append(callback)
+
+    def notify(self, account_id: int):
+        for callback in self._listeners:
+            try:
+                callback(account_id)
+            except Exception as e:
+                logger.warning("[IDLE] Cache refresh listener failed: %s", e)
+
+    async def start(self):
+        if not self.enabled or self.running:
+            return
+        self._loop = asyncio.get_running_loop()
+        self.connect_slots = asyncio.Semaphore(self.connect_concurrency)
+        self._wakeup = asyncio.Event()
+        self._supervisor = asyncio.create_task(self._supervise())
+        logger.info("[IDLE] Watcher manager started (max watchers: %s)", self.max_watchers)
+
+    async def stop(self):
+        if self._supervisor is None:
+            return
+        self._supervisor.cancel()
+        tasks = [w.task for w in self._watchers.values() if w.task]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(self._supervisor, *tasks, return_exceptions=True)
+        self._watchers.clear()
+        self._supervisor = None
+        logger.info("[IDLE] Watcher manager stopped")
+
+    def _wake(self):
+        if self._loop is not None and self._wakeup is not None:
+            try:
+                self._loop.call_soon_threadsafe(self._wakeup.set)
+            except RuntimeError:
+                pass
+
+    async def _supervise(self):
+        while True:
+            self._reconcile()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=max(1, self.account_ttl / 4))
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+    def _reconcile(self):
+        now = time.monotonic()
+        with self._lock:
+            expired = [aid for aid, (_, seen) in self._active.items() if now - seen > self.account_ttl]
+            for account_id in expired:
+                del self._active[account_id]
+            # Most recently active accounts win when there are more than the cap
+            wanted = sorted(self._active.values(), key=lambda item: item[1], reverse=True)[: self.max_watchers]
+        wanted_records = {record.id: record for record, _ in wanted}
+
+        for account_id, watcher in list(self._watchers.items()):
+            record = wanted_records.get(account_id)
+            if watcher.credentials_changed:
+                # Updated or deleted account; wait for the next poll to return
+                with self._lock:
+                    self._active.pop(account_id, None)
+                wanted_records.pop(account_id, None)
+            if account_id not in wanted_records or record != watcher.account or watcher.credentials_changed:
+                watcher.task.cancel()
+                del self._watchers[account_id]
+
+        for account_id, record in wanted_records.items():
+            if account_id not in self._watchers:
+                watcher = AccountWatcher(self, record)
+                watcher.task = asyncio.create_task(watcher.run())
+                self._watchers[account_id] = watcher
+
+
+manager = IdleWatcherManager()
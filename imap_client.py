@@ -5,6 +5,7 @@ from bs4 import BeautifulSoup
 import getpass
 import socket
 import config
+import code_extractor
 
 def clean_text(text):
     return "".join(text.split())
@@ -101,6 +102,7 @@ def get_email_content(username, password, imap_server, sender_email, timeout=Non
 
                 print("Body Content:")
                 print(body.strip())
+                print(f"Verification Code: {code_extractor.extractor.extract(msg.get('From'), subject, body) or '-'}")
 
         mail.close()
         mail.logout()
@@ -0,0 +1,623 @@
+"""
+IMAP Connection Pool
+Keeps logged-in, mailbox-selected IMAP sessions alive per account so that
+repeated fetches skip the TLS handshake, LOGIN and SELECT round trips.
+"""
+import abc
+import asyncio
+import imaplib
+import logging
+import socket
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+
+import config as app_config
+import metrics
+from aioimap import AsyncImapClient, ImapError, quote_mailbox
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAILBOX = "INBOX"
+
+# Errors after which a session can no longer be trusted and must be dropped
+CONNECTION_ERRORS = (imaplib.IMAP4.abort, socket.timeout, OSError)
+
+# STATUS items and the SELECT responses carrying the same value
+SELECT_STATUS_ITEMS = (
+    ("MESSAGES", "EXISTS"),
+    ("UIDNEXT", "UIDNEXT"),
+    ("UIDVALIDITY", "UIDVALIDITY"),
+    ("HIGHESTMODSEQ", "HIGHESTMODSEQ"),
+)
+
+_generations = {}
+_generations_lock = threading.Lock()
+_pools = []
+
+
+def account_key(email_address: str, imap_server: str):
+    return ((email_address or "").strip().lower(), (imap_server or "").strip().lower())
+
+
+def generation(key) -> int:
+    """Credential generation of an account; bumped whenever it is invalidated."""
+    with _generations_lock:
+        return _generations.get(key, 0)
+
+
+def invalidate(email_address: str, imap_server: str):
+    """Drop pooled sessions of an account after its credentials changed."""
+    key = account_key(email_address, imap_server)
+    with _generations_lock:
+        _generations[key] = _generations.get(key, 0) + 1
+    # Bumped first: a session released from now on is not pooled again
+    for session_pool in _pools:
+        session_pool.evict(key)
+
+
+def open_connection(account, timeout: int, port: int = imaplib.IMAP4_SSL_PORT, ssl_context=None) -> imaplib.IMAP4:
+    """Open a new TLS connection and log in with the account credentials."""
+    with metrics.imap_phase_seconds.time("connect"):
+        conn = imaplib.IMAP4_SSL(account.imap_server, port, ssl_context=ssl_context, timeout=timeout)
+    # Set socket timeout for all subsequent operations
+    if getattr(conn, "sock", None):
+        conn.sock.settimeout(timeout)
+    try:
+        with metrics.imap_phase_seconds.time("login"):
+            conn.login(account.email, account.password)
+            # Servers commonly advertise extensions such as ESEARCH only after login
+            typ, data = conn.capability()
+        if typ == "OK" and data and data[-1]:
+            conn.capabilities = tuple(data[-1].decode(errors="replace").upper().split())
+    except Exception:
+        try:
+            conn.shutdown()
+        except Exception:
+            pass
+        raise
+    return conn
+
+
+async def open_async_connection(account, timeout: float, port: int = None, ssl_context=None) -> AsyncImapClient:
+    """Asyncio counterpart of :func:`open_connection`."""
+    client = AsyncImapClient(account.imap_server, port, timeout=timeout, ssl_context=ssl_context)
+    with metrics.imap_phase_seconds.time("connect"):
+        await client.connect()
+    try:
+        with metrics.imap_phase_seconds.time("login"):
+            await client.login(account.email, account.password)
+    except Exception:
+        client.shutdown()
+        raise
+    return client
+
+
+class PooledSession:
+    """A logged-in IMAP connection together with its pool bookkeeping."""
+
+    def __init__(self, key, conn: imaplib.IMAP4, generation: int):
+        self.key = key
+        self.conn = conn
+        self.generation = generation
+        self.selected = None
+        self.uidvalidity = None
+        self.reused = False
+        self.created_at = self.last_used = time.monotonic()
+
+    def select(self, mailbox: str = DEFAULT_MAILBOX, force: bool = False):
+        """SELECT ``mailbox`` unless it is already the selected one.
+
+        Returns ``(status, uidvalidity)`` of the selected mailbox.
+        """
+        if not force and self.selected == mailbox:
+            return "OK", self.uidvalidity
+        self.selected = None
+        # imaplib sends the name as is (ASCII only): encode and quote it here
+        status, _ = self.conn.select(quote_mailbox(mailbox))
+        return self._selected(mailbox, status, self.conn.untagged_responses)
+
+    def _selected(self, mailbox: str, status: str, responses):
+        self.uidvalidity = None
+        if status == "OK":
+            self.selected = mailbox
+            raw = responses.get("UIDVALIDITY", [None])
+            raw = raw[-1] if isinstance(raw, list) else raw
+            if raw:
+                self.uidvalidity = int(raw)
+        return status, self.uidvalidity
+
+    def status(self, mailbox: str, names: str):
+        """STATUS of ``mailbox``, or a re-SELECT when it is the selected one.
+
+        RFC 3501 (6.3.10) says STATUS should not be sent for the selected
+        mailbox; a fresh SELECT reports the same items and keeps it selected.
+        """
+        if self.selected == mailbox:
+            status, _ = self.select(mailbox, force=True)
+            return status_from_select(status, self.conn.untagged_responses, names)
+        return self.conn.status(quote_mailbox(mailbox), names)
+
+    @property
+    def capabilities(self) -> frozenset:
+        return frozenset(cap.upper() for cap in self.conn.capabilities)
+
+    def esearch(self, criteria: str, options: str):
+        """``UID SEARCH RETURN (options) criteria``; returns the ESEARCH data."""
+        typ, data = self.conn.uid("SEARCH", f"RETURN ({options}) {criteria}")
+        if typ != "OK":
+            return typ, data
+        return typ, self.conn.response("ESEARCH")[1]
+
+    def is_alive(self) -> bool:
+        sock = getattr(self.conn, "sock", None)
+        if sock is None or sock.fileno() == -1:
+            return False
+        if self.conn.state not in ("AUTH", "SELECTED"):
+            return False
+        return "BYE" not in self.conn.untagged_responses
+
+    def noop(self) -> bool:
+        status, _ = self.conn.noop()
+        self.touch()
+        return status == "OK"
+
+    def touch(self):
+        self.last_used = time.monotonic()
+        # Untagged EXISTS/RECENT/FETCH responses pile up on long-lived
+        # connections; nothing reads them after the command completed.
+        self.conn.untagged_responses.clear()
+
+    def set_timeout(self, timeout: int):
+        sock = getattr(self.conn, "sock", None)
+        if sock is not None:
+            sock.settimeout(timeout)
+
+    def close(self):
+        try:
+            if self.selected:
+                self.conn.close()
+            self.conn.logout()
+        except Exception:
+            self.shutdown()
+        self.selected = None
+
+    def shutdown(self):
+        try:
+            self.conn.shutdown()
+        except Exception:
+            pass
+
+
+class AsyncPooledSession(PooledSession):
+    """Pooled session wrapping an :class:`aioimap.AsyncImapClient`."""
+
+    async def select(self, mailbox: str = DEFAULT_MAILBOX, force: bool = False):
+        if not force and self.selected == mailbox:
+            return "OK", self.uidvalidity
+        self.selected = None
+        status, _ = await self.conn.select(mailbox)
+        return self._selected(mailbox, status, self.conn.untagged_responses)
+
+    async def esearch(self, criteria: str, options: str):
+        # The client returns the ESEARCH data of RETURN searches directly
+        return await self.conn.uid("SEARCH", f"RETURN ({options}) {criteria}")
+
+    async def status(self, mailbox: str, names: str):
+        if self.selected == mailbox:
+            status, _ = await self.select(mailbox, force=True)
+            return status_from_select(status, self.conn.untagged_responses, names)
+        return await self.conn.status(mailbox, names)
+
+    async def pipeline(self, commands):
+        """Send fetch-flow commands in a single round trip.
+
+        A SELECT of the mailbox that is already selected is answered
+        locally, as in :meth:`select`, and its STATUS is sent as a SELECT,
+        as in :meth:`status`.
+        """
+        results = [None] * len(commands)
+        wire = []  # (position, client method, args)
+        status_names = {}  # position -> STATUS items answered by a SELECT
+        for position, (name, args) in enumerate(commands):
+            if name == "status" and self.selected == args[0]:
+                status_names[position] = args[1]
+                wire.append((position, "select", (args[0],)))
+            elif name == "select":
+                mailbox = args[0] if args else DEFAULT_MAILBOX
+                if self.selected == mailbox:
+                    results[position] = ("OK", self.uidvalidity)
+                    continue
+                self.selected = None
+                wire.append((position, "select", (mailbox,)))
+            elif name == "esearch":
+                criteria, options = args
+                wire.append((position, "uid", ("SEARCH", f"RETURN ({options}) {criteria}")))
+            else:
+                wire.append((position, name, tuple(args)))
+        responses = await self.conn.pipeline([(method, args) for _, method, args in wire]) if wire else []
+        select_responses = iter(self.conn.select_responses)
+        for (position, method, args), (typ, data) in zip(wire, responses):
+            if method == "select":
+                responses_of_select = next(select_responses, {})
+                results[position] = self._selected(args[0], typ, responses_of_select)
+                if position in status_names:
+                    results[position] = status_from_select(typ, responses_of_select, status_names[position])
+            else:
+                results[position] = (typ, data)
+        return results
+
+    def is_alive(self) -> bool:
+        if self.conn.closed or self.conn.state not in ("AUTH", "SELECTED"):
+            return False
+        return "BYE" not in self.conn.untagged_responses
+
+    async def noop(self) -> bool:
+        status, _ = await self.conn.noop()
+        self.touch()
+        return status == "OK"
+
+    def set_timeout(self, timeout: float):
+        self.conn.timeout = timeout
+
+    async def close(self):
+        await self.conn.logout()
+        self.selected = None
+
+    def shutdown(self):
+        self.conn.shutdown()
+
+
+def status_from_select(status: str, responses, names: str):
+    """STATUS-shaped ``(typ, data)`` for the ``names`` items a SELECT reported in ``responses``."""
+    if status != "OK":
+        return status, [None]
+    wanted = names.upper()
+    items = []
+    for item, response in SELECT_STATUS_ITEMS:
+        raw = responses.get(response)
+        raw = raw[-1] if isinstance(raw, list) else raw
+        if item in wanted and raw:
+            items.append(f"{item} {raw.decode() if isinstance(raw, bytes) else raw}")
+    return status, [f"({' '.join(items)})".encode()]
+
+
+class _SessionPool(abc.ABC):
+    """Bookkeeping shared by the blocking and the asyncio pools.
+
+    Sessions are keyed by ``(email, imap_server)``. A session is exclusively
+    owned by one caller between ``acquire`` and ``release``; idle sessions are
+    kept alive with NOOP in the background and closed once they exceed the
+    idle timeout or the pool is full. None of the methods here block, so the
+    lock is never held across I/O.
+    """
+
+    def __init__(
+        self,
+        max_idle_per_account: int = None,
+        max_idle_total: int = None,
+        idle_timeout: int = None,
+        keepalive_interval: int = None,
+        healthcheck_after: int = None,
+        connect=None,
+    ):
+        self.max_idle_per_account = (
+            app_config.IMAP_POOL_MAX_IDLE_PER_ACCOUNT if max_idle_per_account is None else max_idle_per_account
+        )
+        self.max_idle_total = app_config.IMAP_POOL_MAX_IDLE_TOTAL if max_idle_total is None else max_idle_total
+        self.idle_timeout = app_config.IMAP_POOL_IDLE_TIMEOUT if idle_timeout is None else idle_timeout
+        self.keepalive_interval = (
+            app_config.IMAP_POOL_KEEPALIVE_INTERVAL if keepalive_interval is None else keepalive_interval
+        )
+        self.healthcheck_after = (
+            app_config.IMAP_POOL_HEALTHCHECK_AFTER if healthcheck_after is None else healthcheck_after
+        )
+        self._connect = connect
+        self._lock = threading.Lock()
+        self._idle = {}  # key -> deque of sessions, most recently used last
+        self._idle_count = 0
+        _pools.append(self)
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_idle_per_account > 0 and self.max_idle_total > 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "idle_sessions": self._idle_count,
+                "accounts": len(self._idle),
+            }
+
+    def evict(self, key):
+        """Remove idle sessions of ``key`` and close them."""
+        with self._lock:
+            bucket = self._idle.pop(key, None) or deque()
+            self._idle_count -= len(bucket)
+        if bucket:
+            self._discard_idle(list(bucket))
+            logger.info("[POOL] Evicted %s idle session(s) for %s", len(bucket), key[0])
+
+    @abc.abstractmethod
+    def _discard_idle(self, sessions):
+        """Close ``sessions``, which have already been removed from the pool."""
+
+    def _needs_healthcheck(self, session) -> bool:
+        return time.monotonic() - session.last_used >= self.healthcheck_after
+
+    def _is_current(self, session) -> bool:
+        return session.generation == generation(session.key) and session.is_alive()
+
+    def _pop_idle(self, key):
+        with self._lock:
+            bucket = self._idle.get(key)
+            if not bucket:
+                return None
+            session = bucket.pop()
+            self._idle_count -= 1
+            if not bucket:
+                del self._idle[key]
+            return session
+
+    def _push_idle(self, session) -> list:
+        """Store ``session`` as idle and return the sessions pushed out."""
+        evicted = []
+        with self._lock:
+            if session.generation != generation(session.key):
+                return [session]
+            bucket = self._idle.setdefault(session.key, deque())
+            bucket.append(session)
+            self._idle_count += 1
+            while len(bucket) > self.max_idle_per_account:
+                evicted.append(bucket.popleft())
+                self._idle_count -= 1
+            while self._idle_count > self.max_idle_total:
+                evicted.append(self._pop_oldest_locked())
+        return evicted
+
+    def _pop_oldest_locked(self):
+        oldest_key = min(self._idle, key=lambda k: self._idle[k][0].last_used)
+        bucket = self._idle[oldest_key]
+        session = bucket.popleft()
+        self._idle_count -= 1
+        if not bucket:
+            del self._idle[oldest_key]
+        return session
+
+    def _take_all(self) -> list:
+        with self._lock:
+            sessions = [s for bucket in self._idle.values() for s in bucket]
+            self._idle.clear()
+            self._idle_count = 0
+        return sessions
+
+    def _collect_keepalive(self):
+        """Take idle sessions that expired or are due for a NOOP out of the pool."""
+        now = time.monotonic()
+        expired, due = [], []
+        with self._lock:
+            for key in list(self._idle):
+                bucket = self._idle[key]
+                for session in list(bucket):
+                    idle_for = now - session.last_used
+                    if idle_for >= self.idle_timeout:
+                        expired.append(session)
+                    elif idle_for >= self.keepalive_interval:
+                        due.append(session)
+                    else:
+                        continue
+                    bucket.remove(session)
+                    self._idle_count -= 1
+                if not bucket:
+                    del self._idle[key]
+        return expired, due
+
+    @property
+    def _keepalive_period(self) -> float:
+        return max(1, min(self.keepalive_interval, self.idle_timeout) / 2)
+
+
+class ImapConnectionPool(_SessionPool):
+    """Per-account pool of idle :mod:`imaplib` sessions."""
+
+    def __init__(self, *args, connect=open_connection, **kwargs):
+        super().__init__(*args, connect=connect, **kwargs)
+        self._stop = threading.Event()
+        self._keepalive_thread = None
+
+    def acquire(self, account, timeout: int = None) -> PooledSession:
+        """Return a healthy session for ``account``, reusing an idle one if possible."""
+        if timeout is None:
+            timeout = app_config.IMAP_TIMEOUT
+        key = account_key(account.email, account.imap_server)
+
+        while True:
+            session = self._pop_idle(key)
+            if session is None:
+                break
+            session.set_timeout(timeout)
+            if self._is_healthy(session):
+                session.reused = True
+                return session
+            logger.info("[POOL] Dropping unhealthy session for %s@%s", key[0], key[1])
+            # A LOGOUT could wait out the whole timeout on a dead connection
+            session.shutdown()
+
+        logger.debug("[POOL] Opening new IMAP session for %s on %s", key[0], key[1])
+        conn = self._connect(account, timeout)
+        return PooledSession(key, conn, generation(key))
+
+    def release(self, session: PooledSession, discard: bool = False):
+        """Hand ``session`` back to the pool, or close it if it cannot be reused."""
+        if discard or not session.is_alive():
+            session.shutdown()
+            return
+        if not self.enabled:
+            session.close()
+            return
+
+        session.touch()
+        evicted = self._push_idle(session)
+        self._ensure_keepalive()
+        for stale in evicted:
+            stale.close()
+
+    @contextmanager
+    def session(self, account, timeout: int = None):
+        session = self.acquire(account, timeout)
+        try:
+            yield session
+        except BaseException:
+            self.release(session, discard=True)
+            raise
+        else:
+            self.release(session)
+
+    def close_all(self):
+        self._stop.set()
+        thread, self._keepalive_thread = self._keepalive_thread, None
+        if thread is not None and thread is not threading.current_thread():
+            thread.join(timeout=5)
+        self._stop.clear()
+        for session in self._take_all():
+            session.close()
+
+    def _discard_idle(self, sessions):
+        for session in sessions:
+            session.close()
+
+    def _is_healthy(self, session: PooledSession) -> bool:
+        if not self._is_current(session):
+            return False
+        if not self._needs_healthcheck(session):
+            return True
+        try:
+            return session.noop()
+        except CONNECTION_ERRORS + (imaplib.IMAP4.error,):
+            return False
+
+    def _ensure_keepalive(self):
+        with self._lock:
+            if self._keepalive_thread is not None and self._keepalive_thread.is_alive():
+                return
+            self._keepalive_thread = threading.Thread(
+                target=self._keepalive_loop, name="imap-pool-keepalive", daemon=True
+            )
+            self._keepalive_thread.start()
+
+    def _keepalive_loop(self):
+        while not self._stop.wait(self._keepalive_period):
+            expired, due = self._collect_keepalive()
+            for session in expired:
+                session.close()
+            for session in due:
+                try:
+                    alive = session.noop()
+                except CONNECTION_ERRORS + (imaplib.IMAP4.error,):
+                    alive = False
+                self.release(session, discard=not alive)
+
+
+class AsyncImapConnectionPool(_SessionPool):
+    """Per-account pool of idle :class:`aioimap.AsyncImapClient` sessions.
+
+    All sessions belong to the event loop that opened them; the pool must
+    only be used from that loop.
+    """
+
+    def __init__(self, *args, connect=open_async_connection, **kwargs):
+        super().__init__(*args, connect=connect, **kwargs)
+        self._keepalive_task = None
+        self._loop = None
+
+    async def acquire(self, account, timeout: float = None) -> AsyncPooledSession:
+        if timeout is None:
+            timeout = app_config.IMAP_TIMEOUT
+        key = account_key(account.email, account.imap_server)
+
+        while True:
+            session = self._pop_idle(key)
+            if session is None:
+                break
+            session.set_timeout(timeout)
+            if await self._is_healthy(session):
+                session.reused = True
+                return session
+            logger.info("[POOL] Dropping unhealthy session for %s@%s", key[0], key[1])
+            session.shutdown()
+
+        logger.debug("[POOL] Opening new async IMAP session for %s on %s", key[0], key[1])
+        conn = await self._connect(account, timeout)
+        return AsyncPooledSession(key, conn, generation(key))
+
+    async def release(self, session: AsyncPooledSession, discard: bool = False):
+        if discard or not self.enabled or not session.is_alive():
+            session.shutdown()
+            return
+
+        session.touch()
+        evicted = self._push_idle(session)
+        self._ensure_keepalive()
+        for stale in evicted:
+            await stale.close()
+
+    @asynccontextmanager
+    async def session(self, account, timeout: float = None):
+        session = await self.acquire(account, timeout)
+        try:
+            yield session
+        except BaseException:
+            await self.release(session, discard=True)
+            raise
+        else:
+            await self.release(session)
+
+    async def close_all(self):
+        if self._keepalive_task is not None:
+            self._keepalive_task.cancel()
+            await asyncio.gather(self._keepalive_task, return_exceptions=True)
+            self._keepalive_task = None
+        await asyncio.gather(*(s.close() for s in self._take_all()), return_exceptions=True)
+
+    def _discard_idle(self, sessions):
+        # invalidate() may run in a worker thread; sockets belong to the loop
+        def shutdown_all():
+            for session in sessions:
+                session.shutdown()
+
+        if self._loop is not None and not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(shutdown_all)
+
+    async def _is_healthy(self, session: AsyncPooledSession) -> bool:
+        if not self._is_current(session):
+            return False
+        if not self._needs_healthcheck(session):
+            return True
+        try:
+            return await session.noop()
+        except (ImapError, OSError, asyncio.TimeoutError):
+            return False
+
+    def _ensure_keepalive(self):
+        if self._keepalive_task is not None and not self._keepalive_task.done():
+            return
+        self._loop = asyncio.get_running_loop()
+        self._keepalive_task = self._loop.create_task(self._keepalive_loop())
+
+    async def _keepalive_loop(self):
+        while True:
+            await asyncio.sleep(self._keepalive_period)
+            expired, due = self._collect_keepalive()
+            for session in expired:
+                await session.close()
+            for session in due:
+                try:
+                    alive = await session.noop()
+                except (ImapError, OSError, asyncio.TimeoutError):
+                    alive = False
+                await self.release(session, discard=not alive)
+
+
+pool = ImapConnectionPool()
+async_pool = AsyncImapConnectionPool()
@@ -0,0 +1,141 @@
+"""
+Logging Setup
+Configures the root logger from ``config.py``. Records are put on a queue by
+the calling thread and formatted and written by a background listener, so
+request handlers never wait on log I/O. Every record carries the
+``request_id`` of the HTTP request that produced it, which ties the ``[API]``
+and ``[MAIL]`` lines of one request together. DEBUG records (the per-phase
+IMAP lines) can be sampled per request with ``LOG_SAMPLE_RATE``.
+"""
+import atexit
+import contextvars
+import copy
+import json
+import logging
+import logging.handlers
+import queue
+import random
+import sys
+import uuid
+import zlib
+from datetime import datetime, timezone
+from typing import Optional
+
+import config as app_config
+
+NO_REQUEST = "-"
+
+request_id_var: contextvars.ContextVar = contextvars.ContextVar("request_id", default=NO_REQUEST)
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+def new_request_id() -> str:
+    return uuid.uuid4().hex[:16]
+
+
+def bind_request_id(value: str = None) -> contextvars.Token:
+    """Tag log records of the current context (request, task) with ``value``."""
+    return request_id_var.set(value or new_request_id())
+
+
+def reset_request_id(token: contextvars.Token):
+    request_id_var.reset(token)
+
+
+class RequestContextFilter(logging.Filter):
+    """Copy the current request ID onto the record; must run in the thread that logs."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = request_id_var.get()
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """Keep ``rate`` of the records at or below ``max_level``.
+
+    The decision is derived from the request ID, so a sampled request keeps
+    all of its lines and a dropped one loses all of them.
+    """
+
+    def __init__(self, rate: float, max_level: int = logging.DEBUG):
+        super().__init__()
+        self.rate = rate
+        self.max_level = max_level
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if self.rate >= 1 or record.levelno > self.max_level:
+            return True
+        request_id = getattr(record, "request_id", NO_REQUEST)
+        if request_id == NO_REQUEST:
+            return random.random() < self.rate
+        return zlib.crc32(request_id.encode()) / 0xFFFFFFFF < self.rate
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "request_id": getattr(record, "request_id", NO_REQUEST),
+            "message": record.getMessage(),
+        }
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """``QueueHandler`` that leaves the formatting of records to the listener thread.
+
+    Only the message is rendered in the caller, since its arguments may be
+    mutable objects that change before the listener gets to them. Unlike
+    the stock ``prepare``, the exception text and the output format are
+    left to the listener.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+
+def configure():
+    """Install the handlers on the root logger; safe to call more than once."""
+    global _listener
+    shutdown()
+
+    output = logging.StreamHandler(sys.stderr)
+    if app_config.LOG_JSON:
+        output.setFormatter(JsonFormatter())
+    else:
+        output.setFormatter(logging.Formatter(app_config.LOG_FORMAT))
+
+    if app_config.LOG_QUEUE_ENABLED:
+        handler = DeferredQueueHandler(queue.SimpleQueue())
+        _listener = logging.handlers.QueueListener(handler.queue, output, respect_handler_level=True)
+        _listener.start()
+    else:
+        handler = output
+    # Filters run in the thread that logs, before the record is queued
+    handler.addFilter(RequestContextFilter())
+    handler.addFilter(SamplingFilter(app_config.LOG_SAMPLE_RATE))
+
+    root = logging.getLogger()
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+    root.addHandler(handler)
+    root.setLevel(app_config.LOG_LEVEL)
+
+
+def shutdown():
+    """Flush queued records and stop the background writer."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+atexit.register(shutdown)
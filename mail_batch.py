@@ -0,0 +1,98 @@
+"""
+Batch Mailbox Fetch
+Fetches many mailboxes for one request. Tokens are checked against a single
+account query, and fetches run concurrently under a global limit plus a
+per-IMAP-host limit, so one slow provider cannot take every slot. Results
+are yielded as each mailbox finishes.
+"""
+import asyncio
+import json
+import logging
+from typing import Dict, List
+
+import account_cache
+import config as app_config
+import database
+import idle_watcher
+import mail_service
+
+logger = logging.getLogger(__name__)
+
+
+async def authorize(db, items) -> list:
+    """Pair each item with its account, or with the error entry to return for it."""
+    records = await database.run_sync(db, account_cache.cache.get_many, [item.mail_id for item in items])
+    resolved = []
+    for index, item in enumerate(items):
+        account = records.get(item.mail_id)
+        if account is None:
+            resolved.append((index, item, None, entry(index, item, 404, {"error": "Mail ID not found"})))
+        elif not account.token_matches(item.token):
+            resolved.append((index, item, None, entry(index, item, 403, {"error": "Invalid token"})))
+        else:
+            resolved.append((index, item, account, None))
+    return resolved
+
+
+def entry(index: int, item, status: int, result) -> dict:
+    return {"index": index, "mail_id": item.mail_id, "sender": item.sender, "status": status, "result": result}
+
+
+class BatchRunner:
+    def __init__(self, concurrency: int = None, host_concurrency: int = None):
+        self.concurrency = app_config.MAIL_BATCH_CONCURRENCY if concurrency is None else concurrency
+        self.host_concurrency = (
+            app_config.MAIL_BATCH_HOST_CONCURRENCY if host_concurrency is None else host_concurrency
+        )
+
+    async def run(self, resolved: list):
+        """Yield one entry per item, in completion order."""
+        slots = asyncio.Semaphore(self.concurrency)
+        host_slots: Dict[str, asyncio.Semaphore] = {}
+        pending: List[asyncio.Task] = []
+        for index, item, account, error in resolved:
+            if error is not None:
+                yield error
+                continue
+            host = (account.imap_server or "").strip().lower()
+            if host not in host_slots:
+                host_slots[host] = asyncio.Semaphore(self.host_concurrency)
+            pending.append(asyncio.create_task(self._fetch(index, item, account, slots, host_slots[host])))
+
+        try:
+            for task in asyncio.as_completed(pending):
+                yield await task
+        finally:
+            # The client went away (streaming) or an entry failed unexpectedly
+            for task in pending:
+                task.cancel()
+
+    async def _fetch(self, index: int, item, account, slots: asyncio.Semaphore, host_slot: asyncio.Semaphore) -> dict:
+        # Wait for the host first so a busy provider does not hold global slots
+        async with host_slot, slots:
+            idle_watcher.manager.touch(account)
+            async with database.async_session() as db:
+                try:
+                    result = await mail_service.fetch_recent_emails_async(
+                        account,
+                        sender_filter=item.sender,
+                        db=db,
+                        cache_is_fresh=idle_watcher.manager.is_fresh(account.id),
+                    )
+                except Exception as e:
+                    logger.error("[BATCH] Fetch failed for %s: %s", account.email, e)
+                    result = {"error": mail_service.GENERIC_FETCH_ERROR}
+        return entry(index, item, 200, result)
+
+
+def failed(result: dict) -> bool:
+    return result["status"] != 200 or (isinstance(result["result"], dict) and "error" in result["result"])
+
+
+async def ndjson(results):
+    """Encode entries from :meth:`BatchRunner.run` as newline-delimited JSON."""
+    async for result in results:
+        yield json.dumps(result, ensure_ascii=False) + "\n"
+
+
+runner = BatchRunner()
@@ -0,0 +1,637 @@
+"""
+Message Detail
+Backs ``GET /api/mail/messages/{uid}``. The message's BODYSTRUCTURE and
+headers are fetched first (pipelined with the SELECT), then only the best
+text part is downloaded: ``text/plain`` when there is one, otherwise HTML
+converted to text. Attachments are listed from the structure and only
+downloaded when asked for. Decoded bodies are kept in a size-bounded LRU,
+optionally backed by a disk directory, keyed by (account, folder,
+UIDVALIDITY, UID); large parts are decoded in a worker thread so the event
+loop keeps serving other requests.
+"""
+import asyncio
+import base64
+import email
+import hashlib
+import itertools
+import json
+import logging
+import os
+import quopri
+import re
+import socket
+import threading
+import urllib.parse
+from collections import OrderedDict
+from dataclasses import dataclass
+from email.header import decode_header, make_header
+from typing import List, Optional
+
+from sqlalchemy.orm import Session
+
+import code_extractor
+import config as app_config
+import crud
+import database
+import imap_pool
+import mail_service
+import metrics
+from singleflight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+STRUCTURE_FETCH_ITEMS = "(UID BODYSTRUCTURE BODY.PEEK[HEADER.FIELDS (SUBJECT FROM TO DATE)])"
+SECTION_PATTERN = re.compile(r"^\d+(?:\.\d+)*$")
+# Atoms may carry a bracketed section with spaces, e.g. BODY[HEADER.FIELDS (FROM)]<0>
+ATOM_PATTERN = re.compile(rb'[^\s()"{\[\]]+(?:\[[^\]]*\])?(?:<\d+>)?')
+QUOTED_PATTERN = re.compile(rb'"((?:[^"\\]|\\.)*)"', re.S)
+QUOTED_ESCAPE_PATTERN = re.compile(rb"\\(.)", re.S)
+LITERAL_PATTERN = re.compile(rb"\{(\d+)\}\r\n")
+BASE64_NOISE_PATTERN = re.compile(rb"[^A-Za-z0-9+/=]")
+RFC2231_KEY_PATTERN = re.compile(r"^([^*]+)\*(?:(\d+)\*?)?$")
+# Never follow a symlink planted in place of a cached body
+O_NOFOLLOW = getattr(os, "O_NOFOLLOW", 0)
+
+_inflight = SingleFlight()
+
+
+@dataclass(frozen=True)
+class BodyPart:
+    """One leaf of a BODYSTRUCTURE; ``size`` is the transfer-encoded size."""
+
+    section: str
+    content_type: str
+    charset: Optional[str]
+    encoding: str
+    size: int
+    disposition: Optional[str]
+    filename: Optional[str]
+
+    @property
+    def is_attachment(self) -> bool:
+        if self.disposition == "attachment":
+            return True
+        return self.filename is not None and self.disposition != "inline"
+
+    def describe(self) -> dict:
+        return {
+            "section": self.section,
+            "content_type": self.content_type,
+            "filename": self.filename,
+            "size": self.size,
+        }
+
+
+def parse_values(raw: bytes) -> list:
+    """Parse an IMAP response into nested lists.
+
+    Atoms and quoted strings become ``str`` (``NIL`` becomes ``None``),
+    literals stay ``bytes``.
+    """
+    stack = [[]]
+    pos = 0
+    while pos < len(raw):
+        char = raw[pos:pos + 1]
+        if char in b" \r\n":
+            pos += 1
+        elif char == b"(":
+            stack.append([])
+            pos += 1
+        elif char == b")":
+            if len(stack) > 1:
+                value = stack.pop()
+                stack[-1].append(value)
+            pos += 1
+        elif char == b'"':
+            match = QUOTED_PATTERN.match(raw, pos)
+            if match is None:
+                raise ValueError("Unterminated quoted string in IMAP response")
+            stack[-1].append(QUOTED_ESCAPE_PATTERN.sub(rb"\1", match.group(1)).decode(errors="replace"))
+            pos = match.end()
+        elif char == b"{":
+            match = LITERAL_PATTERN.match(raw, pos)
+            if match is None:
+                raise ValueError("Malformed literal in IMAP response")
+            end = match.end() + int(match.group(1))
+            stack[-1].append(raw[match.end():end])
+            pos = end
+        else:
+            match = ATOM_PATTERN.match(raw, pos)
+            if match is None:
+                pos += 1  # Stray bracket
+                continue
+            atom = match.group(0).decode(errors="replace")
+            stack[-1].append(None if atom.upper() == "NIL" else atom)
+            pos = match.end()
+    while len(stack) > 1:
+        value = stack.pop()
+        stack[-1].append(value)
+    return stack[0]
+
+
+def _join_fetch(msg_data) -> bytes:
+    """A FETCH response as sent on the wire, literals included."""
+    raw = b""
+    for item in msg_data:
+        if isinstance(item, tuple):
+            prefix = item[0].encode() if isinstance(item[0], str) else item[0]
+            raw += prefix + b"\r\n" + item[1]
+        elif isinstance(item, bytes):
+            raw += item
+    return raw
+
+
+def parse_fetch(msg_data, uid: int) -> Optional[dict]:
+    """Attributes of message ``uid`` in a UID FETCH response, keyed by upper-case item name."""
+    for value in parse_values(_join_fetch(msg_data)):
+        if not isinstance(value, list):
+            continue
+        attributes = {str(key).upper(): item for key, item in zip(value[::2], value[1::2])}
+        if attributes.get("UID") == str(uid):
+            return attributes
+    return None
+
+
+def _section_value(attributes: dict, prefix: str) -> bytes:
+    for key, value in attributes.items():
+        if key.startswith(prefix):
+            return value.encode() if isinstance(value, str) else value or b""
+    return b""
+
+
+def _params(values) -> dict:
+    """Parameter list of a BODYSTRUCTURE as a dict, with RFC 2231 values decoded."""
+    if not isinstance(values, list):
+        return {}
+    params, pieces = {}, {}
+    for key, value in zip(values[::2], values[1::2]):
+        if not isinstance(key, str) or value is None:
+            continue
+        if isinstance(value, bytes):
+            value = value.decode(errors="replace")
+        key = key.lower()
+        match = RFC2231_KEY_PATTERN.match(key)
+        if match:
+            pieces.setdefault(match.group(1), []).append((int(match.group(2) or 0), key.endswith("*"), value))
+        else:
+            params[key] = value
+    for name, chunks in pieces.items():
+        chunks.sort()
+        charset = "utf-8"
+        encoded = []
+        for index, (_, extended, chunk) in enumerate(chunks):
+            if extended and index == 0 and chunk.count("'") >= 2:
+                charset, _, chunk = chunk.split("'", 2)
+            encoded.append(chunk if extended else urllib.parse.quote(chunk))
+        try:
+            params[name] = urllib.parse.unquote("".join(encoded), encoding=charset or "utf-8", errors="replace")
+        except LookupError:
+            params[name] = urllib.parse.unquote("".join(encoded), errors="replace")
+    return params
+
+
+def _decode_words(value: Optional[str]) -> Optional[str]:
+    if not value:
+        return value
+    try:
+        return str(make_header(decode_header(value)))
+    except (LookupError, ValueError):
+        return value
+
+
+def body_parts(structure, section: str = "") -> List[BodyPart]:
+    """Leaf parts of a parsed BODYSTRUCTURE in order, with their section numbers."""
+    if not isinstance(structure, list) or not structure:
+        return []
+    if isinstance(structure[0], list):
+        children = itertools.takewhile(lambda item: isinstance(item, list), structure)
+        parts = []
+        for index, child in enumerate(children, 1):
+            parts.extend(body_parts(child, f"{section}.{index}" if section else str(index)))
+        return parts
+
+    fields = list(structure) + [None] * 12
+    content_type = f"{(fields[0] or 'application')}/{(fields[1] or 'octet-stream')}".lower()
+    params = _params(fields[2])
+    # Extension data follows the basic fields: text parts add a line count,
+    # message/rfc822 parts an envelope, a body structure and a line count
+    extension = 9 if content_type.startswith("text/") else 11 if content_type == "message/rfc822" else 8
+    disposition, disposition_params = None, {}
+    if isinstance(fields[extension], list) and fields[extension]:
+        disposition = str(fields[extension][0] or "").lower() or None
+        disposition_params = _params(fields[extension][1] if len(fields[extension]) > 1 else None)
+    size = str(fields[6] or "")
+    return [
+        BodyPart(
+            section=section or "1",
+            content_type=content_type,
+            charset=params.get("charset"),
+            encoding=str(fields[5] or "7bit").lower(),
+            size=int(size) if size.isdigit() else 0,
+            disposition=disposition,
+            filename=_decode_words(disposition_params.get("filename") or params.get("name")),
+        )
+    ]
+
+
+def choose_text_part(parts: List[BodyPart]) -> Optional[BodyPart]:
+    """The part shown as the message body: the first plain-text part, else the first HTML part."""
+    candidates = [part for part in parts if not part.is_attachment]
+    for content_type in ("text/plain", "text/html"):
+        for part in candidates:
+            if part.content_type == content_type:
+                return part
+    return None
+
+
+def attachment_parts(parts: List[BodyPart], text_part: Optional[BodyPart]) -> List[BodyPart]:
+    # Alternative text versions of the body are not attachments
+    return [
+        part for part in parts
+        if part is not text_part and (part.is_attachment or not part.content_type.startswith("text/"))
+    ]
+
+
+def decode_transfer(data: bytes, encoding: str) -> bytes:
+    if encoding == "base64":
+        compact = BASE64_NOISE_PATTERN.sub(b"", data)
+        return base64.b64decode(compact + b"=" * (-len(compact) % 4))
+    if encoding == "quoted-printable":
+        return quopri.decodestring(data)
+    return data
+
+
+def _structure_flow(uid: int, folder: str, timeout):
+    """Sub-flow returning ``(uidvalidity, attributes)``; attributes are ``None``
+    when the message does not exist, and the result is an error dict when
+    the folder cannot be selected."""
+    try:
+        (status, uidvalidity), (fetch_status, data) = yield (
+            "pipeline",
+            ([("select", (folder,)), ("uid", ("FETCH", str(uid), STRUCTURE_FETCH_ITEMS))],),
+        )
+    except socket.timeout:
+        logger.error("[DETAIL] Timeout while fetching the structure of %s/%s after %ss", folder, uid, timeout)
+        raise
+    if status != "OK":
+        logger.warning("[DETAIL] Failed to select %s, status: %s", folder, status)
+        return {"error": mail_service.GENERIC_FETCH_ERROR}
+    attributes = parse_fetch(data, uid) if fetch_status == "OK" else None
+    if attributes is None or "BODYSTRUCTURE" not in attributes:
+        return uidvalidity, None
+    return uidvalidity, attributes
+
+
+def _part_flow(uid: int, part: BodyPart, max_bytes: int, timeout):
+    """Sub-flow downloading (the first ``max_bytes`` of) one body part."""
+    item = f"BODY.PEEK[{part.section}]"
+    if part.size > max_bytes:
+        item += f"<0.{max_bytes}>"
+    try:
+        status, data = yield ("uid", ("FETCH", str(uid), f"(UID {item})"))
+    except socket.timeout:
+        logger.error("[DETAIL] Timeout while fetching part %s of %s after %ss", part.section, uid, timeout)
+        raise
+    if status != "OK":
+        logger.warning("[DETAIL] Failed to fetch part %s of %s, status: %s", part.section, uid, status)
+        return None
+    return _section_value(parse_fetch(data, uid) or {}, f"BODY[{part.section}]")
+
+
+def detail_flow(uid: int, folder: str, timeout, max_bytes: int):
+    """IMAP conversation for one message detail; see :func:`mail_service.recent_emails_flow`.
+
+    Costs two round trips: SELECT with BODYSTRUCTURE and headers, then the
+    text part. Returns the undecoded detail (see :func:`decode_detail`),
+    ``None`` when there is no message ``uid``, or an error dict.
+    """
+    structure = yield from _structure_flow(uid, folder, timeout)
+    if isinstance(structure, dict):
+        return structure
+    uidvalidity, attributes = structure
+    if attributes is None:
+        return None
+
+    parts = body_parts(attributes["BODYSTRUCTURE"])
+    text_part = choose_text_part(parts)
+    logger.debug("[DETAIL] %s/%s has %d part(s), text part: %s", folder, uid, len(parts), text_part)
+    raw = b""
+    if text_part is not None:
+        raw = yield from _part_flow(uid, text_part, max_bytes, timeout)
+        if raw is None:
+            return {"error": mail_service.GENERIC_FETCH_ERROR}
+    return {
+        "uid": uid,
+        "folder": folder,
+        "uidvalidity": uidvalidity,
+        "header": _section_value(attributes, "BODY[HEADER"),
+        "part": text_part,
+        "raw": raw,
+        "truncated": text_part is not None and text_part.size > max_bytes,
+        "attachments": attachment_parts(parts, text_part),
+    }
+
+
+def attachment_flow(uid: int, folder: str, section: str, timeout, max_bytes: int):
+    """IMAP conversation downloading one attachment.
+
+    Returns ``(part, data)`` with the still transfer-encoded ``data``, which
+    is ``None`` when the part is larger than ``max_bytes``; ``None`` when
+    there is no such message or part, or an error dict.
+    """
+    structure = yield from _structure_flow(uid, folder, timeout)
+    if isinstance(structure, dict):
+        return structure
+    _, attributes = structure
+    if attributes is None:
+        return None
+    part = next((part for part in body_parts(attributes["BODYSTRUCTURE"]) if part.section == section), None)
+    if part is None:
+        return None
+    if part.size > max_bytes:
+        return part, None
+    data = yield from _part_flow(uid, part, max_bytes, timeout)
+    if data is None:
+        return {"error": mail_service.GENERIC_FETCH_ERROR}
+    return part, data
+
+
+def decode_detail(fetched: dict) -> dict:
+    """Turn the result of :func:`detail_flow` into the API response."""
+    detail = mail_service.header_summary(fetched["header"])
+    part = fetched["part"]
+    text = ""
+    if part is not None:
+        charset = (part.charset or "utf-8").replace('"', "")
+        header = f'Content-Type: {part.content_type}; charset="{charset}"\r\nContent-Transfer-Encoding: {part.encoding}\r\n'
+        with metrics.imap_phase_seconds.time("parse"):
+            text = code_extractor.message_text(header.encode(), fetched["raw"])
+    return {
+        "id": str(fetched["uid"]),
+        "folder": fetched["folder"],
+        "subject": detail["subject"],
+        "from": detail["from"],
+        "to": _decode_words(email.message_from_bytes(fetched["header"]).get("To", "")),
+        "date": detail["date"],
+        "code": code_extractor.extractor.extract(detail["from"], detail["subject"], text),
+        "content_type": part.content_type if part is not None else None,
+        "text": text,
+        "truncated": fetched["truncated"],
+        "attachments": [attachment.describe() for attachment in fetched["attachments"]],
+    }
+
+
+class BodyCache:
+    """Decoded message details keyed by ``(account id, folder, UIDVALIDITY, UID)``.
+
+    A UID never refers to another message while UIDVALIDITY is unchanged,
+    so entries need no expiry. The in-memory LRU is bounded by the encoded
+    size of its entries. With a ``directory``, entries are also written
+    there as files, bounded by ``disk_bytes`` (least recently read first),
+    so they survive evictions and restarts; the disk methods block.
+    """
+
+    def __init__(self, max_bytes: int = None, directory: str = None, disk_bytes: int = None):
+        self.max_bytes = app_config.MAIL_BODY_CACHE_BYTES if max_bytes is None else max_bytes
+        self.directory = app_config.MAIL_BODY_CACHE_DIR if directory is None else directory
+        self.disk_bytes = app_config.MAIL_BODY_CACHE_DISK_BYTES if disk_bytes is None else disk_bytes
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (detail, size)
+        self._size = 0
+        self._disk_lock = threading.Lock()
+        self._disk_size: Optional[int] = None  # Scanned on first write
+        self.evictions = 0
+
+    def lookup(self, key) -> Optional[dict]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def put(self, key, detail: dict, size: int):
+        if self.max_bytes <= 0 or size > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._size -= previous[1]
+            self._entries[key] = (detail, size)
+            self._size += size
+            while self._size > self.max_bytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self._size -= evicted
+                self.evictions += 1
+
+    def load(self, key) -> Optional[dict]:
+        """Read ``key`` from the disk tier and keep it in memory again."""
+        if not self.directory:
+            return None
+        path = self._path(key)
+        try:
+            with os.fdopen(os.open(path, os.O_RDONLY | O_NOFOLLOW), "rb") as f:
+                payload = f.read()
+                os.utime(f.fileno())  # Mark as recently used for trimming
+            detail = json.loads(payload)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logger.warning("[DETAIL] Failed to read cached body %s: %s", path, e)
+            return None
+        self.put(key, detail, len(payload))
+        return detail
+
+    def save(self, key, payload: bytes):
+        """Write an encoded detail to the disk tier."""
+        if not self.directory or len(payload) > self.disk_bytes:
+            return
+        path = self._path(key)
+        temporary = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            os.makedirs(self.directory, mode=0o700, exist_ok=True)
+            fd = os.open(temporary, os.O_WRONLY | os.O_CREAT | os.O_EXCL | O_NOFOLLOW, 0o600)
+            with os.fdopen(fd, "wb") as f:
+                f.write(payload)
+            # Readers see either the old or the new file, never a partial one
+            os.replace(temporary, path)
+        except OSError as e:
+            logger.warning("[DETAIL] Failed to write cached body %s: %s", path, e)
+            try:
+                os.unlink(temporary)
+            except OSError:
+                pass
+            return
+        with self._disk_lock:
+            if self._disk_size is None:
+                self._disk_size = sum(size for _, size, _ in self._disk_entries())
+            else:
+                self._disk_size += len(payload)
+            if self._disk_size > self.disk_bytes:
+                self._trim_disk()
+
+    def invalidate(self, account_id: int):
+        """Drop every cached body of ``account_id`` (memory and disk)."""
+        with self._lock:
+            for key in [key for key in self._entries if key[0] == account_id]:
+                self._size -= self._entries.pop(key)[1]
+        if not self.directory:
+            return
+        with self._disk_lock:
+            for path, _, _ in self._disk_entries(prefix=f"{account_id}-"):
+                try:
+                    os.unlink(path)
+                except OSError:
+                    pass
+            self._disk_size = None
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._size,
+                "max_bytes": self.max_bytes,
+                "evictions": self.evictions,
+                "disk_bytes": self._disk_size,
+                "disk_max_bytes": self.disk_bytes if self.directory else 0,
+            }
+
+    def _trim_disk(self):
+        # Remove the least recently used files until 90% of the limit is free
+        entries = sorted(self._disk_entries(), key=lambda entry: entry[2])
+        total = sum(size for _, size, _ in entries)
+        for path, size, _ in entries:
+            if total <= self.disk_bytes * 0.9:
+                break
+            try:
+                os.unlink(path)
+                total -= size
+            except OSError:
+                pass
+        self._disk_size = total
+
+    def _disk_entries(self, prefix: str = ""):
+        """``(path, size, mtime)`` of the files in the disk tier."""
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return []
+        entries = []
+        for name in names:
+            if not name.endswith(".json") or not name.startswith(prefix):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                stat = os.stat(path, follow_symlinks=False)
+            except OSError:
+                continue
+            entries.append((path, stat.st_size, stat.st_mtime))
+        return entries
+
+    def _path(self, key) -> str:
+        digest = hashlib.sha1(json.dumps(key).encode()).hexdigest()
+        # The account prefix lets invalidate() find an account's files
+        return os.path.join(self.directory, f"{key[0]}-{digest}.json")
+
+
+cache = BodyCache()
+
+
+async def _decode(fn, size: int, *args):
+    # Small parts decode faster than a thread hand-off
+    if size > app_config.MAIL_BODY_THREAD_BYTES:
+        return await asyncio.to_thread(fn, *args)
+    return fn(*args)
+
+
+def known_uidvalidity(db: Session, account_id: int, folder: str) -> Optional[int]:
+    state = crud.get_mailbox_sync_state(db, account_id, folder)
+    return state.uidvalidity if state is not None else None
+
+
+async def cached_detail(account_id: int, folder: str, uidvalidity: Optional[int], uid: int) -> Optional[dict]:
+    if uidvalidity is None:
+        return None
+    key = (account_id, folder, uidvalidity, uid)
+    detail = cache.lookup(key)
+    if detail is not None:
+        metrics.message_body_lookups.inc("memory")
+        return detail
+    if cache.directory:
+        detail = await asyncio.to_thread(cache.load, key)
+        if detail is not None:
+            metrics.message_body_lookups.inc("disk")
+            return detail
+    return None
+
+
+async def fetch_message_detail(
+    config, uid: int, folder: str = imap_pool.DEFAULT_MAILBOX, db: Session = None, timeout: int = None
+):
+    """Detail of message ``uid`` in ``folder``: headers, body text and attachment list.
+
+    Served from the body cache when the folder's UIDVALIDITY is known from
+    the last mailbox sync. Returns ``None`` when the message does not exist
+    and ``{"error": ...}`` when it could not be fetched. Concurrent calls
+    for the same message share one IMAP conversation.
+    """
+    uidvalidity = await database.run_sync(db, known_uidvalidity, config.id, folder) if db else None
+    detail = await cached_detail(config.id, folder, uidvalidity, uid)
+    if detail is not None:
+        logger.info("[DETAIL] Returning cached body of %s/%s for account: %s", folder, uid, config.email)
+        return detail
+    return await _inflight.do_async(("detail", config.id, folder, uid), _fetch_message_detail, config, uid, folder, timeout)
+
+
+async def _fetch_message_detail(config, uid: int, folder: str, timeout):
+    if timeout is None:
+        timeout = app_config.IMAP_TIMEOUT
+    logger.info("[DETAIL] Fetching %s/%s for account: %s", folder, uid, config.email)
+    metrics.message_body_lookups.inc("miss")
+
+    def flow(capabilities):
+        return detail_flow(uid, folder, timeout, app_config.MAIL_BODY_MAX_BYTES)
+
+    completed, fetched = await mail_service.run_pooled_flow_async(config, flow, timeout)
+    if not completed or fetched is None or "error" in fetched:
+        return fetched
+
+    detail = await _decode(decode_detail, len(fetched["raw"]), fetched)
+    if fetched["uidvalidity"] is not None:
+        key = (config.id, folder, fetched["uidvalidity"], uid)
+        payload = json.dumps(detail, ensure_ascii=False).encode()
+        cache.put(key, detail, len(payload))
+        if cache.directory:
+            await asyncio.to_thread(cache.save, key, payload)
+    logger.info(
+        "[DETAIL] Fetched %s/%s - part: %s, %d byte(s), attachments: %d",
+        folder, uid, detail["content_type"], len(fetched["raw"]), len(detail["attachments"]),
+    )
+    return detail
+
+
+async def fetch_attachment(config, uid: int, section: str, folder: str = imap_pool.DEFAULT_MAILBOX, timeout: int = None):
+    """Download one attachment; see :func:`attachment_flow` for the results.
+
+    The returned data is decoded from its transfer encoding.
+    """
+    if not SECTION_PATTERN.match(section):
+        return None
+    if timeout is None:
+        timeout = app_config.IMAP_TIMEOUT
+    logger.info("[DETAIL] Fetching attachment %s of %s/%s for account: %s", section, folder, uid, config.email)
+
+    def flow(capabilities):
+        return attachment_flow(uid, folder, section, timeout, app_config.MAIL_ATTACHMENT_MAX_BYTES)
+
+    completed, fetched = await mail_service.run_pooled_flow_async(config, flow, timeout)
+    if not completed or not isinstance(fetched, tuple):
+        return fetched
+    part, data = fetched
+    if data is None:
+        return part, None
+    try:
+        return part, await _decode(decode_transfer, len(data), data, part.encoding)
+    except ValueError as e:
+        logger.warning("[DETAIL] Failed to decode attachment %s of %s/%s: %s", section, folder, uid, e)
+        return {"error": mail_service.GENERIC_FETCH_ERROR}
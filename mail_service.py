@@ -1,23 +1,58 @@
 import imaplib
 import email
+import hashlib
 import json
 import re
 from email.header import decode_header
-from datetime import datetime, timezone, timedelta
+from datetime import date, datetime, timezone, timedelta
 import logging
 import socket
+import time
 from typing import List
+from sqlalchemy import inspect, text
 from sqlalchemy.orm import Session
+import circuit_breaker
+import code_extractor
 import crud
+import database
+import imap_pool
+import metrics
 import models
+import shared_cache
 import config as app_config
+from aioimap import ImapAbort, ImapError
+from singleflight import SingleFlight
 
 logger = logging.getLogger(__name__)
 
 GENERIC_TIMEOUT_ERROR = "邮件服务超时，请稍后再试"
 GENERIC_CONNECTION_ERROR = "无法连接邮件服务器，请稍后重试"
 GENERIC_FETCH_ERROR = "获取邮件失败，请稍后再试"
+GENERIC_UNAVAILABLE_ERROR = "邮件服务器暂时不可用，请稍后再试"
+GENERIC_AUTH_ERROR = "邮箱登录失败，请检查账户配置"
 FILTER_SPLIT_PATTERN = re.compile(r"[,\n;]+")
+FOLDER_SPLIT_PATTERN = re.compile(r"[,\n]+")
+if app_config.CODE_FETCH_BYTES > 0:
+    # Content headers and the first bytes of the body come back in the same
+    # round trip so the verification code can be extracted without RFC822
+    HEADER_FETCH_ITEMS = (
+        "(UID BODY.PEEK[HEADER.FIELDS (SUBJECT FROM DATE CONTENT-TYPE CONTENT-TRANSFER-ENCODING)] "
+        f"BODY.PEEK[TEXT]<0.{app_config.CODE_FETCH_BYTES}>)"
+    )
+else:
+    HEADER_FETCH_ITEMS = "(UID BODY.PEEK[HEADER.FIELDS (SUBJECT FROM DATE)])"
+UID_PATTERN = re.compile(rb"\bUID (\d+)")
+ESEARCH_ITEM_PATTERN = re.compile(rb"\b(MIN|MAX|COUNT|ALL) ([0-9:,]+)", re.IGNORECASE)
+IMAP_MONTHS = ("Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov", "Dec")
+SINCE_WINDOW_GROWTH = 4
+FETCH_START_PATTERN = re.compile(rb"^\d+ \(")
+FETCH_SECTION_PATTERN = re.compile(rb"BODY\[([^\]]*)\](?:<\d+>)? \{\d+\}$")
+STATUS_ITEMS = "(MESSAGES UIDNEXT UIDVALIDITY)"
+CONDSTORE_STATUS_ITEMS = "(MESSAGES UIDNEXT UIDVALIDITY HIGHESTMODSEQ)"
+STATUS_ITEM_PATTERN = re.compile(rb"\b(MESSAGES|UIDNEXT|UIDVALIDITY|HIGHESTMODSEQ) (\d+)", re.IGNORECASE)
+SORTABLE_DATE_PATTERN = re.compile(r"^\d{4}/\d{2}/\d{2} \d{2}:\d{2}:\d{2}$")
+
+_inflight = SingleFlight()
 
 def parse_sender_filters(raw_value: str) -> List[str]:
     if not raw_value:
@@ -27,17 +62,333 @@ def parse_sender_filters(raw_value: str) -> List[str]:
     parts = FILTER_SPLIT_PATTERN.split(str(raw_value))
     return [part.strip() for part in parts if part.strip()]
 
+def normalize_folder(name: str) -> str:
+    # INBOX is case-insensitive (RFC 3501); every other name is kept as is
+    name = name.strip()
+    return imap_pool.DEFAULT_MAILBOX if name.upper() == imap_pool.DEFAULT_MAILBOX else name
+
+
+def account_folders(config: models.EmailAccount) -> List[str]:
+    """Folders searched for ``config``: its own list, else ``MAIL_FOLDERS``."""
+    raw_value = getattr(config, "folders", None) or app_config.MAIL_FOLDERS
+    folders = []
+    for part in FOLDER_SPLIT_PATTERN.split(raw_value or ""):
+        folder = normalize_folder(part)
+        if folder and folder not in folders:
+            folders.append(folder)
+    return folders or [imap_pool.DEFAULT_MAILBOX]
+
 def build_sender_search_query(filters: List[str]) -> str:
+    """``FROM`` terms joined by ``OR`` as a balanced tree.
+
+    A left-deep chain nests one level per filter; pairing terms keeps the
+    nesting at log2(n), which servers parse and evaluate faster.
+    """
     def escape_value(value: str) -> str:
         return value.replace('"', r'\"')
 
-    if len(filters) == 1:
-        return f'(FROM "{escape_value(filters[0])}")'
+    terms = [f'(FROM "{escape_value(value)}")' for value in filters]
+    while len(terms) > 1:
+        paired = [f"(OR {terms[i]} {terms[i + 1]})" for i in range(0, len(terms) - 1, 2)]
+        if len(terms) % 2:
+            paired.append(terms[-1])
+        terms = paired
+    return terms[0]
+
+
+def imap_date(day) -> str:
+    """``DD-Mon-YYYY`` for SEARCH SINCE, independent of the locale."""
+    return f"{day.day}-{IMAP_MONTHS[day.month - 1]}-{day.year}"
+
+
+def parse_search_uids(messages) -> List[int]:
+    return sorted(int(uid) for uid in (messages[0] or b"").split())
+
+
+def parse_status(data) -> dict:
+    """``{"MESSAGES": n, "UIDNEXT": n, ...}`` from a STATUS response."""
+    raw = b" ".join(item for item in data if isinstance(item, bytes))
+    return {key.decode().upper(): int(value) for key, value in STATUS_ITEM_PATTERN.findall(raw)}
+
+
+def status_items(capabilities) -> str:
+    # HIGHESTMODSEQ may only be requested from servers advertising CONDSTORE (RFC 7162)
+    return CONDSTORE_STATUS_ITEMS if "CONDSTORE" in capabilities else STATUS_ITEMS
+
+
+def parse_esearch(data) -> dict:
+    """Return the ``MIN``/``MAX``/``COUNT``/``ALL`` items of an ESEARCH response."""
+    raw = b" ".join(item for item in data if isinstance(item, bytes))
+    return {key.decode().upper(): value.decode() for key, value in ESEARCH_ITEM_PATTERN.findall(raw)}
+
+
+def newest_in_sequence_set(sequence_set: str, count: int) -> List[int]:
+    """The ``count`` highest numbers of ``1:5,9,12:20`` without expanding it all."""
+    ranges = []
+    for part in filter(None, sequence_set.split(",")):
+        low, _, high = part.partition(":")
+        low, high = int(low), int(high or low)
+        ranges.append((min(low, high), max(low, high)))
+    newest = []
+    for low, high in sorted(ranges, key=lambda item: item[1], reverse=True):
+        for uid in range(high, max(low, high - count) - 1, -1):
+            if len(newest) >= count:
+                return sorted(newest)
+            newest.append(uid)
+    return sorted(newest)
+
+
+def group_fetch_responses(msg_data):
+    """Split a FETCH response into one ``(prefixes, sections)`` pair per message.
+
+    A message with several literals (e.g. headers and a partial body) comes
+    back as one tuple per literal; only the first starts with the sequence
+    number. ``sections`` maps the section name (``HEADER.FIELDS (...)``,
+    ``TEXT``) to its literal. ``prefixes`` also holds the trailing bytes,
+    where some servers put ``UID n``.
+    """
+    messages = []
+    current = None
+    for response_part in msg_data:
+        if isinstance(response_part, tuple):
+            prefix = response_part[0]
+            if isinstance(prefix, str):
+                prefix = prefix.encode()
+            if current is None or FETCH_START_PATTERN.match(prefix):
+                current = ([], {})
+                messages.append(current)
+            current[0].append(prefix)
+            section = FETCH_SECTION_PATTERN.search(prefix)
+            name = section.group(1).decode().upper() if section else "HEADER"
+            current[1][name.split(" ")[0]] = response_part[1]
+        elif current is not None and isinstance(response_part, bytes):
+            current[0].append(response_part)
+    return messages
+
+
+def _fetch_response_id(prefixes) -> str:
+    """UID of a FETCH response if the server sent one, else its sequence number."""
+    for candidate in prefixes:
+        match = UID_PATTERN.search(candidate or b"")
+        if match:
+            return match.group(1).decode()
+    return prefixes[0].decode().split()[0]
+
+
+def header_summary(header: bytes) -> dict:
+    """``{"subject", "from", "date"}`` of a message from its header fields."""
+    msg = email.message_from_bytes(header)
+    email_content = {"subject": "Unknown", "from": "", "date": ""}
+
+    raw_subject = msg.get("Subject")
+    if raw_subject:
+        subject, encoding = decode_header(raw_subject)[0]
+        if isinstance(subject, bytes):
+            subject = subject.decode(encoding if encoding else "utf-8", errors="ignore")
+        email_content["subject"] = subject
+
+    email_content["from"] = msg.get("From", "")
+
+    raw_date = msg.get("Date")
+    formatted_date = raw_date
+    try:
+        if raw_date:
+            parsed_date = email.utils.parsedate_to_datetime(raw_date)
+            # Convert to GMT+8 timezone
+            gmt8_tz = timezone(timedelta(hours=8))
+            gmt8_date = parsed_date.astimezone(gmt8_tz)
+            formatted_date = gmt8_date.strftime("%Y/%m/%d %H:%M:%S")
+    except:
+        pass
+
+    email_content["date"] = formatted_date or ""
+    return email_content
+
+
+def parse_header_responses(msg_data) -> dict:
+    """Map message id -> summary dict from a batched header FETCH response.
+
+    Responses are keyed by UID when the FETCH was a ``UID FETCH`` and by
+    sequence number otherwise. When the partial body was fetched too, the
+    summary carries the extracted verification ``code`` (``None`` if no
+    pattern matched).
+    """
+    headers_map = {}
+    for prefixes, sections in group_fetch_responses(msg_data):
+        header = sections.get("HEADER.FIELDS") or sections.get("HEADER")
+        if not header:
+            continue
+        response_id = _fetch_response_id(prefixes)
+        email_content = header_summary(header)
+        email_content["id"] = response_id
+        if "TEXT" in sections:
+            body_text = code_extractor.message_text(header, sections["TEXT"] or b"")
+            email_content["code"] = code_extractor.extractor.extract(
+                email_content["from"], email_content["subject"], body_text
+            )
+        headers_map[response_id] = email_content
+    return headers_map
+
+
+def load_cached_result(db: Session, account_id: int, limit: int = None, folder: str = imap_pool.DEFAULT_MAILBOX):
+    """Read the sync state and newest cached messages of one folder.
+
+    Returns ``{"filters", "ids", "uidvalidity", "last_uid", "uidnext",
+    "message_count", "search_limit", "highestmodseq", "payload"}`` where ``ids`` are the
+    UIDs of the cached messages, newest first, or ``None`` when nothing is
+    cached. A folder with no matching messages is only returned when its
+    STATUS was recorded, since that is what lets a fetch skip searching it.
+    """
+    state = crud.get_mailbox_sync_state(db, account_id, folder)
+    if state is None:
+        return None
+    rows = crud.get_cached_messages(db, account_id, limit, folder)
+    if not rows and state.uidnext is None:
+        return None
+    try:
+        filters = json.loads(state.filters) if state.filters else []
+    except json.JSONDecodeError:
+        filters = []
+    return {
+        "filters": filters,
+        "ids": [str(row.uid) for row in rows],
+        "uidvalidity": state.uidvalidity,
+        "last_uid": state.last_uid,
+        "uidnext": state.uidnext,
+        "message_count": state.message_count,
+        "search_limit": state.search_limit,
+        "highestmodseq": state.highestmodseq,
+        "payload": [
+            {"subject": row.subject, "from": row.sender, "date": row.date, "id": str(row.uid), "code": row.code}
+            for row in rows
+        ],
+    }
+
+
+def load_folder_caches(db: Session, account_id: int, folders: List[str], limit: int = None) -> dict:
+    """:func:`load_cached_result` of each folder, keyed by folder."""
+    return {folder: load_cached_result(db, account_id, limit, folder) for folder in folders}
+
+
+def _decode_legacy_cache(cache_entry):
+    """Decode a JSON ``EmailCache`` row into the ``load_cached_result`` shape."""
+    if not cache_entry.message_ids or not cache_entry.payload:
+        return None
+    try:
+        cached_data = json.loads(cache_entry.message_ids)
+        payload = json.loads(cache_entry.payload)
+    except json.JSONDecodeError:
+        return None
+    if not isinstance(cached_data, dict) or cached_data.get("uidvalidity") is None:
+        # Written before UID sync: ids are sequence numbers, nothing to keep
+        return None
+    if not all(str(item.get("id", "")).isdigit() for item in payload):
+        return None
+    return {
+        "filters": cached_data.get("filters") or [],
+        "ids": cached_data.get("ids") or [],
+        "uidvalidity": cached_data.get("uidvalidity"),
+        "last_uid": cached_data.get("last_uid"),
+        "payload": payload,
+    }
+
+
+def migrate_sync_state(db: Session) -> int:
+    """Copy rows of the per-account ``mailbox_sync_state`` table into the
+    per-folder one (as INBOX) and drop it. Returns the number of rows copied.
+    """
+    if "mailbox_sync_state" not in inspect(db.get_bind()).get_table_names():
+        return 0
+    copied = db.execute(
+        text(
+            "INSERT INTO folder_sync_state (account_id, folder, filters, uidvalidity, last_uid, updated_at) "
+            "SELECT account_id, :folder, filters, uidvalidity, last_uid, updated_at FROM mailbox_sync_state "
+            "WHERE account_id NOT IN (SELECT account_id FROM folder_sync_state WHERE folder = :folder)"
+        ),
+        {"folder": imap_pool.DEFAULT_MAILBOX},
+    ).rowcount
+    db.execute(text("DROP TABLE mailbox_sync_state"))
+    db.commit()
+    return copied
+
+
+def migrate_legacy_cache(db: Session) -> int:
+    """Move JSON ``EmailCache`` rows into the per-message cache tables.
+
+    Each legacy row is deleted once handled, so this is a no-op after the
+    first run. Returns the number of accounts migrated.
+    """
+    migrated = 0
+    for cache_entry in crud.list_email_caches(db):
+        cached = _decode_legacy_cache(cache_entry)
+        if cached and crud.get_mailbox_sync_state(db, cache_entry.account_id) is None:
+            if app_config.CODE_FETCH_BYTES > 0 and any("code" not in item for item in cached["payload"]):
+                # Cached before code extraction: keep the rows but resync them once
+                cached["uidvalidity"] = None
+            store_cached_result(db, cache_entry.account_id, cached)
+            migrated += 1
+        crud.delete_email_cache(db, cache_entry)
+    return migrated
+
+
+def cache_matches_filters(cached: dict, target_filters: List[str], provided_filters: List[str]) -> bool:
+    if cached["filters"]:
+        return cached["filters"] == target_filters
+    return not provided_filters
+
+
+def store_cached_result(db: Session, account_id: int, cached: dict, folder: str = imap_pool.DEFAULT_MAILBOX):
+    messages = [
+        {
+            "uid": int(item["id"]),
+            "subject": item.get("subject"),
+            "sender": item.get("from"),
+            "date": item.get("date"),
+            "code": item.get("code"),
+        }
+        for item in cached["payload"]
+    ]
+    return crud.save_mailbox_cache(
+        db,
+        account_id,
+        json.dumps(cached["filters"], ensure_ascii=False),
+        cached["uidvalidity"],
+        cached["last_uid"],
+        messages,
+        folder,
+        cached.get("uidnext"),
+        cached.get("message_count"),
+        cached.get("search_limit"),
+        cached.get("highestmodseq"),
+    )
+
+
+def result_etag(account_id: int, target_filters: List[str], emails: list) -> str:
+    """Strong ETag for a message list returned for ``target_filters``.
+
+    Built from the same fields the cache stores (UIDs, subject, sender,
+    date, code), so a result served from the cache and one fetched over
+    IMAP get the same tag when nothing changed.
+    """
+    digest = hashlib.sha256(
+        json.dumps([account_id, target_filters, emails], ensure_ascii=False, sort_keys=True).encode()
+    ).hexdigest()
+    return f'"{digest[:32]}"'
+
+
+def resolve_sender_filters(config: models.EmailAccount, sender_filter: str = None):
+    """Return ``(provided_filters, target_filters)`` for a request."""
+    provided_filters = parse_sender_filters(sender_filter) if sender_filter else []
+    default_filters = parse_sender_filters(config.default_sender_filter)
+    return provided_filters, provided_filters or default_filters
+
+
+def fetch_key(config: models.EmailAccount, sender_filter: str = None, limit: int = 5):
+    """Identity of a fetch: callers with the same key get the same result."""
+    _, target_filters = resolve_sender_filters(config, sender_filter)
+    normalized = tuple(sorted({value.lower() for value in target_filters}))
+    return config.id, normalized, limit, tuple(account_folders(config))
 
-    query = f'(FROM "{escape_value(filters[0])}")'
-    for value in filters[1:]:
-        query = f'(OR {query} (FROM "{escape_value(value)}"))'
-    return query
 
 def fetch_recent_emails(
     config: models.EmailAccount,
@@ -45,206 +396,882 @@ def fetch_recent_emails(
     limit: int = 5,
     timeout: int = None,
     db: Session = None,
+    cache_is_fresh: bool = False,
+):
+    """Fetch the newest ``limit`` matching emails.
+
+    Concurrent calls for the same account, filters and limit are coalesced
+    into a single IMAP conversation.
+    """
+    key = fetch_key(config, sender_filter, limit)
+    return _inflight.do(key, _fetch_shared, key, config, sender_filter, limit, timeout, db, cache_is_fresh)
+
+
+async def fetch_recent_emails_async(
+    config: models.EmailAccount,
+    sender_filter: str = None,
+    limit: int = 5,
+    timeout: int = None,
+    db: Session = None,
+    cache_is_fresh: bool = False,
 ):
+    """Asyncio version of :func:`fetch_recent_emails`.
+
+    IMAP I/O runs on the event loop through the async session pool; only the
+    short cache reads/writes go through ``database.run_sync``.
+    """
+    key = fetch_key(config, sender_filter, limit)
+    return await _inflight.do_async(
+        key, _fetch_shared_async, key, config, sender_filter, limit, timeout, db, cache_is_fresh,
+    )
+
+
+def _shared_result_name(key) -> str:
+    return "result:" + json.dumps(key)
+
+
+def _shared_result(key, config):
+    result = shared_cache.cache.get(_shared_result_name(key), config.id, app_config.SHARED_RESULT_TTL)
+    if result is not None:
+        logger.info("[MAIL] Returning result shared by another worker for account: %s", config.email)
+        metrics.mail_cache_lookups.inc("shared")
+    return result
+
+
+def _share_result(key, config, result, generation: int):
+    if isinstance(result, list):
+        shared_cache.cache.put(_shared_result_name(key), config.id, result, generation)
+
+
+def _fetch_shared(key, config, sender_filter, limit, timeout, db, cache_is_fresh):
+    # Single-flight coalesces callers within this process; the shared cache
+    # and its lease do the same across worker processes.
+    if cache_is_fresh:
+        # This worker's IDLE watcher keeps the database cache current already
+        return _fetch_recent_emails(config, sender_filter, limit, timeout, db, cache_is_fresh)
+    result = _shared_result(key, config)
+    if result is not None:
+        return result
+    wait = app_config.IMAP_TIMEOUT if timeout is None else timeout
+    with shared_cache.cache.lease(_shared_result_name(key), wait) as waited:
+        result = _shared_result(key, config) if waited else None
+        if result is not None:
+            return result
+        generation = shared_cache.cache.generation(config.id)
+        result = _fetch_recent_emails(config, sender_filter, limit, timeout, db, cache_is_fresh)
+        _share_result(key, config, result, generation)
+        return result
+
+
+async def _fetch_shared_async(key, config, sender_filter, limit, timeout, db, cache_is_fresh):
+    if cache_is_fresh:
+        # This worker's IDLE watcher keeps the database cache current already
+        return await _fetch_recent_emails_async(config, sender_filter, limit, timeout, db, cache_is_fresh)
+    result = _shared_result(key, config)
+    if result is not None:
+        return result
+    wait = app_config.IMAP_TIMEOUT if timeout is None else timeout
+    async with shared_cache.cache.lease_async(_shared_result_name(key), wait) as waited:
+        result = _shared_result(key, config) if waited else None
+        if result is not None:
+            return result
+        generation = shared_cache.cache.generation(config.id)
+        result = await _fetch_recent_emails_async(config, sender_filter, limit, timeout, db, cache_is_fresh)
+        _share_result(key, config, result, generation)
+        return result
+
+
+def _fetch_recent_emails(config, sender_filter, limit, timeout, db, cache_is_fresh):
     # Use configured timeout if not specified
     if timeout is None:
         timeout = app_config.IMAP_TIMEOUT
 
-    provided_filters = parse_sender_filters(sender_filter) if sender_filter else []
-    default_filters = parse_sender_filters(config.default_sender_filter)
-    target_filters = provided_filters or default_filters
+    provided_filters, target_filters = resolve_sender_filters(config, sender_filter)
+    logger.info(
+        "[MAIL] fetch_recent_emails started - email: %s, sender_filters: %s, timeout: %ss",
+        config.email, target_filters, timeout,
+    )
+
+    folders = account_folders(config)
+    cached = load_folder_caches(db, config.id, folders, limit) if db else {}
+    early_result = _check_before_fetch(
+        config, target_filters, provided_filters, cached.get(folders[0]), cache_is_fresh and _watched(folders)
+    )
+    if early_result is not None:
+        return early_result
+    stale = _stale_folders(cached, folders, target_filters, provided_filters, limit)
+    unavailable = _check_availability(config, stale)
+    if unavailable is not None:
+        return unavailable
+
+    # A pooled session may have been dropped by the server since its last
+    # use; in that case retry once on a freshly opened connection.
+    for attempt in range(2):
+        try:
+            logger.debug("[MAIL] Acquiring IMAP session for: %s (timeout: %ss)", config.imap_server, timeout)
+            session = imap_pool.pool.acquire(config, timeout)
+            logger.debug("[MAIL] IMAP session ready (reused: %s)", session.reused)
+        except Exception as e:
+            return _connection_error(e, config, timeout, stale)
+
+        flow = mailbox_flow(
+            config, folders, target_filters, provided_filters, limit, timeout, cached, session.capabilities
+        )
+        try:
+            with metrics.fetches_in_flight.track_inprogress():
+                result, cache_updates = run_flow(flow, session)
+        except Exception as e:
+            imap_pool.pool.release(session, discard=True)
+            if _should_retry(e, session, attempt):
+                continue
+            return _fetch_error(e, config, timeout, stale)
+
+        imap_pool.pool.release(session)
+        circuit_breaker.breaker.record_success(config.imap_server)
+        if cache_updates and db:
+            store_cache_updates(db, config.id, cache_updates)
+        return result
+
 
+async def _fetch_recent_emails_async(config, sender_filter, limit, timeout, db, cache_is_fresh):
+    if timeout is None:
+        timeout = app_config.IMAP_TIMEOUT
+
+    provided_filters, target_filters = resolve_sender_filters(config, sender_filter)
     logger.info(
-        f"[MAIL] fetch_recent_emails started - email: {config.email}, "
-        f"sender_filters: {target_filters}, timeout: {timeout}s"
+        "[MAIL] fetch_recent_emails_async started - email: %s, sender_filters: %s, timeout: %ss",
+        config.email, target_filters, timeout,
+    )
+
+    folders = account_folders(config)
+    cached = await database.run_sync(db, load_folder_caches, config.id, folders, limit) if db else {}
+    early_result = _check_before_fetch(
+        config, target_filters, provided_filters, cached.get(folders[0]), cache_is_fresh and _watched(folders)
     )
+    if early_result is not None:
+        return early_result
+    stale = _stale_folders(cached, folders, target_filters, provided_filters, limit)
+
+    def flow(capabilities):
+        return mailbox_flow(config, folders, target_filters, provided_filters, limit, timeout, cached, capabilities)
+
+    completed, outcome = await run_pooled_flow_async(config, flow, timeout, stale)
+    if not completed:
+        return outcome
+    result, cache_updates = outcome
+    if cache_updates and db:
+        await database.run_sync(db, store_cache_updates, config.id, cache_updates)
+    return result
+
+
+async def run_pooled_flow_async(config, make_flow, timeout, stale=None):
+    """Run ``make_flow(capabilities)`` on a pooled asyncio session of ``config``.
+
+    Handles the circuit breaker, rejected logins and a retry on a pooled
+    session the server dropped. Returns ``(True, flow result)``, or
+    ``(False, error result)`` where ``stale`` is served along with the error.
+    """
+    unavailable = _check_availability(config, stale)
+    if unavailable is not None:
+        return False, unavailable
+
+    for attempt in range(2):
+        try:
+            logger.debug("[MAIL] Acquiring async IMAP session for: %s (timeout: %ss)", config.imap_server, timeout)
+            session = await imap_pool.async_pool.acquire(config, timeout)
+            logger.debug("[MAIL] IMAP session ready (reused: %s)", session.reused)
+        except Exception as e:
+            return False, _connection_error(e, config, timeout, stale)
+
+        try:
+            with metrics.fetches_in_flight.track_inprogress():
+                outcome = await run_flow_async(make_flow(session.capabilities), session)
+        except Exception as e:
+            await imap_pool.async_pool.release(session, discard=True)
+            if _should_retry(e, session, attempt):
+                continue
+            return False, _fetch_error(e, config, timeout, stale)
 
-    cache_entry = crud.get_email_cache(db, config.id) if db else None
+        await imap_pool.async_pool.release(session)
+        circuit_breaker.breaker.record_success(config.imap_server)
+        return True, outcome
 
+
+def _check_before_fetch(config, target_filters, provided_filters, cached, cache_is_fresh):
+    """Return a result that makes the IMAP round trips unnecessary, if any."""
     if not target_filters:
         logger.warning("[MAIL] No sender filter specified")
         return {"error": "No sender filter specified"}
+
+    # A background IDLE watcher keeps the cache current for this account
+    if cache_is_fresh:
+        if cached and cache_matches_filters(cached, target_filters, provided_filters):
+            logger.info("[MAIL] Returning watcher-maintained cache for account: %s", config.email)
+            metrics.mail_cache_lookups.inc("watcher")
+            return _cached_result(cached, target_filters)
+    return None
+
+
+def _watched(folders: List[str]) -> bool:
+    # IDLE watchers only keep the INBOX cache current
+    return folders == [imap_pool.DEFAULT_MAILBOX]
+
+
+def _auth_key(config):
+    key = imap_pool.account_key(config.email, config.imap_server)
+    return key, imap_pool.generation(key)
+
+
+def _stale_source(cached, target_filters, provided_filters):
+    """Cached payload that may stand in for a failed fetch, if any."""
+    if cached and cached["payload"] and cache_matches_filters(cached, target_filters, provided_filters):
+        return cached["payload"]
+    return None
+
+
+def _cached_result(cached: dict, target_filters: List[str], limit: int = None):
+    # A folder can be cached with no matching messages once its STATUS was recorded
+    if not cached["payload"]:
+        return {"message": f"No emails found from {', '.join(target_filters)}"}
+    return cached["payload"][:limit]
+
+
+def _stale_folders(cached: dict, folders: List[str], target_filters, provided_filters, limit: int):
+    """Cached messages of ``folders`` that may stand in for a failed fetch, if any."""
+    if len(folders) == 1:
+        return _stale_source(cached.get(folders[0]), target_filters, provided_filters)
+    sources = {folder: _stale_source(cached.get(folder), target_filters, provided_filters) for folder in folders}
+    if all(not source for source in sources.values()):
+        return None
+    return merge_folder_results(folders, sources, limit, target_filters)
+
+
+def _failure(error_message: str, stale=None) -> dict:
+    if stale is None:
+        return {"error": error_message}
+    # Serve the last known list, flagged so callers can tell it is not current
+    return {"error": error_message, "stale": True, "messages": stale}
+
+
+def _check_availability(config, stale=None):
+    """Fail fast for rejected credentials or a host whose circuit is open."""
+    if circuit_breaker.auth_failures.get(_auth_key(config)) is not None:
+        logger.warning("[MAIL] Skipping login for %s, credentials were recently rejected", config.email)
+        return {"error": GENERIC_AUTH_ERROR}
+    if not circuit_breaker.breaker.allow(config.imap_server):
+        retry_after = circuit_breaker.breaker.retry_after(config.imap_server)
+        logger.warning("[MAIL] Circuit open for %s, failing fast (retry in %.0fs)", config.imap_server, retry_after)
+        metrics.imap_errors.inc(config.imap_server, "circuit_open")
+        return _failure(GENERIC_UNAVAILABLE_ERROR, stale)
+    return None
+
+
+def _is_auth_error(error: Exception) -> bool:
+    # A tagged NO/BAD to LOGIN; aborts and socket errors are host failures
+    if isinstance(error, (imaplib.IMAP4.abort, ImapAbort)):
+        return False
+    return isinstance(error, (imaplib.IMAP4.error, ImapError))
+
+
+def _is_host_failure(error: Exception) -> bool:
+    return isinstance(error, (socket.timeout, OSError, imaplib.IMAP4.abort, ImapAbort))
+
+
+def _connection_error(error: Exception, config, timeout, stale=None):
+    if _is_auth_error(error):
+        # The server answered, so the host itself is healthy
+        circuit_breaker.breaker.record_success(config.imap_server)
+        circuit_breaker.auth_failures.put(_auth_key(config), str(error))
+        metrics.imap_errors.inc(config.imap_server, "auth")
+        logger.error("[MAIL] Login rejected for %s on %s: %s", config.email, config.imap_server, error)
+        return {"error": GENERIC_AUTH_ERROR}
+
+    circuit_breaker.breaker.record_failure(config.imap_server)
+    metrics.imap_errors.inc(config.imap_server, "timeout" if isinstance(error, socket.timeout) else "connection")
+    if isinstance(error, socket.timeout):
+        logger.error("[MAIL] IMAP connection/login timeout after %ss - Failed to connect or authenticate to %s", timeout, config.imap_server)
+        return _failure(GENERIC_TIMEOUT_ERROR, stale)
+    logger.error("[MAIL] Connection/Login failed: %s", error)
+    return _failure(GENERIC_CONNECTION_ERROR, stale)
+
+
+def _fetch_error(error: Exception, config, timeout, stale=None):
+    if not _is_host_failure(error):
+        # A protocol-level error still means the server is responding
+        circuit_breaker.breaker.record_success(config.imap_server)
+        metrics.imap_errors.inc(config.imap_server, "fetch")
+        logger.error("[MAIL] Error fetching mail: %s", error)
+        return {"error": GENERIC_FETCH_ERROR}
+
+    circuit_breaker.breaker.record_failure(config.imap_server)
+    metrics.imap_errors.inc(config.imap_server, "timeout" if isinstance(error, socket.timeout) else "connection")
+    if isinstance(error, socket.timeout):
+        error_msg = f"IMAP operation timeout after {timeout}s - Check network connection and IMAP server responsiveness"
+        logger.error("[MAIL] %s", error_msg)
+        return _failure(GENERIC_TIMEOUT_ERROR, stale)
+    logger.error("[MAIL] Error fetching mail: %s", error)
+    return _failure(GENERIC_FETCH_ERROR, stale)
+
 
+def _should_retry(error: Exception, session, attempt: int) -> bool:
+    if attempt > 0 or not session.reused or isinstance(error, socket.timeout):
+        return False
+    if not isinstance(error, (imaplib.IMAP4.abort, ImapAbort, OSError)):
+        return False
+    logger.warning("[MAIL] Pooled session dropped by server (%s), reconnecting", error)
+    return True
+
+
+def store_cache_updates(db: Session, account_id: int, cache_updates: dict):
+    """Write the cache updates of a flow, keyed by folder."""
     try:
-        logger.info(f"[MAIL] Connecting to IMAP server: {config.imap_server} (timeout: {timeout}s)")
-        # Create IMAP connection with timeout
-        mail = imaplib.IMAP4_SSL(config.imap_server, timeout=timeout)
-        logger.info("[MAIL] IMAP connection established, attempting login...")
+        with metrics.imap_phase_seconds.time("cache_write"):
+            for folder, cache_update in cache_updates.items():
+                if "payload" in cache_update:
+                    store_cached_result(db, account_id, cache_update, folder)
+                else:
+                    crud.update_mailbox_status(
+                        db,
+                        account_id,
+                        folder,
+                        cache_update["uidnext"],
+                        cache_update["message_count"],
+                        cache_update.get("highestmodseq"),
+                    )
+    except Exception as cache_error:
+        logger.warning("[MAIL] Failed to update email cache: %s", cache_error)
 
-        # Set socket timeout for all subsequent operations
-        if hasattr(mail, 'sock') and mail.sock:
-            mail.sock.settimeout(timeout)
 
-        mail.login(config.email, config.password)
-        logger.info("[MAIL] Login successful")
-    except socket.timeout:
-        logger.error(f"[MAIL] IMAP connection/login timeout after {timeout}s - Failed to connect or authenticate to {config.imap_server}")
-        return {"error": GENERIC_TIMEOUT_ERROR}
-    except Exception as e:
-        logger.error(f"[MAIL] Connection/Login failed: {str(e)}")
-        return {"error": GENERIC_CONNECTION_ERROR}
+def _dispatch(session, name: str):
+    # SELECT goes through the session so an already selected mailbox is kept,
+    # STATUS so the folder name is encoded and quoted for imaplib; ESEARCH results arrive as an untagged response the session collects;
+    # pipelines are sent by the asyncio session in one round trip
+    if name in ("select", "esearch", "status", "pipeline"):
+        return getattr(session, name)
+    return getattr(session.conn, name)
+
+
+def _command_phase(name: str, args, selected: str = None) -> str:
+    """Metric label of a flow command: one of a fixed set, whatever the folders.
+
+    A round trip carrying several commands is labelled ``pipeline``; a
+    SELECT of the ``selected`` mailbox is answered without one.
+    """
+    if name == "pipeline":
+        sent = [command for command in args[0] if command[0] != "select" or command[1][:1] != (selected,)]
+        return _command_phase(*sent[0]) if len(sent) == 1 else "pipeline"
+    if name == "uid" and args:
+        return "search" if args[0] == "SEARCH" else args[0].lower()
+    return "search" if name == "esearch" else name
+
+
+def _observe_command(phase: str, elapsed: float):
+    # One observation per round trip
+    metrics.imap_phase_seconds.observe(elapsed, phase)
+    logger.debug("[MAIL] Round trip %s took %.1f ms", phase, elapsed * 1000)
+
+
+def _resume(flow, response):
+    """``yield from`` a sub-flow whose first command was already answered.
+
+    The caller took the first command with ``next(flow)`` to send it in a
+    pipeline; ``response`` is its result.
+    """
+    try:
+        command = flow.send(response)
+        while True:
+            try:
+                response = yield command
+            except Exception as exc:
+                command = flow.throw(exc)
+            else:
+                command = flow.send(response)
+    except StopIteration as stop:
+        return stop.value
+
 
+def run_flow(flow, session):
+    """Drive a fetch flow with a blocking :mod:`imaplib` session."""
     try:
-        logger.info("[MAIL] Selecting inbox...")
+        name, args = next(flow)
+        while True:
+            try:
+                response = _run_command(session, name, args)
+            except Exception as exc:
+                name, args = flow.throw(exc)
+            else:
+                name, args = flow.send(response)
+    except StopIteration as stop:
+        return stop.value
+
+
+def _run_command(session, name: str, args):
+    if name == "pipeline":
+        # imaplib waits for each tagged response, so a pipeline costs one
+        # round trip per command; each is timed under its own phase
+        return [_run_command(session, *command) for command in args[0]]
+    phase = _command_phase(name, args, session.selected)
+    started = time.perf_counter()
+    response = _dispatch(session, name)(*args)
+    _observe_command(phase, time.perf_counter() - started)
+    return response
+
+
+async def run_flow_async(flow, session):
+    """Drive a fetch flow with an asyncio session."""
+    try:
+        name, args = next(flow)
+        while True:
+            phase = _command_phase(name, args, session.selected)
+            started = time.perf_counter()
+            try:
+                response = await _dispatch(session, name)(*args)
+            except Exception as exc:
+                name, args = flow.throw(exc)
+            else:
+                _observe_command(phase, time.perf_counter() - started)
+                name, args = flow.send(response)
+    except StopIteration as stop:
+        return stop.value
+
+
+def _uid_search(query: str, timeout):
+    logger.debug("[MAIL] Searching emails with query: %s", query)
+    try:
+        status, messages = yield ("uid", ("SEARCH", query))
+        logger.debug("[MAIL] Search completed - status: %s", status)
+    except socket.timeout:
+        logger.error("[MAIL] Timeout while searching emails with query '%s' after %ss", query, timeout)
+        raise
+    return status, messages
+
+
+def _search_newest(sender_query: str, limit: int, capabilities, timeout):
+    """Sub-flow returning ``(status, uids)`` of the newest ``limit`` matches, ascending.
+
+    With ESEARCH the server answers with MAX/COUNT and the matches as a
+    compact sequence set, so no per-message list is transferred. Otherwise
+    the search is limited to a SINCE window (by internal date) that widens
+    only while fewer than ``limit`` messages match, and the whole mailbox is
+    searched as a last resort.
+    """
+    if app_config.SEARCH_USE_ESEARCH and "ESEARCH" in capabilities:
+        logger.debug("[MAIL] Searching emails with ESEARCH: %s", sender_query)
         try:
-            mail.select("inbox")
-            logger.info("[MAIL] Inbox selected")
+            status, data = yield ("esearch", (sender_query, "MAX COUNT ALL"))
         except socket.timeout:
-            logger.error(f"[MAIL] Timeout while selecting inbox after {timeout}s")
+            logger.error("[MAIL] Timeout while searching emails with ESEARCH after %ss", timeout)
             raise
+        if status == "OK":
+            result = parse_esearch(data)
+            logger.debug("[MAIL] ESEARCH completed - count: %s, max uid: %s", result.get("COUNT", "0"), result.get("MAX"))
+            return status, newest_in_sequence_set(result.get("ALL", ""), limit)
+        logger.warning("[MAIL] ESEARCH status %s, falling back to SEARCH", status)
 
-        search_query = build_sender_search_query(target_filters)
-        logger.info(f"[MAIL] Searching emails with query: {search_query}")
-        try:
-            status, messages = mail.search(None, search_query)
-            logger.info(f"[MAIL] Search completed - status: {status}")
-        except socket.timeout:
-            logger.error(f"[MAIL] Timeout while searching emails with query '{search_query}' after {timeout}s")
-            raise
-
+    days = app_config.SEARCH_SINCE_DAYS
+    while days > 0:
+        since = imap_date(date.today() - timedelta(days=days))
+        status, messages = yield from _uid_search(f"SINCE {since} {sender_query}", timeout)
         if status != "OK":
-            logger.warning("[MAIL] Search status not OK")
-            return {"message": "No emails found"}
+            return status, []
+        found_uids = parse_search_uids(messages)
+        if len(found_uids) >= limit:
+            return status, found_uids[-limit:]
+        if days >= app_config.SEARCH_SINCE_MAX_DAYS:
+            break
+        days = min(days * SINCE_WINDOW_GROWTH, app_config.SEARCH_SINCE_MAX_DAYS)
 
-        email_ids = messages[0].split()
-        logger.info(f"[MAIL] Found {len(email_ids)} email(s)")
+    status, messages = yield from _uid_search(sender_query, timeout)
+    return status, parse_search_uids(messages)[-limit:] if status == "OK" else []
 
-        if not email_ids:
-            logger.info(f"[MAIL] No emails found for filters: {target_filters}")
-            filter_desc = ", ".join(target_filters)
-            return {"message": f"No emails found from {filter_desc}"}
 
-        # Get the last N emails
-        recent_email_ids = email_ids[-limit:]
-        recent_email_ids.reverse() # Newest first
-        logger.info(f"[MAIL] Processing {len(recent_email_ids)} recent email(s)")
-
-        if not recent_email_ids:
-            return []
-
-        id_strings = [e_id.decode() for e_id in recent_email_ids if e_id]
+def _incremental_search(sender_query: str, known_uids: List[int], last_uid: int, limit: int, timeout):
+    """Sub-flow searching the cached UIDs and everything above ``last_uid``.
+
+    Returns ``(status, uids)``; ``uids`` is ``None`` when expunged messages
+    mean older matches may belong in the newest ``limit`` again.
+    """
+    # Cached UIDs tell us which cached messages still exist; the open
+    # range picks up everything that arrived since.
+    uid_set = ",".join([str(uid) for uid in sorted(known_uids)] + [f"{last_uid + 1}:*"])
+    status, messages = yield from _uid_search(f"UID {uid_set} {sender_query}", timeout)
+    if status != "OK":
+        return status, []
+
+    # "n:*" always matches the highest UID, even when it is below n
+    known_set = set(known_uids)
+    found_uids = [uid for uid in parse_search_uids(messages) if uid in known_set or uid > last_uid]
+    expunged = len(known_set) - sum(1 for uid in found_uids if uid in known_set)
+    if expunged and len(known_uids) >= limit and len(found_uids) < limit:
+        logger.info("[MAIL] %s cached message(s) expunged, falling back to full search", expunged)
+        return status, None
+    return status, found_uids
+
+
+def recent_emails_flow(
+    config,
+    target_filters,
+    provided_filters,
+    limit,
+    timeout,
+    cached=None,
+    capabilities=(),
+    mailbox: str = imap_pool.DEFAULT_MAILBOX,
+    record_empty: bool = False,
+):
+    """IMAP conversation for one fetch from ``mailbox``, independent of the client library.
+
+    Yields ``(command, args)`` pairs and receives the ``(typ, data)`` result
+    of each command. Returns ``(result, cache_update)`` where ``cache_update``
+    is the new cache state to store, or ``None`` when nothing changed.
+
+    When ``cached`` belongs to the same filters and UIDVALIDITY, only the
+    cached UIDs and UIDs above the highest one seen are searched, and only
+    headers of messages not in the cache are fetched. ``capabilities`` of
+    the session decide how a full search is bounded. With ``record_empty``
+    a search without matches also returns a (message-less) cache update.
+    """
+    # Assume the cache is still valid and send SELECT and the first search
+    # together; if UIDVALIDITY changed, the speculative search is discarded
+    speculative = bool(cached and cached["last_uid"] and cache_matches_filters(cached, target_filters, provided_filters))
+    sender_query = build_sender_search_query(target_filters)
+    known_uids = [int(uid) for uid in cached["ids"]] if speculative else []
+    last_uid = cached["last_uid"] if speculative else 0
+    if speculative:
+        search = _incremental_search(sender_query, known_uids, last_uid, limit, timeout)
+    else:
+        search = _search_newest(sender_query, limit, capabilities, timeout)
+    try:
+        (status, uidvalidity), first_response = yield ("pipeline", ([("select", (mailbox,)), next(search)],))
+        logger.debug("[MAIL] %s selected - status: %s, uidvalidity: %s", mailbox, status, uidvalidity)
+    except socket.timeout:
+        logger.error("[MAIL] Timeout while selecting %s and searching after %ss", mailbox, timeout)
+        raise
+    if status != "OK":
+        search.close()
+        return {"error": GENERIC_FETCH_ERROR}, None
+
+    incremental = speculative and uidvalidity is not None and cached["uidvalidity"] == uidvalidity
+    if cached and not incremental:
+        logger.info("[MAIL] Cache not reusable (filters or UIDVALIDITY changed), full resync for: %s", config.email)
+
+    if speculative and not incremental:
+        search.close()
+        known_uids, last_uid = [], 0
+        status, found_uids = yield from _search_newest(sender_query, limit, capabilities, timeout)
+    else:
+        status, found_uids = yield from _resume(search, first_response)
+    if incremental and status == "OK" and found_uids is None:
+        # Older matches outside the cached window may now be in the top N
+        incremental = False
+        known_uids, last_uid = [], 0
+        status, found_uids = yield from _search_newest(sender_query, limit, capabilities, timeout)
+    if status != "OK":
+        logger.warning("[MAIL] Search status not OK")
+        return {"message": "No emails found"}, None
+
+    logger.debug("[MAIL] Found %d email(s)", len(found_uids))
+
+    if not found_uids:
+        logger.info("[MAIL] No emails found in %s for filters: %s", mailbox, target_filters)
+        filter_desc = ", ".join(target_filters)
+        cache_update = None
+        if record_empty:
+            cache_update = {"filters": target_filters, "ids": [], "uidvalidity": uidvalidity, "last_uid": last_uid, "payload": []}
+        return {"message": f"No emails found from {filter_desc}"}, cache_update
+
+    # Get the last N emails, newest first
+    id_strings = [str(uid) for uid in reversed(found_uids[-limit:])]
+    logger.debug("[MAIL] Processing %d recent email(s)", len(id_strings))
+
+    cached_headers = {}
+    if incremental:
+        if cached["ids"] == id_strings:
+            logger.info("[MAIL] Returning cached emails (no new messages) for account: %s", config.email)
+            metrics.mail_cache_lookups.inc("hit")
+            return cached["payload"], None
+        cached_headers = {item.get("id"): item for item in cached["payload"]}
+    metrics.mail_cache_lookups.inc("partial" if incremental else "miss")
 
-        cache_filters = []
-        if cache_entry and cache_entry.message_ids and cache_entry.payload:
-            try:
-                cached_data = json.loads(cache_entry.message_ids)
-                if isinstance(cached_data, dict):
-                    cached_ids = cached_data.get("ids")
-                    cache_filters = cached_data.get("filters") or []
-                else:
-                    cached_ids = cached_data
-                cached_payload = json.loads(cache_entry.payload)
-            except json.JSONDecodeError:
-                cached_ids = cached_payload = None
-            else:
-                filters_match = False
-                if cache_filters:
-                    filters_match = cache_filters == target_filters
-                else:
-                    filters_match = not provided_filters
-
-                if cached_ids == id_strings and filters_match:
-                    logger.info(f"[MAIL] Returning cached emails (no new messages) for account: {config.email}")
-                    return cached_payload
-
-        # Fetch all headers in a single IMAP call for better performance
-        message_set = ",".join(id_strings)
-        logger.info(f"[MAIL] Fetching headers in batch for ids: {message_set}")
+    new_ids = [uid for uid in id_strings if uid not in cached_headers]
+    headers_map = {}
+    if new_ids:
+        # Fetch all new headers in a single IMAP call for better performance
+        message_set = ",".join(new_ids)
+        logger.debug("[MAIL] Fetching headers in batch for uids: %s", message_set)
 
         try:
-            status, msg_data = mail.fetch(message_set, '(BODY.PEEK[HEADER.FIELDS (SUBJECT FROM DATE)])')
+            status, msg_data = yield ("uid", ("FETCH", message_set, HEADER_FETCH_ITEMS))
         except socket.timeout:
-            logger.error(f"[MAIL] Timeout while fetching batched headers after {timeout}s")
+            logger.error("[MAIL] Timeout while fetching batched headers after %ss", timeout)
             raise
 
         if status != "OK":
-            logger.warning(f"[MAIL] Failed to fetch headers batch, status: {status}")
-            return {"error": GENERIC_FETCH_ERROR}
+            logger.warning("[MAIL] Failed to fetch headers batch, status: %s", status)
+            return {"error": GENERIC_FETCH_ERROR}, None
 
-        headers_map = {}
-        for response_part in msg_data:
-            if not isinstance(response_part, tuple) or not response_part[1]:
-                continue
+        with metrics.imap_phase_seconds.time("parse"):
+            headers_map = parse_header_responses(msg_data)
 
-            response_id = response_part[0]
-            if isinstance(response_id, bytes):
-                response_id = response_id.decode()
-            response_id = response_id.split()[0]
+    email_list = []
+    for key in id_strings:
+        item = cached_headers.get(key) or headers_map.get(key)
+        if item:
+            email_list.append(item)
+        else:
+            logger.warning("[MAIL] Missing header data for email uid %s", key)
 
-            msg = email.message_from_bytes(response_part[1])
-            email_content = {"subject": "Unknown", "from": "", "date": ""}
+    logger.info("[MAIL] Fetch finished, total emails: %d, newly fetched: %d", len(email_list), len(headers_map))
+    cache_update = {
+        "filters": target_filters,
+        "ids": id_strings,
+        "uidvalidity": uidvalidity,
+        "last_uid": max(found_uids[-1], last_uid),
+        "payload": email_list,
+    }
+    return email_list, cache_update
 
-            raw_subject = msg.get("Subject")
-            if raw_subject:
-                subject, encoding = decode_header(raw_subject)[0]
-                if isinstance(subject, bytes):
-                    subject = subject.decode(encoding if encoding else "utf-8", errors="ignore")
-                email_content["subject"] = subject
 
-            email_content["from"] = msg.get("From", "")
+def mailbox_flow(config, folders, target_filters, provided_filters, limit, timeout, cached, capabilities=()):
+    """Fetch flow over the account's ``folders``.
 
-            raw_date = msg.get("Date")
-            formatted_date = raw_date
-            try:
-                if raw_date:
-                    parsed_date = email.utils.parsedate_to_datetime(raw_date)
-                    # Convert to GMT+8 timezone
-                    gmt8_tz = timezone(timedelta(hours=8))
-                    gmt8_date = parsed_date.astimezone(gmt8_tz)
-                    formatted_date = gmt8_date.strftime("%Y/%m/%d %H:%M:%S")
-            except:
-                pass
-
-            email_content["date"] = formatted_date or ""
-            email_content["id"] = response_id
-            headers_map[response_id] = email_content
-
-        email_list = []
-        for e_id in recent_email_ids:
-            key = e_id.decode()
-            if key in headers_map:
-                email_list.append(headers_map[key])
-            else:
-                logger.warning(f"[MAIL] Missing header data for email id {key}")
-
-        if db:
-            try:
-                cache_wrapper = {"filters": target_filters, "ids": id_strings}
-                crud.upsert_email_cache(
-                    db,
-                    config.id,
-                    json.dumps(cache_wrapper, ensure_ascii=False),
-                    json.dumps(email_list, ensure_ascii=False),
-                )
-            except Exception as cache_error:
-                logger.warning(f"[MAIL] Failed to update email cache: {cache_error}")
-
-        logger.info(f"[MAIL] Closing connection, total emails fetched: {len(email_list)}")
+    ``cached`` maps each folder to its :func:`load_cached_result`. Returns
+    ``(result, cache_updates)`` with the updates keyed by folder.
+    """
+    if len(folders) == 1:
+        return (
+            yield from single_folder_flow(
+                config, folders[0], target_filters, provided_filters, limit, timeout, cached.get(folders[0]), capabilities
+            )
+        )
+    return (yield from multi_folder_flow(config, folders, target_filters, provided_filters, limit, timeout, cached, capabilities))
+
+
+def single_folder_flow(config, folder, target_filters, provided_filters, limit, timeout, cached, capabilities=()):
+    """Fetch flow for an account searching one folder.
+
+    With ``SEARCH_STATUS_CHECK`` every sync records the folder's STATUS
+    (plus HIGHESTMODSEQ on CONDSTORE servers). A fetch whose cache holds
+    one starts with a lone STATUS (a SELECT if the pooled session has the
+    folder selected already) and returns the cached messages when
+    :func:`folder_unchanged`, skipping SELECT and SEARCH; otherwise the
+    usual :func:`recent_emails_flow` follows. Without a recorded STATUS,
+    it is sent in the same round trip as the SELECT and first search.
+    """
+    check_status = app_config.SEARCH_STATUS_CHECK
+    flow = recent_emails_flow(
+        config, target_filters, provided_filters, limit, timeout, cached, capabilities,
+        mailbox=folder, record_empty=check_status,
+    )
+    if not check_status:
+        result, cache_update = yield from flow
+        return result, ({folder: cache_update} if cache_update else {})
+
+    items = status_items(capabilities)
+    if cached and cached.get("uidnext") is not None and cache_matches_filters(cached, target_filters, provided_filters):
         try:
-            mail.close()
-            mail.logout()
-            logger.info("[MAIL] Connection closed successfully")
+            status, data = yield ("status", (folder, items))
         except socket.timeout:
-            logger.warning(f"[MAIL] Timeout while closing connection after {timeout}s - returning already fetched emails")
-        except Exception as close_error:
-            logger.warning(f"[MAIL] Error while closing connection: {close_error}")
+            flow.close()
+            logger.error("[MAIL] Timeout while checking %s status after %ss", folder, timeout)
+            raise
+        folder_status = parse_status(data) if status == "OK" else {}
+        if folder_unchanged(cached, folder_status, target_filters, provided_filters, limit):
+            logger.info("[MAIL] %s unchanged since last sync, returning cached emails for account: %s", folder, config.email)
+            metrics.mail_cache_lookups.inc("unchanged")
+            flow.close()
+            return _cached_result(cached, target_filters, limit), {}
+        result, cache_update = yield from flow
+    else:
+        (result, cache_update), folder_status = yield from _with_status(flow, folder, items)
 
-        return email_list
+    cache_update = _status_cache_update(result, cache_update, folder_status, limit)
+    return result, ({folder: cache_update} if cache_update else {})
 
+
+def _with_status(flow, folder: str, items: str):
+    """Sub-flow running ``flow`` with a STATUS of ``folder`` sent in its first round trip.
+
+    Returns ``(result of flow, status)``; ``status`` is empty if STATUS failed.
+    """
+    name, args = next(flow)
+    batch = list(args[0]) if name == "pipeline" else [(name, args)]
+    try:
+        responses = yield ("pipeline", ([("status", (folder, items))] + batch,))
+    except Exception:
+        flow.close()
+        raise
+    status, data = responses[0]
+    if status != "OK":
+        logger.debug("[MAIL] STATUS %s failed (%s), not recording it", folder, status)
+    folder_status = parse_status(data) if status == "OK" else {}
+    result = yield from _resume(flow, responses[1:] if name == "pipeline" else responses[1])
+    return result, folder_status
+
+
+def _status_cache_update(result, cache_update, status: dict, limit: int):
+    """Cache update of one folder sync, extended with the STATUS taken before it.
+
+    STATUS precedes the search, so anything it did not count gets searched
+    next time. A sync served from the cache (nothing new matched) only
+    records the STATUS. Returns ``None`` when there is nothing to store.
+    """
+    uidnext = status.get("UIDNEXT")
+    fields = {
+        "uidnext": uidnext,
+        "message_count": status.get("MESSAGES"),
+        "highestmodseq": status.get("HIGHESTMODSEQ"),
+    }
+    if cache_update:
+        cache_update = dict(cache_update, search_limit=limit, **fields)
+        if not cache_update["ids"] and uidnext:
+            cache_update["last_uid"] = max(cache_update["last_uid"] or 0, uidnext - 1)
+        return cache_update
+    if isinstance(result, list) and uidnext:
+        return fields
+    return None
+
+
+def multi_folder_flow(config, folders, target_filters, provided_filters, limit, timeout, cached, capabilities=()):
+    """Fetch flow searching several folders over one session.
+
+    A single pipelined STATUS round trip tells which folders changed since
+    they were cached: a folder whose UIDVALIDITY, UIDNEXT and MESSAGES are
+    unchanged is served from its cache without SELECT or SEARCH. The other
+    folders run :func:`recent_emails_flow` side by side (see
+    :func:`_interleave`), so searching three folders takes as many round
+    trips as searching one. Messages are merged newest first and tagged
+    with their ``folder``.
+    """
+    try:
+        items = status_items(capabilities)
+        responses = yield ("pipeline", ([("status", (folder, items)) for folder in folders],))
     except socket.timeout:
-        error_msg = f"IMAP operation timeout after {timeout}s - Check network connection and IMAP server responsiveness"
-        logger.error(f"[MAIL] {error_msg}")
+        logger.error("[MAIL] Timeout while checking folder status after %ss", timeout)
+        raise
+    statuses = {}
+    for folder, (status, data) in zip(folders, responses):
+        if status == "OK":
+            statuses[folder] = parse_status(data)
+        else:
+            logger.warning("[MAIL] STATUS %s failed for %s (%s), skipping folder", folder, config.email, status)
+    if not statuses:
+        return {"error": GENERIC_FETCH_ERROR}, {}
+
+    results, flows = {}, {}
+    for folder, status in statuses.items():
+        folder_cache = cached.get(folder)
+        if folder_unchanged(folder_cache, status, target_filters, provided_filters, limit):
+            metrics.mail_cache_lookups.inc("unchanged")
+            results[folder] = folder_cache["payload"][:limit]
+        else:
+            flows[folder] = recent_emails_flow(
+                config, target_filters, provided_filters, limit, timeout, folder_cache, capabilities,
+                mailbox=folder, record_empty=True,
+            )
+    logger.debug("[MAIL] Folders unchanged: %s, searching: %s", list(results), list(flows))
+
+    cache_updates = {}
+    for folder, (result, cache_update) in (yield from _interleave(flows)).items():
+        results[folder] = result
+        cache_update = _status_cache_update(result, cache_update, statuses[folder], limit)
+        if cache_update:
+            cache_updates[folder] = cache_update
+    return merge_folder_results(folders, results, limit, target_filters), cache_updates
+
+
+def folder_unchanged(cached, status: dict, target_filters, provided_filters, limit: int) -> bool:
+    """Whether ``status`` shows that no message was added to or removed from
+    the folder since ``cached`` was stored, so searching it would find the
+    same messages.
+
+    A window of fewer than ``limit`` messages only counts when it held
+    every match, i.e. was smaller than the limit it was searched with.
+    """
+    if not cached or cached.get("uidnext") is None or not status.get("UIDNEXT"):
+        return False
+    if not cache_matches_filters(cached, target_filters, provided_filters):
+        return False
+    window = len(cached["ids"])
+    if 0 < window < limit and window >= (cached.get("search_limit") or 0):
+        return False  # May have been cut short by a smaller limit than this one
+    if cached.get("highestmodseq") and status.get("HIGHESTMODSEQ") and cached["highestmodseq"] != status["HIGHESTMODSEQ"]:
+        return False  # CONDSTORE: something in the folder was modified
+    return (
+        cached["uidvalidity"] == status.get("UIDVALIDITY")
+        and cached["uidnext"] == status["UIDNEXT"]
+        and cached["message_count"] == status.get("MESSAGES")
+    )
+
+
+def _interleave(flows: dict):
+    """Sub-flow running one fetch flow per folder side by side.
+
+    Each round takes the next command of every unfinished flow and sends
+    them in one pipeline, each preceded by a SELECT of its folder (the
+    session answers it locally when that folder is already selected).
+    Returns the result of each flow, keyed by folder.
+    """
+    results = {}
+    pending = {}
+    for folder, flow in flows.items():
         try:
-            mail.close()
-            mail.logout()
-        except:
-            pass
-        return {"error": GENERIC_TIMEOUT_ERROR}
-    except Exception as e:
-        logger.error(f"[MAIL] Error fetching mail: {str(e)}")
+            pending[folder] = (flow, next(flow))
+        except StopIteration as stop:
+            results[folder] = stop.value
+
+    while pending:
+        commands, spans = [], []
+        for folder, (flow, (name, args)) in pending.items():
+            batch = list(args[0]) if name == "pipeline" else [(name, args)]
+            start = len(commands)
+            if batch[0][0] != "select":
+                commands.append(("select", (folder,)))
+                start += 1
+            commands.extend(batch)
+            spans.append((folder, name, start, len(commands)))
         try:
-            mail.close()
-            mail.logout()
-        except:
-            pass
-        return {"error": GENERIC_FETCH_ERROR}
+            responses = yield ("pipeline", (commands,))
+        except Exception:
+            for flow, _ in pending.values():
+                flow.close()
+            raise
+
+        advanced = {}
+        for folder, name, start, end in spans:
+            flow = pending[folder][0]
+            response = responses[start:end] if name == "pipeline" else responses[start]
+            try:
+                advanced[folder] = (flow, flow.send(response))
+            except StopIteration as stop:
+                results[folder] = stop.value
+        pending = advanced
+    return results
+
+
+def _message_sort_key(message: dict) -> str:
+    # Display dates are "YYYY/MM/DD HH:MM:SS" (GMT+8), which sort as strings
+    value = message.get("date") or ""
+    return value if SORTABLE_DATE_PATTERN.match(value) else ""
+
+
+def merge_folder_results(folders: List[str], results: dict, limit: int, target_filters: List[str]):
+    """Merge per-folder results into one newest-first list of ``limit`` messages.
+
+    Each message gets a ``folder`` field. Folders that found nothing are
+    left out; an error is only returned when every folder failed.
+    """
+    messages, errors = [], []
+    for folder in folders:
+        result = results.get(folder)
+        if isinstance(result, list):
+            messages.extend(dict(item, folder=folder) for item in result)
+        elif isinstance(result, dict) and "error" in result:
+            errors.append(result)
+    if not messages:
+        if errors and len(errors) == len(results):
+            return errors[0]
+        return {"message": f"No emails found from {', '.join(target_filters)}"}
+    # Stable sort: messages with the same (or no usable) date keep folder order
+    messages.sort(key=_message_sort_key, reverse=True)
+    return messages[:limit]
@@ -0,0 +1,253 @@
+"""
+Mailbox Wait Hub
+Long-poll and SSE clients waiting for new mail subscribe here. One shared
+check loop runs per (account, filters, limit) and fans every result out to
+all subscribers, so a hundred waiters on one mailbox cost one IMAP check.
+
+Cursors hold the newest UID seen per folder, since UIDs of different
+folders cannot be compared. A cursor covering only INBOX is a plain number
+(as before multi-folder search); otherwise it reads ``INBOX:120,Junk:7``.
+"""
+import asyncio
+import json
+import logging
+from typing import Dict, List, Optional
+
+import config as app_config
+import database
+import idle_watcher
+import imap_pool
+import mail_service
+
+logger = logging.getLogger(__name__)
+
+
+def message_uid(message: dict) -> Optional[int]:
+    value = str(message.get("id", ""))
+    return int(value) if value.isdigit() else None
+
+
+def message_folder(message: dict) -> str:
+    return message.get("folder") or imap_pool.DEFAULT_MAILBOX
+
+
+def parse_cursor(value: Optional[str]) -> Optional[Dict[str, int]]:
+    """``"120"`` or ``"INBOX:120,Junk:7"`` -> ``{folder: uid}``; raises ``ValueError``."""
+    if value is None or value == "":
+        return None
+    if value.isdigit():
+        return {imap_pool.DEFAULT_MAILBOX: int(value)}
+    cursor = {}
+    for part in value.split(","):
+        folder, separator, uid = part.rpartition(":")
+        if not separator or not folder or not uid.isdigit():
+            raise ValueError(f"Invalid cursor: {value}")
+        cursor[mail_service.normalize_folder(folder)] = int(uid)
+    return cursor
+
+
+def format_cursor(cursor: Optional[Dict[str, int]]):
+    if not cursor:
+        return None
+    if list(cursor) == [imap_pool.DEFAULT_MAILBOX]:
+        return cursor[imap_pool.DEFAULT_MAILBOX]
+    return ",".join(f"{folder}:{uid}" for folder, uid in cursor.items())
+
+
+def newest_cursor(messages: List[dict]) -> Optional[Dict[str, int]]:
+    cursor = {}
+    for message in messages:
+        uid = message_uid(message)
+        if uid is not None:
+            folder = message_folder(message)
+            cursor[folder] = max(uid, cursor.get(folder, 0))
+    return cursor or None
+
+
+def merge_cursors(cursor: Optional[Dict[str, int]], newer: Optional[Dict[str, int]]) -> Optional[Dict[str, int]]:
+    if not cursor or not newer:
+        return newer or cursor
+    merged = dict(cursor)
+    for folder, uid in newer.items():
+        merged[folder] = max(uid, merged.get(folder, 0))
+    return merged
+
+
+def newer_than(messages: List[dict], cursor: Optional[Dict[str, int]]) -> List[dict]:
+    if cursor is None:
+        return list(messages)
+    return [m for m in messages if (message_uid(m) or 0) > cursor.get(message_folder(m), 0)]
+
+
+class MailboxWatch:
+    """Shared check loop for one fetch key."""
+
+    def __init__(self, hub: "MailboxWatchHub", key, account, sender: Optional[str]):
+        self.hub = hub
+        self.key = key
+        self.account = account
+        self.sender = sender
+        self.result = None
+        self.version = 0
+        self.subscribers = 0
+        self.changed = asyncio.Condition()
+        self.wakeup = asyncio.Event()
+        self.task: Optional[asyncio.Task] = None
+
+    async def run(self):
+        while self.subscribers > 0:
+            idle_watcher.manager.touch(self.account)
+            async with database.async_session() as db:
+                try:
+                    result = await mail_service.fetch_recent_emails_async(
+                        self.account,
+                        sender_filter=self.sender,
+                        db=db,
+                        cache_is_fresh=idle_watcher.manager.is_fresh(self.account.id),
+                    )
+                except Exception as e:
+                    logger.error("[WAIT] Shared mailbox check failed for %s: %s", self.account.email, e)
+                    result = {"error": mail_service.GENERIC_FETCH_ERROR}
+
+            async with self.changed:
+                self.result = result
+                self.version += 1
+                self.changed.notify_all()
+
+            self.wakeup.clear()
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), self.hub.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+        if self.hub._watches.get(self.key) is self:
+            del self.hub._watches[self.key]
+
+
+class Subscription:
+    def __init__(self, watch: MailboxWatch):
+        self.watch = watch
+        self.seen_version = 0
+
+    async def __aenter__(self):
+        self.watch.subscribers += 1
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.watch.subscribers -= 1
+
+    async def next(self):
+        """Wait for a check result this subscriber has not seen yet."""
+        watch = self.watch
+        async with watch.changed:
+            await watch.changed.wait_for(lambda: watch.version > self.seen_version)
+            self.seen_version = watch.version
+            return watch.result
+
+
+class MailboxWatchHub:
+    def __init__(self, poll_interval: float = None, heartbeat: float = None):
+        self.poll_interval = app_config.MAIL_WAIT_POLL_INTERVAL if poll_interval is None else poll_interval
+        self.heartbeat = app_config.MAIL_STREAM_HEARTBEAT if heartbeat is None else heartbeat
+        self._watches: Dict[tuple, MailboxWatch] = {}
+        idle_watcher.manager.add_listener(self.on_cache_refreshed)
+
+    def subscribe(self, account, sender: Optional[str] = None) -> Subscription:
+        key = mail_service.fetch_key(account, sender)
+        watch = self._watches.get(key)
+        if watch is None:
+            watch = self._watches[key] = MailboxWatch(self, key, account, sender)
+        if watch.task is None or watch.task.done():
+            # The loop exits once the last subscriber leaves; restart it
+            watch.task = asyncio.ensure_future(self._start(watch))
+        return Subscription(watch)
+
+    def on_cache_refreshed(self, account_id: int):
+        """Re-check immediately when an IDLE watcher saw new mail."""
+        for key, watch in list(self._watches.items()):
+            if key[0] == account_id:
+                watch.wakeup.set()
+
+    async def wait(self, account, sender: Optional[str], since: Optional[Dict[str, int]], timeout: float) -> dict:
+        """Long-poll: return once a message newer than ``since`` is found.
+
+        Without ``since`` the newest message at the first check is the
+        cursor, so only mail arriving after the call is returned.
+        """
+        async with self.subscribe(account, sender) as subscription:
+            try:
+                return await asyncio.wait_for(self._wait_new(subscription, since), timeout)
+            except asyncio.TimeoutError:
+                return {"messages": [], "cursor": format_cursor(since), "timed_out": True}
+
+    async def _wait_new(self, subscription: Subscription, since: Optional[Dict[str, int]]) -> dict:
+        cursor = since
+        while True:
+            result = await subscription.next()
+            if isinstance(result, dict) and "error" in result:
+                return result
+            messages = result if isinstance(result, list) else []
+            if cursor is None:
+                cursor = newest_cursor(messages) or {}
+                continue
+            new_messages = newer_than(messages, cursor)
+            if new_messages:
+                cursor = merge_cursors(cursor, newest_cursor(new_messages))
+                return {"messages": new_messages, "cursor": format_cursor(cursor), "timed_out": False}
+
+    async def stream(self, account, sender: Optional[str], since: Optional[Dict[str, int]], timeout: float):
+        """Server-Sent Events: a ``messages`` snapshot first, then one per change.
+
+        Each event carries the cursor (newest UIDs) as its id, so a
+        reconnecting ``EventSource`` resumes from ``Last-Event-ID``.
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        cursor = since
+        sent_snapshot = False
+        yield "retry: 3000\n\n"
+        async with self.subscribe(account, sender) as subscription:
+            while True:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    result = await asyncio.wait_for(subscription.next(), min(remaining, self.heartbeat))
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+
+                if isinstance(result, dict) and "error" in result:
+                    yield format_event("error", result)
+                    continue
+
+                messages = result if isinstance(result, list) else []
+                latest = newest_cursor(messages)
+                if sent_snapshot and (latest is None or (cursor is not None and not newer_than(messages, cursor))):
+                    continue
+                payload = {
+                    "messages": messages,
+                    "new": newer_than(messages, cursor) if sent_snapshot or cursor is not None else [],
+                    "cursor": format_cursor(merge_cursors(cursor, latest)),
+                }
+                if isinstance(result, dict) and result.get("message"):
+                    payload["message"] = result["message"]
+                cursor = merge_cursors(cursor, latest)
+                yield format_event("messages", payload, event_id=format_cursor(cursor))
+                sent_snapshot = True
+
+    async def _start(self, watch: MailboxWatch):
+        # Let the caller enter the subscription before the loop checks for it
+        await asyncio.sleep(0)
+        await watch.run()
+
+
+def format_event(event: str, data, event_id=None) -> str:
+    lines = [f"event: {event}"]
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.append(f"data: {json.dumps(data, ensure_ascii=False)}")
+    return "\n".join(lines) + "\n\n"
+
+
+hub = MailboxWatchHub()
@@ -1,28 +1,82 @@
 from fastapi import FastAPI, Depends, HTTPException, Query, Request
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, JSONResponse, PlainTextResponse, Response, StreamingResponse
 from fastapi.security import HTTPBasic, HTTPBasicCredentials
 from fastapi.templating import Jinja2Templates
+from starlette.concurrency import run_in_threadpool
 import secrets
 import logging
+import time
 import re
+import urllib.parse
 from sqlalchemy.orm import Session
-from sqlalchemy import text, inspect
 from typing import List, Optional
 
-import models, schemas, crud, database, mail_service, config
+import models, schemas, crud, database, mail_service, config, imap_pool, idle_watcher, account_cache, mail_watch, mail_batch, mail_detail, circuit_breaker, metrics, account_io, db_browser, logging_setup
 
 # Configure logging
-logging.basicConfig(
-    level=config.LOG_LEVEL,
-    format=config.LOG_FORMAT
-)
+logging_setup.configure()
 logger = logging.getLogger(__name__)
 
 models.Base.metadata.create_all(bind=database.engine)
+database.add_missing_columns(models.Base.metadata)
+database.drop_stale_indexes(models.Base.metadata)
+database.create_missing_indexes(models.Base.metadata)
 
 app = FastAPI()
 
+
+@app.middleware("http")
+async def record_request_latency(request: Request, call_next):
+    started = time.perf_counter()
+    response = await call_next(request)
+    # Label by route template so path parameters do not create new series
+    route = request.scope.get("route")
+    path = getattr(route, "path", None) or "unmatched"
+    metrics.http_request_seconds.observe(time.perf_counter() - started, request.method, path, response.status_code)
+    return response
+
+
+REQUEST_ID_PATTERN = re.compile(r"^[A-Za-z0-9._-]{1,64}$")
+
+@app.middleware("http")
+async def assign_request_id(request: Request, call_next):
+    # Registered last, so it wraps every other middleware and their log lines
+    incoming = request.headers.get("x-request-id", "")
+    token = logging_setup.bind_request_id(incoming if REQUEST_ID_PATTERN.match(incoming) else None)
+    try:
+        response = await call_next(request)
+        response.headers["X-Request-ID"] = logging_setup.request_id_var.get()
+        return response
+    finally:
+        logging_setup.reset_request_id(token)
+
+
+@app.on_event("startup")
+def migrate_legacy_cache():
+    db = database.SessionLocal()
+    try:
+        copied = mail_service.migrate_sync_state(db)
+        migrated = mail_service.migrate_legacy_cache(db)
+    finally:
+        db.close()
+    if copied:
+        logger.info("[DB] Moved sync state of %s account(s) to the per-folder table", copied)
+    if migrated:
+        logger.info("[DB] Migrated cached emails of %s account(s) to the per-message cache", migrated)
+
+
+@app.on_event("startup")
+async def start_idle_watchers():
+    await idle_watcher.manager.start()
+
+
+@app.on_event("shutdown")
+async def stop_background_workers():
+    await idle_watcher.manager.stop()
+    await imap_pool.async_pool.close_all()
+    await run_in_threadpool(imap_pool.pool.close_all)
+
 security = HTTPBasic()
 templates = Jinja2Templates(directory="templates")
 
@@ -46,16 +100,50 @@ def admin_db_page(request: Request, username: str = Depends(get_current_username
     return templates.TemplateResponse("admin/db_view.html", {"request": request, "username": username})
 
 def get_table_list():
-    inspector = inspect(database.engine)
-    return inspector.get_table_names()
+    return db_browser.catalog.tables()
 
 def validate_table_name(table_name: str):
     if not re.match(r"^[A-Za-z_][A-Za-z0-9_]*$", table_name):
         raise HTTPException(status_code=400, detail="Invalid table name")
-    available_tables = get_table_list()
-    if table_name not in available_tables:
+    info = db_browser.catalog.get(table_name)
+    if info is None:
         raise HTTPException(status_code=404, detail="Table not found")
-    return table_name
+    return info
+
+@app.get("/admin/api/cache/stats")
+def cache_stats(username: str = Depends(get_current_username)):
+    return {
+        "account_cache": account_cache.cache.stats(),
+        "imap_pool": imap_pool.pool.stats(),
+        "async_imap_pool": imap_pool.async_pool.stats(),
+        "circuit_breaker": circuit_breaker.breaker.stats(),
+        "auth_failures": circuit_breaker.auth_failures.stats(),
+        "body_cache": mail_detail.cache.stats(),
+    }
+
+metrics.CallbackMetric(
+    "account_cache_lookups_total",
+    "Account lookup cache hits and misses",
+    lambda: (lambda stats: {("hit",): stats["hits"], ("miss",): stats["misses"]})(account_cache.cache.stats()),
+    ["result"],
+    kind="counter",
+)
+metrics.CallbackMetric(
+    "imap_pool_idle_sessions",
+    "Idle IMAP sessions kept by the connection pools",
+    lambda: {("sync",): imap_pool.pool.stats()["idle_sessions"], ("async",): imap_pool.async_pool.stats()["idle_sessions"]},
+    ["pool"],
+)
+metrics.CallbackMetric(
+    "imap_circuit_open",
+    "1 while the circuit breaker of an IMAP host rejects requests",
+    lambda: {(host,): int(stats["state"] == "open") for host, stats in circuit_breaker.breaker.stats().items()},
+    ["host"],
+)
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def read_metrics(username: str = Depends(get_current_username)):
+    return PlainTextResponse(metrics.render(), media_type=metrics.CONTENT_TYPE)
 
 @app.get("/admin/api/db/tables")
 def list_db_tables(username: str = Depends(get_current_username)):
@@ -65,45 +153,124 @@ def list_db_tables(username: str = Depends(get_current_username)):
 def get_table_data(
     table_name: str,
     limit: int = Query(100, ge=1, le=1000),
+    cursor: Optional[str] = None,
     offset: int = Query(0, ge=0),
     username: str = Depends(get_current_username),
 ):
-    validated_name = validate_table_name(table_name)
-    with database.engine.connect() as conn:
-        result = conn.execute(
-            text(f'SELECT * FROM "{validated_name}" LIMIT :limit OFFSET :offset'),
-            {"limit": limit, "offset": offset},
-        )
-        rows = [dict(row._mapping) for row in result]
+    """One page in primary-key order; pass ``next_cursor`` back as ``cursor`` for the next page."""
+    info = validate_table_name(table_name)
+    try:
+        rows, next_cursor = db_browser.fetch_page(info, limit, cursor=cursor, offset=offset)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    total, approximate = db_browser.counter.get(info)
 
-        total_result = conn.execute(text(f'SELECT COUNT(*) FROM "{validated_name}"'))
-        total = total_result.scalar() or 0
+    return {
+        "table": info.name,
+        "columns": list(info.columns),
+        "rows": rows,
+        "total": total,
+        "total_approximate": approximate,
+        "next_cursor": next_cursor,
+    }
 
-    return {"table": validated_name, "columns": list(rows[0].keys()) if rows else [], "rows": rows, "total": total}
-
-# Dependency
-def get_db():
-    db = database.SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+@app.get("/admin/api/db/table/{table_name}/export")
+def export_table(table_name: str, format: str = "csv", username: str = Depends(get_current_username)):
+    info = validate_table_name(table_name)
+    file_format = account_io.detect_format(format, "")
+    if file_format is None:
+        raise HTTPException(status_code=400, detail="format must be csv or ndjson")
+    return StreamingResponse(
+        db_browser.export_rows(info, file_format),
+        media_type=account_io.MEDIA_TYPES[file_format],
+        headers={"Content-Disposition": f'attachment; filename="{info.name}.{file_format}"'},
+    )
 
 @app.post("/admin/accounts", response_model=schemas.EmailAccountResponse)
-def create_account(account: schemas.EmailAccountCreate, db: Session = Depends(get_db), username: str = Depends(get_current_username)):
+def create_account(account: schemas.EmailAccountCreate, db: Session = Depends(database.get_db), username: str = Depends(get_current_username)):
     # Check if email already exists
     db_account = crud.get_email_account_by_email(db, email=account.email)
     if db_account:
         raise HTTPException(status_code=400, detail="邮箱地址已存在")
-    return crud.create_email_account(db=db, account=account)
+    db_account = crud.create_email_account(db=db, account=account)
+    account_cache.cache.invalidate(account_id=db_account.id, mail_id=db_account.mail_id)
+    return db_account
 
 @app.get("/admin/accounts", response_model=List[schemas.EmailAccountResponse])
-def read_accounts(skip: int = 0, limit: int = 100, db: Session = Depends(get_db), username: str = Depends(get_current_username)):
+def read_accounts(skip: int = 0, limit: int = 100, db: Session = Depends(database.get_db), username: str = Depends(get_current_username)):
     accounts = crud.get_email_accounts(db, skip=skip, limit=limit)
     return accounts
 
+@app.get("/admin/api/accounts")
+def list_accounts(
+    cursor: Optional[int] = None,
+    limit: int = Query(50, ge=1, le=500),
+    email: Optional[str] = None,
+    mail_id: Optional[str] = None,
+    imap_server: Optional[str] = None,
+    sender: Optional[str] = None,
+    q: Optional[str] = None,
+    include_secrets: bool = False,
+    db: Session = Depends(database.get_db),
+    username: str = Depends(get_current_username)
+):
+    """Keyset-paginated account list; pass ``next_cursor`` back as ``cursor`` for the next page."""
+    items, next_cursor = crud.list_email_accounts(
+        db,
+        after_id=cursor,
+        limit=limit,
+        email=email,
+        mail_id=mail_id,
+        imap_server=imap_server,
+        sender=sender,
+        q=q,
+        include_secrets=include_secrets,
+    )
+    return {"items": items, "next_cursor": next_cursor}
+
+@app.post("/admin/accounts/import")
+async def import_accounts(
+    request: Request,
+    format: Optional[str] = None,
+    dry_run: bool = False,
+    skip_existing: bool = False,
+    db=Depends(database.get_async_db),
+    username: str = Depends(get_current_username)
+):
+    """Create accounts from a CSV or NDJSON body; rows are written in one short transaction after the whole body is checked, and nothing is written if any row fails."""
+    file_format = account_io.detect_format(format, request.headers.get("content-type", ""))
+    if file_format is None:
+        raise HTTPException(status_code=400, detail="format must be csv or ndjson")
+    lines = account_io.read_lines(request.stream())
+    records = account_io.csv_records(lines) if file_format == "csv" else account_io.ndjson_records(lines)
+    importer = account_io.AccountImporter(dry_run=dry_run, skip_existing=skip_existing)
+    report = await importer.run(db, records)
+    logger.info(
+        "[ADMIN] Account import (%s, dry_run=%s) - accepted: %s, skipped: %s, errors: %s, committed: %s",
+        file_format, dry_run, report["accepted"], report["skipped"], report["error_count"], report["committed"],
+    )
+    return JSONResponse(report, status_code=422 if report["error_count"] and not dry_run else 200)
+
+@app.get("/admin/accounts/export")
+def export_accounts(format: str = "csv", include_secrets: bool = False, username: str = Depends(get_current_username)):
+    file_format = account_io.detect_format(format, "")
+    if file_format is None:
+        raise HTTPException(status_code=400, detail="format must be csv or ndjson")
+    return StreamingResponse(
+        account_io.export_rows(file_format, include_secrets=include_secrets),
+        media_type=account_io.MEDIA_TYPES[file_format],
+        headers={"Content-Disposition": f'attachment; filename="accounts.{file_format}"'},
+    )
+
+@app.get("/admin/accounts/{account_id}", response_model=schemas.EmailAccountResponse)
+def read_account(account_id: int, db: Session = Depends(database.get_db), username: str = Depends(get_current_username)):
+    db_account = db.query(models.EmailAccount).filter(models.EmailAccount.id == account_id).first()
+    if not db_account:
+        raise HTTPException(status_code=404, detail="Account not found")
+    return db_account
+
 @app.put("/admin/accounts/{account_id}", response_model=schemas.EmailAccountResponse)
-def update_account(account_id: int, account: schemas.EmailAccountUpdate, db: Session = Depends(get_db), username: str = Depends(get_current_username)):
+def update_account(account_id: int, account: schemas.EmailAccountUpdate, db: Session = Depends(database.get_db), username: str = Depends(get_current_username)):
     # Check if the account exists
     current_account = db.query(models.EmailAccount).filter(models.EmailAccount.id == account_id).first()
     if not current_account:
@@ -116,13 +283,19 @@ def update_account(account_id: int, account: schemas.EmailAccountUpdate, db: Ses
             raise HTTPException(status_code=400, detail="邮箱地址已存在")
 
     db_account = crud.update_email_account(db, account_id=account_id, account_update=account)
+    account_cache.cache.invalidate(account_id=account_id)
+    if account.email or account.imap_server:
+        # UIDs of another mailbox may collide with the cached ones
+        mail_detail.cache.invalidate(account_id)
     if not db_account:
         raise HTTPException(status_code=404, detail="Account not found")
     return db_account
 
 @app.delete("/admin/accounts/{account_id}")
-def delete_account(account_id: int, db: Session = Depends(get_db), username: str = Depends(get_current_username)):
+def delete_account(account_id: int, db: Session = Depends(database.get_db), username: str = Depends(get_current_username)):
     success = crud.delete_email_account(db, account_id=account_id)
+    account_cache.cache.invalidate(account_id=account_id)
+    mail_detail.cache.invalidate(account_id)
     if not success:
         raise HTTPException(status_code=404, detail="Account not found")
     return {"message": "Account deleted successfully"}
@@ -133,13 +306,13 @@ def read_mail(
     mail_id: str, 
     token: str, 
     sender: Optional[str] = None,
-    db: Session = Depends(get_db)
+    db: Session = Depends(database.get_db)
 ):
-    account = crud.get_email_account(db, mail_id=mail_id)
+    account = account_cache.cache.get(db, mail_id)
     if not account:
         raise HTTPException(status_code=404, detail="Mail ID not found")
     
-    if account.access_token != token:
+    if not account.token_matches(token):
         raise HTTPException(status_code=404, detail="Mail ID not found")
     
     # Just serve the page with context, don't fetch emails yet
@@ -151,34 +324,200 @@ def read_mail(
         "sender": sender
     })
 
+async def get_authorized_account(mail_id: str, token: str, db):
+    account = account_cache.cache.lookup(mail_id)
+    if account is None:
+        account = await database.run_sync(db, account_cache.cache.load, mail_id)
+    if not account:
+        logger.warning("[API] Mail ID not found: %s", mail_id)
+        raise HTTPException(status_code=404, detail="Mail ID not found")
+
+    if not account.token_matches(token):
+        logger.warning("[API] Invalid token for mail_id: %s", mail_id)
+        raise HTTPException(status_code=403, detail="Invalid token")
+    return account
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    # If-None-Match uses weak comparison, so W/ prefixes are ignored
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in candidates or etag in (tag[2:] if tag.startswith("W/") else tag for tag in candidates)
+
 @app.get("/api/mail/messages")
-def get_mail_messages(
+async def get_mail_messages(
+    request: Request,
     mail_id: str,
     token: str,
     sender: Optional[str] = None,
-    db: Session = Depends(get_db)
+    db=Depends(database.get_async_db)
 ):
-    logger.info(f"[API] /api/mail/messages called - mail_id: {mail_id}, sender: {sender}")
-
-    account = crud.get_email_account(db, mail_id=mail_id)
-    if not account:
-        logger.warning(f"[API] Mail ID not found: {mail_id}")
-        raise HTTPException(status_code=404, detail="Mail ID not found")
-
-    if account.access_token != token:
-        logger.warning(f"[API] Invalid token for mail_id: {mail_id}")
-        raise HTTPException(status_code=403, detail="Invalid token")
+    logger.info("[API] /api/mail/messages called - mail_id: %s, sender: %s", mail_id, sender)
+    account = await get_authorized_account(mail_id, token, db)
 
-    logger.info(f"[API] Fetching emails for: {account.email}, imap_server: {account.imap_server}")
-    emails = mail_service.fetch_recent_emails(account, sender_filter=sender, db=db)
+    logger.debug("[API] Fetching emails for: %s, imap_server: %s", account.email, account.imap_server)
+    idle_watcher.manager.touch(account)
+    emails = await mail_service.fetch_recent_emails_async(
+        account,
+        sender_filter=sender,
+        db=db,
+        cache_is_fresh=idle_watcher.manager.is_fresh(account.id),
+    )
 
     if isinstance(emails, list):
-        logger.info(f"[API] Fetch success - account: {account.email}, sender: {sender or account.default_sender_filter}, fetched: {len(emails)}")
+        logger.info("[API] Fetch success - account: %s, sender: %s, fetched: %d", account.email, sender or account.default_sender_filter, len(emails))
     elif isinstance(emails, dict) and "error" in emails:
-        logger.error(f"[API] Fetch failed - account: {account.email}, sender: {sender or account.default_sender_filter}, reason: {emails.get('error')}")
+        logger.error("[API] Fetch failed - account: %s, sender: %s, reason: %s", account.email, sender or account.default_sender_filter, emails.get('error'))
     elif isinstance(emails, dict):
-        logger.info(f"[API] Fetch result - account: {account.email}, sender: {sender or account.default_sender_filter}, message: {emails}")
+        logger.info("[API] Fetch result - account: %s, sender: %s, message: %s", account.email, sender or account.default_sender_filter, emails)
     else:
-        logger.warning(f"[API] Fetch returned unexpected result type={type(emails).__name__} for account: {account.email}")
+        logger.warning("[API] Fetch returned unexpected result type=%s for account: %s", type(emails).__name__, account.email)
+
+    if not isinstance(emails, list):
+        return emails
+
+    _, target_filters = mail_service.resolve_sender_filters(account, sender)
+    etag = mail_service.result_etag(account.id, target_filters, emails)
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        logger.info("[API] Not modified - account: %s, etag: %s", account.email, etag)
+        return Response(status_code=304, headers=headers)
+    return JSONResponse(emails, headers=headers)
+
+@app.post("/api/mail/messages/batch")
+async def get_mail_messages_batch(
+    request: Request,
+    items: List[schemas.MailBatchItem],
+    stream: bool = False,
+    db=Depends(database.get_async_db)
+):
+    """Fetch many mailboxes at once; ``stream=true`` returns NDJSON in completion order."""
+    logger.info("[API] /api/mail/messages/batch called - items: %d, stream: %s", len(items), stream)
+    if len(items) > config.MAIL_BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=413, detail=f"At most {config.MAIL_BATCH_MAX_ITEMS} items per batch")
+
+    resolved = await mail_batch.authorize(db, items)
+    await database.close_session(db)
+
+    results = mail_batch.runner.run(resolved)
+    if stream or "application/x-ndjson" in request.headers.get("accept", ""):
+        return StreamingResponse(
+            mail_batch.ndjson(results),
+            media_type="application/x-ndjson",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        )
+    entries = sorted([result async for result in results], key=lambda result: result["index"])
+    logger.info("[API] Batch finished - items: %s, failed: %s", len(entries), sum(1 for entry in entries if mail_batch.failed(entry)))
+    return entries
+
+def resolve_folder(account, folder: str) -> str:
+    folder = mail_service.normalize_folder(folder)
+    if folder not in mail_service.account_folders(account):
+        raise HTTPException(status_code=404, detail="Folder not found")
+    return folder
+
+@app.get("/api/mail/messages/{uid}")
+async def get_mail_message(
+    uid: int,
+    mail_id: str,
+    token: str,
+    folder: str = Query(imap_pool.DEFAULT_MAILBOX, max_length=255),
+    db=Depends(database.get_async_db)
+):
+    """One message with the text of its body; attachments are only listed."""
+    logger.info("[API] /api/mail/messages/%s called - mail_id: %s, folder: %s", uid, mail_id, folder)
+    account = await get_authorized_account(mail_id, token, db)
+    folder = resolve_folder(account, folder)
+    detail = await mail_detail.fetch_message_detail(account, uid, folder, db=db)
+    if detail is None:
+        raise HTTPException(status_code=404, detail="Message not found")
+    if "error" in detail:
+        logger.error("[API] Detail fetch failed - account: %s, uid: %s, reason: %s", account.email, uid, detail['error'])
+        return detail
+    # A UID always names the same message (until UIDVALIDITY changes)
+    return JSONResponse(detail, headers={"Cache-Control": "private, max-age=3600"})
+
+@app.get("/api/mail/messages/{uid}/attachments/{section}")
+async def get_mail_attachment(
+    uid: int,
+    section: str,
+    mail_id: str,
+    token: str,
+    folder: str = Query(imap_pool.DEFAULT_MAILBOX, max_length=255),
+    db=Depends(database.get_async_db)
+):
+    """Download one attachment, listed by ``section`` in the message detail."""
+    logger.info("[API] Attachment %s of message %s requested - mail_id: %s, folder: %s", section, uid, mail_id, folder)
+    account = await get_authorized_account(mail_id, token, db)
+    folder = resolve_folder(account, folder)
+    await database.close_session(db)
+    result = await mail_detail.fetch_attachment(account, uid, section, folder)
+    if result is None:
+        raise HTTPException(status_code=404, detail="Attachment not found")
+    if isinstance(result, dict):
+        return result
+    part, data = result
+    if data is None:
+        raise HTTPException(status_code=413, detail=f"Attachment larger than {config.MAIL_ATTACHMENT_MAX_BYTES} bytes")
+    filename = part.filename or f"part-{part.section}"
+    return Response(
+        data,
+        media_type=part.content_type,
+        headers={
+            # Never render attachments (e.g. HTML) on this origin
+            "Content-Disposition": f"attachment; filename*=UTF-8''{urllib.parse.quote(filename)}",
+            "X-Content-Type-Options": "nosniff",
+            "Cache-Control": "private, max-age=3600",
+        },
+    )
+
+def parse_since(value: Optional[str]):
+    try:
+        return mail_watch.parse_cursor(value)
+    except ValueError:
+        raise HTTPException(status_code=422, detail="Invalid since cursor")
+
+@app.get("/api/mail/wait")
+async def wait_for_mail(
+    mail_id: str,
+    token: str,
+    sender: Optional[str] = None,
+    since: Optional[str] = Query(None, max_length=1024),
+    timeout: float = Query(config.MAIL_WAIT_DEFAULT_TIMEOUT, gt=0, le=config.MAIL_WAIT_MAX_TIMEOUT),
+    db=Depends(database.get_async_db)
+):
+    """Long-poll until a message with a UID above ``since`` arrives or ``timeout`` expires."""
+    logger.info("[API] /api/mail/wait called - mail_id: %s, sender: %s, since: %s, timeout: %s", mail_id, sender, since, timeout)
+    since = parse_since(since)
+    account = await get_authorized_account(mail_id, token, db)
+    # The shared check loop uses its own session; release this one while waiting
+    await database.close_session(db)
+    return await mail_watch.hub.wait(account, sender, since, timeout)
+
+@app.get("/api/mail/stream")
+async def stream_mail(
+    request: Request,
+    mail_id: str,
+    token: str,
+    sender: Optional[str] = None,
+    since: Optional[str] = Query(None, max_length=1024),
+    timeout: float = Query(config.MAIL_STREAM_MAX_DURATION, gt=0, le=config.MAIL_STREAM_MAX_DURATION),
+    db=Depends(database.get_async_db)
+):
+    """Server-Sent Events stream of the mailbox; resumes from ``Last-Event-ID``."""
+    logger.info("[API] /api/mail/stream called - mail_id: %s, sender: %s", mail_id, sender)
+    account = await get_authorized_account(mail_id, token, db)
+    await database.close_session(db)
+
+    since = parse_since(since)
+    if since is None:
+        try:
+            since = mail_watch.parse_cursor(request.headers.get("last-event-id", "")[:1024])
+        except ValueError:
+            pass
 
-    return emails
+    return StreamingResponse(
+        mail_watch.hub.stream(account, sender, since, timeout),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -0,0 +1,202 @@
+"""
+Metrics
+Minimal in-process counters, gauges and histograms rendered in the
+Prometheus text exposition format for ``/metrics``. Recording a value is a
+dict lookup, a lock and an addition, so instrumentation can stay enabled in
+production without pulling in a client library.
+"""
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Callable, Dict, Sequence, Tuple
+
+# Seconds; covers sub-millisecond parsing up to a full IMAP timeout
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_registry = []
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _label_text(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values: Dict[Tuple[str, ...], object] = {}
+        _registry.append(self)
+
+    def _key(self, labelvalues) -> Tuple[str, ...]:
+        if len(labelvalues) != len(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {labelvalues}")
+        return tuple(str(value) for value in labelvalues)
+
+    def render(self):
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} {self.kind}"
+        with self._lock:
+            items = sorted(self._values.items())
+        for labelvalues, value in items:
+            yield from self._samples(labelvalues, value)
+
+    def _samples(self, labelvalues, value):
+        yield f"{self.name}{_label_text(self.labelnames, labelvalues)} {_number(value)}"
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, *labelvalues, amount: float = 1):
+        key = self._key(labelvalues)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value: float, *labelvalues):
+        key = self._key(labelvalues)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, *labelvalues, amount: float = 1):
+        key = self._key(labelvalues)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, *labelvalues, amount: float = 1):
+        self.inc(*labelvalues, amount=-amount)
+
+    @contextmanager
+    def track_inprogress(self, *labelvalues):
+        self.inc(*labelvalues)
+        try:
+            yield
+        finally:
+            self.dec(*labelvalues)
+
+
+class CallbackMetric(_Metric):
+    """Counter or gauge read at scrape time from state kept elsewhere.
+
+    ``callback`` returns ``{labelvalues: value}``; label values may be a
+    plain string for a single label.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        callback: Callable[[], dict],
+        labelnames: Sequence[str] = (),
+        kind: str = "gauge",
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.callback = callback
+        self.kind = kind
+
+    def render(self):
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} {self.kind}"
+        for labelvalues, value in sorted(self.callback().items()):
+            if not isinstance(labelvalues, tuple):
+                labelvalues = (labelvalues,) if self.labelnames else ()
+            yield from self._samples(labelvalues, value)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, *labelvalues):
+        key = self._key(labelvalues)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # Per-bucket (non-cumulative) counts, +Inf last, then sum
+                state = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            state[index] += 1
+            state[-1] += value
+
+    @contextmanager
+    def time(self, *labelvalues):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, *labelvalues)
+
+    def _samples(self, labelvalues, state):
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float("inf"),), state[:-1]):
+            cumulative += count
+            le = f'le="{_number(bound)}"'
+            yield f"{self.name}_bucket{_label_text(self.labelnames, labelvalues, le)} {cumulative}"
+        labels = _label_text(self.labelnames, labelvalues)
+        yield f"{self.name}_sum{labels} {_number(state[-1])}"
+        yield f"{self.name}_count{labels} {cumulative}"
+
+
+def render() -> str:
+    """All registered metrics in the Prometheus text format (version 0.0.4)."""
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+imap_phase_seconds = Histogram(
+    "imap_phase_duration_seconds",
+    "Time spent in each phase of a mailbox fetch",
+    ["phase"],
+)
+mail_cache_lookups = Counter(
+    "mail_cache_lookups_total",
+    "Mailbox cache outcomes: hit (no new mail), partial (only new headers fetched), miss, watcher",
+    ["result"],
+)
+message_body_lookups = Counter(
+    "message_body_cache_lookups_total",
+    "Message detail body cache outcomes: memory, disk, miss",
+    ["result"],
+)
+imap_errors = Counter(
+    "imap_errors_total",
+    "IMAP failures per host by kind: timeout, connection, auth, fetch, circuit_open",
+    ["host", "kind"],
+)
+fetches_in_flight = Gauge(
+    "mail_fetches_in_flight",
+    "Mailbox fetches currently talking to an IMAP server",
+)
+http_request_seconds = Histogram(
+    "http_request_duration_seconds",
+    "HTTP request latency per route until the response headers are sent",
+    ["method", "route", "status"],
+)
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, ForeignKey, Text, DateTime, func
+from sqlalchemy import BigInteger, Column, Integer, String, ForeignKey, Text, DateTime, Index, func
 from database import Base
 
 
@@ -9,12 +9,14 @@ class EmailAccount(Base):
     mail_id = Column(String, unique=True, index=True)
     email = Column(String, unique=True, index=True)
     password = Column(String)
-    imap_server = Column(String)
+    imap_server = Column(String, index=True)
     access_token = Column(String)  # Token required to access this account via API
     default_sender_filter = Column(String, nullable=True)
+    folders = Column(String, nullable=True)  # Comma separated IMAP folders to search; empty uses MAIL_FOLDERS
 
 
 class EmailCache(Base):
+    # Legacy JSON cache; rows are moved to CachedMessage/MailboxSyncState on startup
     __tablename__ = "email_cache"
 
     id = Column(Integer, primary_key=True, index=True)
@@ -22,3 +24,33 @@ class EmailCache(Base):
     message_ids = Column(Text, nullable=True)  # JSON serialized list of ids
     payload = Column(Text, nullable=True)  # JSON serialized email summary list
     updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+
+class MailboxSyncState(Base):
+    # One row per account and folder; replaces the per-account mailbox_sync_state table
+    __tablename__ = "folder_sync_state"
+
+    account_id = Column(Integer, ForeignKey("email_accounts.id"), primary_key=True)
+    folder = Column(String, primary_key=True, default="INBOX")
+    filters = Column(Text, nullable=True)  # JSON serialized sender filters the cached messages match
+    uidvalidity = Column(Integer, nullable=True)
+    last_uid = Column(Integer, nullable=True)  # Highest UID seen by the last sync
+    uidnext = Column(Integer, nullable=True)  # UIDNEXT reported by STATUS before the last sync
+    message_count = Column(Integer, nullable=True)  # MESSAGES reported by STATUS before the last sync
+    search_limit = Column(Integer, nullable=True)  # Window size of that sync; fewer cached rows mean all matches
+    highestmodseq = Column(BigInteger, nullable=True)  # HIGHESTMODSEQ from the same STATUS (CONDSTORE servers only)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+
+class CachedMessage(Base):
+    __tablename__ = "cached_messages"
+    __table_args__ = (Index("ix_cached_messages_account_folder_uid", "account_id", "folder", "uid", unique=True),)
+
+    id = Column(Integer, primary_key=True, index=True)
+    account_id = Column(Integer, ForeignKey("email_accounts.id"), nullable=False)
+    folder = Column(String, nullable=False, server_default="INBOX")  # UIDs are only unique within a folder
+    uid = Column(Integer, nullable=False)
+    subject = Column(String, nullable=True)
+    sender = Column(String, nullable=True)  # Raw From header
+    date = Column(String, nullable=True)  # Display date (GMT+8)
+    code = Column(String, nullable=True)  # Extracted verification code
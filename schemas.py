@@ -8,6 +8,7 @@ class EmailAccountBase(BaseModel):
     imap_server: str
     access_token: str
     default_sender_filter: Optional[str] = None
+    folders: Optional[str] = None
 
 class EmailAccountCreate(EmailAccountBase):
     mail_id: Optional[str] = None
@@ -20,9 +21,15 @@ class EmailAccountUpdate(BaseModel):
     imap_server: Optional[str] = None
     access_token: Optional[str] = None
     default_sender_filter: Optional[str] = None
+    folders: Optional[str] = None
 
 class EmailAccountResponse(EmailAccountBase):
     id: int
 
     class Config:
         orm_mode = True
+
+class MailBatchItem(BaseModel):
+    mail_id: str
+    token: str
+    sender: Optional[str] = None
@@ -0,0 +1,361 @@
+"""
+Shared Hot Cache
+Cross-process cache for ``uvicorn --workers N``: mailbox results are stored
+as small files in a tmpfs directory (``/dev/shm`` by default), so any worker
+can serve a result another worker just fetched. Per-account generations live
+in one mmap'd file and are read without a system call; bumping an account's
+generation invalidates its entries (and the account lookups cached by
+:mod:`account_cache`) in every worker. ``flock`` leases make sure only one
+worker refreshes a given mailbox at a time, and are released by the kernel
+if a worker dies. Expired entries and idle lock files are swept while
+storing, and the number of entries is capped, since tmpfs lives in RAM.
+"""
+import asyncio
+import concurrent.futures
+import hashlib
+import json
+import logging
+import mmap
+import os
+import stat
+import struct
+import tempfile
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+from typing import Optional
+
+import config as app_config
+
+try:
+    import fcntl
+except ImportError:  # Windows: no flock, the shared cache stays disabled
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+GENERATION_SLOTS = 4096
+GENERATION = struct.Struct("<Q")
+ENTRY_HEADER = struct.Struct("<dQ")  # stored_at (epoch seconds), account generation
+# Sweep at least this often (seconds) while entries are being stored
+SWEEP_INTERVAL = 30.0
+# Never follow a symlink planted in place of an entry
+O_NOFOLLOW = getattr(os, "O_NOFOLLOW", 0)
+
+
+def default_directory() -> str:
+    base = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+    # One directory per deployment, so two checkouts on a box do not share entries
+    digest = hashlib.sha1(f"{os.getcwd()}|{app_config.DATABASE_URL}".encode()).hexdigest()[:12]
+    return os.path.join(base, f"recv-vcode-{digest}")
+
+
+class SharedCache:
+    def __init__(self, directory: str = None, enabled: bool = None, max_entries: int = None, max_age: float = None):
+        requested = app_config.SHARED_CACHE_ENABLED if enabled is None else enabled
+        self.directory = directory or app_config.SHARED_CACHE_DIR or default_directory()
+        self.enabled = requested and fcntl is not None
+        self.max_entries = app_config.SHARED_CACHE_MAX_ENTRIES if max_entries is None else max_entries
+        # Entries older than this are never served, so the sweep removes them
+        self.max_age = app_config.SHARED_RESULT_TTL if max_age is None else max_age
+        self._lock = threading.Lock()
+        self._directory_ready = False
+        self._last_sweep = time.monotonic()
+        self._puts_since_sweep = 0
+        self._generations: Optional[mmap.mmap] = None
+        self._generations_fd: Optional[int] = None
+        if requested and fcntl is None:
+            logger.warning("[SHARED] fcntl is not available on this platform, shared cache disabled")
+        if self.enabled:
+            try:
+                self._ensure_directory()
+            except OSError as e:
+                logger.error("[SHARED] Cannot use %s, shared cache disabled: %s", self.directory, e)
+                self.enabled = False
+
+    def generation(self, account_id: int) -> int:
+        if not self.enabled:
+            return 0
+        generations = self._generations or self._open_generations()
+        return GENERATION.unpack_from(generations, self._slot(account_id))[0]
+
+    def bump(self, account_id: int):
+        """Invalidate every shared entry of ``account_id`` in all workers."""
+        if not self.enabled:
+            return
+        generations = self._generations or self._open_generations()
+        offset = self._slot(account_id)
+        fcntl.flock(self._generations_fd, fcntl.LOCK_EX)
+        try:
+            GENERATION.pack_into(generations, offset, GENERATION.unpack_from(generations, offset)[0] + 1)
+        finally:
+            fcntl.flock(self._generations_fd, fcntl.LOCK_UN)
+
+    def get(self, name: str, account_id: int, max_age: float):
+        """Value stored under ``name`` if younger than ``max_age`` and still current."""
+        entry = self.read(name, max_age)
+        if entry is None or entry[0] != self.generation(account_id):
+            return None
+        return entry[1]
+
+    def read(self, name: str, max_age: float):
+        """``(generation, value)`` stored under ``name`` if younger than ``max_age``."""
+        if not self.enabled:
+            return None
+        try:
+            with os.fdopen(os.open(self._path(name), os.O_RDONLY | O_NOFOLLOW), "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            return None
+        except OSError as e:
+            logger.warning("[SHARED] Failed to read entry %s: %s", name, e)
+            return None
+        if len(data) < ENTRY_HEADER.size:
+            return None
+        stored_at, generation = ENTRY_HEADER.unpack_from(data)
+        if time.time() - stored_at > max_age:
+            return None
+        try:
+            return generation, json.loads(data[ENTRY_HEADER.size:])
+        except ValueError:
+            return None
+
+    def put(self, name: str, account_id: int, value, generation: int = None):
+        """Store ``value``; pass the ``generation`` read before loading it to avoid racing an invalidation."""
+        if not self.enabled:
+            return
+        if generation is None:
+            generation = self.generation(account_id)
+        payload = ENTRY_HEADER.pack(time.time(), generation) + json.dumps(value, ensure_ascii=False).encode()
+        path = self._path(name)
+        temporary = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            fd = os.open(temporary, os.O_WRONLY | os.O_CREAT | os.O_EXCL | O_NOFOLLOW, 0o600)
+            with os.fdopen(fd, "wb") as f:
+                f.write(payload)
+            # Readers see either the old or the new entry, never a partial one
+            os.replace(temporary, path)
+        except OSError as e:
+            logger.warning("[SHARED] Failed to write entry %s: %s", name, e)
+            try:
+                os.unlink(temporary)
+            except OSError:
+                pass
+        if self._sweep_due():
+            self.sweep()
+
+    def sweep(self) -> int:
+        """Remove expired entries, idle lock files and the oldest entries over ``max_entries``.
+
+        Every worker sweeps after storing ``max_entries / 16`` entries or
+        :data:`SWEEP_INTERVAL` seconds, so the directory can only briefly
+        exceed the cap. Returns the number of files removed.
+        """
+        if not self.enabled:
+            return 0
+        with self._lock:
+            self._last_sweep = time.monotonic()
+            self._puts_since_sweep = 0
+        now = time.time()
+        removed = 0
+        entries = []
+        try:
+            with os.scandir(self.directory) as listing:
+                for item in listing:
+                    try:
+                        info = item.stat(follow_symlinks=False)
+                    except FileNotFoundError:
+                        continue
+                    if item.name == "generations":
+                        continue
+                    if now - info.st_mtime <= self.max_age:
+                        if not item.name.endswith((".lock", ".tmp")):
+                            entries.append((info.st_mtime, item.path))
+                    elif item.name.endswith(".lock"):
+                        removed += self._remove_lock(item.path)
+                    else:
+                        removed += _unlink(item.path)
+        except OSError as e:
+            logger.warning("[SHARED] Failed to sweep %s: %s", self.directory, e)
+            return removed
+        if len(entries) > self.max_entries:
+            entries.sort()
+            for _, path in entries[: len(entries) - self.max_entries]:
+                removed += _unlink(path)
+        if removed:
+            logger.debug("[SHARED] Swept %s file(s) from %s", removed, self.directory)
+        return removed
+
+    def _sweep_due(self) -> bool:
+        with self._lock:
+            self._puts_since_sweep += 1
+            return (
+                self._puts_since_sweep >= max(1, self.max_entries // 16)
+                or time.monotonic() - self._last_sweep >= SWEEP_INTERVAL
+            )
+
+    def _remove_lock(self, path: str) -> bool:
+        """Unlink an idle lock file; holding its lock keeps a waiting lease from being split."""
+        try:
+            fd = os.open(path, os.O_RDWR | O_NOFOLLOW)
+        except OSError:
+            return False
+        try:
+            if not self._try_lock(fd):
+                return False
+            return _unlink(path)
+        finally:
+            os.close(fd)
+
+    @contextmanager
+    def lease(self, name: str, wait: float):
+        """Hold the refresh lease for ``name`` while the block runs.
+
+        Yields ``True`` if another worker held the lease first (so the cache
+        is worth checking again); after ``wait`` seconds the block runs
+        without the lease.
+        """
+        if not self.enabled:
+            yield False
+            return
+        deadline = time.monotonic() + wait
+        waited = False
+        while True:
+            fd = self._open_lock(name)
+            locked = self._try_lock(fd)
+            if not locked:
+                waited = True
+                try:
+                    locked = self._lock_in_background(fd).result(max(0.0, deadline - time.monotonic()))
+                except concurrent.futures.TimeoutError:
+                    pass
+            if self._lease_acquired(fd, name, locked, wait):
+                break
+        try:
+            yield waited
+        finally:
+            os.close(fd)
+
+    @asynccontextmanager
+    async def lease_async(self, name: str, wait: float):
+        """Asyncio counterpart of :meth:`lease`; awaits the lock instead of blocking the loop."""
+        if not self.enabled:
+            yield False
+            return
+        deadline = time.monotonic() + wait
+        waited = False
+        while True:
+            fd = self._open_lock(name)
+            locked = self._try_lock(fd)
+            if not locked:
+                waited = True
+                future = asyncio.wrap_future(self._lock_in_background(fd))
+                try:
+                    locked = await asyncio.wait_for(asyncio.shield(future), max(0.0, deadline - time.monotonic()))
+                except asyncio.TimeoutError:
+                    pass
+            if self._lease_acquired(fd, name, locked, wait):
+                break
+        try:
+            yield waited
+        finally:
+            os.close(fd)
+
+    def _lease_acquired(self, fd: int, name: str, locked: bool, wait: float) -> bool:
+        """Whether the lease attempt on ``fd`` is over; closes ``fd`` when it has to be retried."""
+        if not locked:
+            logger.warning("[SHARED] Lease for %s still held after %ss, refreshing anyway", name, wait)
+            return True
+        try:
+            current = os.stat(self._path(name) + ".lock", follow_symlinks=False).st_ino == os.fstat(fd).st_ino
+        except FileNotFoundError:
+            current = False
+        if not current:
+            # The sweep unlinked the file while this lease waited on it
+            os.close(fd)
+        return current
+
+    @staticmethod
+    def _lock_in_background(fd: int) -> concurrent.futures.Future:
+        """Block on ``flock`` in a helper thread; the future turns ``True`` once ``fd`` holds the lock.
+
+        The helper locks a duplicate of ``fd``, which shares its open file
+        description (and thus the lock), so a caller that gave up can close
+        ``fd`` without waiting for the helper.
+        """
+        future = concurrent.futures.Future()
+        duplicate = os.dup(fd)
+
+        def lock():
+            try:
+                fcntl.flock(duplicate, fcntl.LOCK_EX)
+                future.set_result(True)
+            except OSError as e:
+                future.set_exception(e)
+            finally:
+                os.close(duplicate)
+
+        threading.Thread(target=lock, name="shared-lease", daemon=True).start()
+        return future
+
+    def _ensure_directory(self):
+        if not self._directory_ready:
+            os.makedirs(self.directory, mode=0o700, exist_ok=True)
+            self._check_directory()
+            self._directory_ready = True
+
+    def _check_directory(self):
+        """Refuse a directory another local user could read or plant entries in.
+
+        The default path is predictable, so it may have been created by
+        someone else before this process started.
+        """
+        info = os.lstat(self.directory)
+        if stat.S_ISLNK(info.st_mode) or not stat.S_ISDIR(info.st_mode):
+            raise PermissionError(f"{self.directory} is not a directory")
+        if info.st_uid != os.getuid():
+            raise PermissionError(f"{self.directory} is owned by uid {info.st_uid}, not {os.getuid()}")
+        if stat.S_IMODE(info.st_mode) != 0o700:
+            raise PermissionError(f"{self.directory} has mode {stat.S_IMODE(info.st_mode):o}, expected 700")
+
+    def _open_generations(self) -> mmap.mmap:
+        with self._lock:
+            if self._generations is None:
+                self._ensure_directory()
+                fd = os.open(os.path.join(self.directory, "generations"), os.O_RDWR | os.O_CREAT | O_NOFOLLOW, 0o600)
+                if os.fstat(fd).st_size < GENERATION_SLOTS * GENERATION.size:
+                    os.ftruncate(fd, GENERATION_SLOTS * GENERATION.size)
+                self._generations_fd = fd
+                self._generations = mmap.mmap(fd, GENERATION_SLOTS * GENERATION.size)
+            return self._generations
+
+    def _open_lock(self, name: str) -> int:
+        self._ensure_directory()
+        return os.open(self._path(name) + ".lock", os.O_RDWR | os.O_CREAT | O_NOFOLLOW, 0o600)
+
+    @staticmethod
+    def _try_lock(fd: int) -> bool:
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return True
+        except BlockingIOError:
+            return False
+
+    @staticmethod
+    def _slot(account_id: int) -> int:
+        return (int(account_id) % GENERATION_SLOTS) * GENERATION.size
+
+    def _path(self, name: str) -> str:
+        self._ensure_directory()
+        return os.path.join(self.directory, hashlib.sha1(name.encode()).hexdigest())
+
+
+def _unlink(path: str) -> bool:
+    try:
+        os.unlink(path)
+        return True
+    except FileNotFoundError:
+        return False
+
+
+cache = SharedCache()
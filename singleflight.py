@@ -0,0 +1,76 @@
+"""
+Single-flight Call Coalescing
+Concurrent calls with the same key share one execution: the first caller
+runs the function and every caller that arrives while it is in flight gets
+the same result or exception.
+"""
+import asyncio
+import threading
+
+
+class _Call:
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Deduplicates in-flight work per key for threads and for asyncio tasks.
+
+    Blocking callers (:meth:`do`) and coroutine callers (:meth:`do_async`)
+    are coalesced separately, since a blocking result cannot be awaited and
+    a coroutine cannot be waited on from another thread without a loop.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._tasks = {}
+
+    def do(self, key, fn, *args, **kwargs):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn(*args, **kwargs)
+        except BaseException as exc:
+            call.error = exc
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
+
+    async def do_async(self, key, coro_fn, *args, **kwargs):
+        task = self._tasks.get(key)
+        if task is None:
+            # Run as a separate task so a cancelled caller (e.g. a client that
+            # disconnected) does not cancel the work the others wait for.
+            task = asyncio.ensure_future(coro_fn(*args, **kwargs))
+            self._tasks[key] = task
+            task.add_done_callback(lambda done, key=key: self._forget(key, done))
+        return await asyncio.shield(task)
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._calls) + len(self._tasks)
+
+    def _forget(self, key, task):
+        if self._tasks.get(key) is task:
+            del self._tasks[key]
+        if not task.cancelled():
+            # Mark the exception as retrieved even when every caller went away
+            task.exception()
@@ -0,0 +1,184 @@
+import asyncio
+import base64
+import imaplib
+import itertools
+import json
+import os
+import sys
+import tempfile
+import urllib.parse
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# Keep the tests away from the application's database and shared cache
+os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(tempfile.mkdtemp(prefix="recv-vcode-test-"), "test.db")
+os.environ["SHARED_CACHE_ENABLED"] = "false"
+os.environ["IDLE_WATCHERS_ENABLED"] = "false"
+
+import config  # noqa: E402
+import crud  # noqa: E402
+import database  # noqa: E402
+import fake_imap_server  # noqa: E402
+import imap_pool  # noqa: E402
+import models  # noqa: E402
+import schemas  # noqa: E402
+from aioimap import AsyncImapClient  # noqa: E402
+
+FOLDERS = ("垃圾邮件", "Entwürfe & Co")
+
+_users = itertools.count()
+
+
+@pytest.fixture(scope="session", autouse=True)
+def tables():
+    models.Base.metadata.create_all(bind=database.engine)
+
+
+@pytest.fixture(scope="session")
+def fake():
+    server = fake_imap_server.FakeImapServer(mailbox_size=30, folders=FOLDERS).start()
+
+    def connect(account, timeout):
+        conn = imaplib.IMAP4(account.imap_server, server.port, timeout=timeout)
+        conn.login(account.email, account.password)
+        return conn
+
+    async def connect_async(account, timeout):
+        client = AsyncImapClient(account.imap_server, server.port, use_ssl=False, timeout=timeout)
+        await client.connect()
+        await client.login(account.email, account.password)
+        return client
+
+    original = imap_pool.pool._connect, imap_pool.async_pool._connect
+    imap_pool.pool._connect, imap_pool.async_pool._connect = connect, connect_async
+    yield server
+    imap_pool.pool._connect, imap_pool.async_pool._connect = original
+    imap_pool.pool.close_all()
+    server.stop()
+
+
+@pytest.fixture
+def db():
+    session = database.SessionLocal()
+    yield session
+    session.close()
+
+
+@pytest.fixture
+def make_account(fake, db):
+    """Create an account; every user gets a fresh generated mailbox on the fake server."""
+
+    def make(**fields):
+        values = dict(
+            email=f"user{next(_users)}@example.com",
+            password="secret",
+            imap_server="127.0.0.1",
+            default_sender_filter=fake.senders[0],
+        )
+        values.update(fields)
+        return crud.create_email_account(db, schemas.EmailAccountCreate(**values))
+
+    return make
+
+
+@pytest.fixture
+def account(make_account):
+    return make_account()
+
+
+@pytest.fixture
+def run():
+    """Run a coroutine function on a fresh event loop."""
+
+    def run(coroutine_fn):
+        async def main():
+            try:
+                return await coroutine_fn()
+            finally:
+                # Pooled sessions belong to this event loop
+                await imap_pool.async_pool.close_all()
+
+        return asyncio.run(main())
+
+    return run
+
+
+class ApiResponse:
+    def __init__(self, status: int, headers: dict, body: bytes):
+        self.status = status
+        self.headers = headers
+        self.body = body
+
+    def json(self):
+        return json.loads(self.body)
+
+    def lines(self):
+        return [json.loads(line) for line in self.body.decode().splitlines()]
+
+
+class Api:
+    """Minimal in-process HTTP client for the ASGI app (no lifespan events)."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def request(self, method, path, params=None, json_body=None, headers=None, admin=False):
+        body = b"" if json_body is None else json.dumps(json_body).encode()
+        headers = {key.lower(): value for key, value in (headers or {}).items()}
+        if json_body is not None:
+            headers.setdefault("content-type", "application/json")
+        if admin:
+            credentials = f"{config.ADMIN_USERNAME}:{config.ADMIN_PASSWORD}".encode()
+            headers["authorization"] = "Basic " + base64.b64encode(credentials).decode()
+        scope = {
+            "type": "http",
+            "asgi": {"version": "3.0"},
+            "http_version": "1.1",
+            "method": method,
+            "scheme": "http",
+            "path": path,
+            "raw_path": path.encode(),
+            "query_string": urllib.parse.urlencode(params or {}, doseq=True).encode(),
+            "headers": [(key.encode(), value.encode()) for key, value in headers.items()],
+            "client": ("127.0.0.1", 50000),
+            "server": ("testserver", 80),
+        }
+        received = False
+        start, chunks = {}, []
+
+        async def receive():
+            nonlocal received
+            if received:
+                # Park like a connected client until the response is done
+                await asyncio.Event().wait()
+            received = True
+            return {"type": "http.request", "body": body, "more_body": False}
+
+        async def send(message):
+            if message["type"] == "http.response.start":
+                start.update(message)
+            elif message["type"] == "http.response.body":
+                chunks.append(message.get("body", b""))
+
+        await self.app(scope, receive, send)
+        response_headers = {key.decode().lower(): value.decode() for key, value in start["headers"]}
+        return ApiResponse(start["status"], response_headers, b"".join(chunks))
+
+    async def get(self, path, params=None, **kwargs):
+        return await self.request("GET", path, params=params, **kwargs)
+
+    async def post(self, path, json_body=None, params=None, **kwargs):
+        return await self.request("POST", path, params=params, json_body=json_body, **kwargs)
+
+    async def put(self, path, json_body=None, **kwargs):
+        return await self.request("PUT", path, json_body=json_body, **kwargs)
+
+
+@pytest.fixture(scope="session")
+def api(fake):
+    import main
+
+    return Api(main.app)
@@ -0,0 +1,82 @@
+import account_cache
+import crud
+from account_cache import AccountCache, AccountRecord
+
+
+def count_queries(monkeypatch):
+    calls = []
+    original = crud.get_email_account
+
+    def counting(db, mail_id):
+        calls.append(mail_id)
+        return original(db, mail_id=mail_id)
+
+    monkeypatch.setattr(crud, "get_email_account", counting)
+    return calls
+
+
+def test_cached_lookup_skips_the_database(db, account, monkeypatch):
+    cache = AccountCache(max_size=8, ttl=60)
+    calls = count_queries(monkeypatch)
+
+    first = cache.get(db, account.mail_id)
+    again = cache.get(db, account.mail_id)
+
+    assert calls == [account.mail_id]
+    assert again is first
+    assert first == AccountRecord.from_model(account)
+    assert cache.stats()["hits"] == 1
+
+
+def test_expired_and_evicted_entries_are_read_again(db, make_account, monkeypatch):
+    accounts = [make_account() for _ in range(3)]
+    cache = AccountCache(max_size=2, ttl=60)
+    calls = count_queries(monkeypatch)
+    for account in accounts:
+        cache.get(db, account.mail_id)
+
+    assert cache.lookup(accounts[0].mail_id) is None
+    assert cache.stats()["evictions"] == 1
+
+    later = account_cache.time.monotonic() + 61
+    monkeypatch.setattr(account_cache.time, "monotonic", lambda: later)
+    cache.get(db, accounts[1].mail_id)
+    assert calls.count(accounts[1].mail_id) == 2
+
+
+def test_invalidate_during_load_keeps_the_old_row_out(db, account, monkeypatch):
+    cache = AccountCache(max_size=8, ttl=60)
+    original = crud.get_email_account
+
+    def racing(db, mail_id):
+        row = original(db, mail_id=mail_id)
+        # An admin edit commits after the row was read
+        cache.invalidate(account_id=row.id)
+        return row
+
+    monkeypatch.setattr(crud, "get_email_account", racing)
+    assert cache.load(db, account.mail_id) is not None
+    assert cache.lookup(account.mail_id) is None
+
+
+def test_admin_edits_invalidate_the_cached_account(fake, account, api, run):
+    old_token, new_token = account.access_token, "rotated-token"
+
+    async def scenario():
+        before = await api.get("/api/mail/messages", {"mail_id": account.mail_id, "token": old_token})
+        updated = await api.put(f"/admin/accounts/{account.id}", {"access_token": new_token}, admin=True)
+        stale = await api.get("/api/mail/messages", {"mail_id": account.mail_id, "token": old_token})
+        fresh = await api.get("/api/mail/messages", {"mail_id": account.mail_id, "token": new_token})
+        deleted = await api.request("DELETE", f"/admin/accounts/{account.id}", admin=True)
+        gone = await api.get("/api/mail/messages", {"mail_id": account.mail_id, "token": new_token})
+        return before, updated, stale, fresh, deleted, gone
+
+    before, updated, stale, fresh, deleted, gone = run(scenario)
+
+    assert before.status == 200
+    assert account_cache.cache.lookup(account.mail_id) is None
+    assert updated.status == 200
+    assert stale.status == 403
+    assert fresh.status == 200 and fresh.json() == before.json()
+    assert deleted.status == 200
+    assert gone.status == 404
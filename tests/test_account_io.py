@@ -0,0 +1,88 @@
+import asyncio
+import itertools
+import json
+
+import account_io
+import crud
+import database
+
+_users = itertools.count()
+
+
+async def chunks(text: str, size: int = 7):
+    # Split mid-line so rows arrive cut across chunk boundaries
+    data = text.encode()
+    for start in range(0, len(data), size):
+        yield data[start:start + size]
+
+
+def run_import(text: str, file_format: str = "ndjson", **kwargs) -> dict:
+    async def main():
+        async with database.async_session() as db:
+            lines = account_io.read_lines(chunks(text))
+            records = account_io.csv_records(lines) if file_format == "csv" else account_io.ndjson_records(lines)
+            return await account_io.AccountImporter(**kwargs).run(db, records)
+
+    return asyncio.run(main())
+
+
+def ndjson(*emails) -> str:
+    return "".join(json.dumps({"email": email, "password": "pw", "imap_server": "imap.example.com"}) + "\n" for email in emails)
+
+
+def fresh_emails(count: int):
+    return [f"import{next(_users)}@example.com" for _ in range(count)]
+
+
+def test_import_writes_all_rows():
+    emails = fresh_emails(5)
+    report = run_import(ndjson(*emails), chunk_size=2)
+
+    assert report["committed"] and report["created"] == 5
+    db = database.SessionLocal()
+    try:
+        assert all(crud.get_email_account_by_email(db, email) for email in emails)
+    finally:
+        db.close()
+
+
+def test_csv_import_with_quoted_multiline_field():
+    email = fresh_emails(1)[0]
+    text = f'email,password,imap_server,default_sender_filter\n{email},pw,imap.example.com,"a@x.com,\nb@x.com"\n'
+    report = run_import(text, file_format="csv")
+
+    assert report["created"] == 1
+
+
+def test_one_bad_row_writes_nothing():
+    emails = fresh_emails(3)
+    text = ndjson(*emails[:2]) + '{"email": "' + emails[2] + '"}\n'
+    report = run_import(text, chunk_size=1)
+
+    assert not report["committed"] and report["created"] == 0
+    assert report["errors"] == [{"line": 3, "error": "Missing password, imap_server"}]
+    db = database.SessionLocal()
+    try:
+        assert crud.get_email_account_by_email(db, emails[0]) is None
+    finally:
+        db.close()
+
+
+def test_upload_over_the_row_limit_is_rejected():
+    emails = fresh_emails(4)
+    report = run_import(ndjson(*emails), max_rows=3)
+
+    assert not report["committed"] and report["error_count"] == 1
+    assert report["errors"][0]["line"] == 4
+
+
+def test_export_leaves_out_secrets_by_default():
+    email = fresh_emails(1)[0]
+    run_import(ndjson(email))
+
+    rows = [json.loads(line) for line in "".join(account_io.export_rows("ndjson", page_size=2)).splitlines()]
+    exported = next(row for row in rows if row["email"] == email)
+    assert "password" not in exported and "access_token" not in exported
+
+    rows = [json.loads(line) for line in "".join(account_io.export_rows("ndjson", include_secrets=True)).splitlines()]
+    assert next(row for row in rows if row["email"] == email)["password"] == "pw"
@@ -0,0 +1,88 @@
+import itertools
+
+import crud
+
+_hosts = itertools.count()
+
+
+def accounts_page(api, **params):
+    return api.get("/admin/api/accounts", params, admin=True)
+
+
+def make_accounts(make_account):
+    # A host of their own keeps other tests' accounts out of the pages
+    host = f"keyset{next(_hosts)}.example.com"
+    names = ["alice", "bob", "carol_x", "dave%", "erin"]
+    return host, [
+        make_account(email=f"{name}.{host}@example.com", imap_server=host, default_sender_filter=f"{name}@sender.test")
+        for name in names
+    ]
+
+
+def test_keyset_pages_cover_every_account_once(make_account, api, run):
+    host, accounts = make_accounts(make_account)
+
+    async def walk():
+        pages, cursor = [], None
+        while True:
+            params = {"imap_server": host, "limit": 2}
+            if cursor is not None:
+                params["cursor"] = cursor
+            response = await accounts_page(api, **params)
+            assert response.status == 200
+            page = response.json()
+            pages.append(page["items"])
+            cursor = page["next_cursor"]
+            if cursor is None:
+                return pages
+
+    pages = run(walk)
+
+    assert [len(page) for page in pages] == [2, 2, 1]
+    ids = [item["id"] for page in pages for item in page]
+    assert ids == [account.id for account in accounts]
+    assert set(pages[0][0]) == set(crud.ACCOUNT_LIST_FIELDS)
+
+
+def test_full_last_page_has_no_cursor(make_account, api, run):
+    host, accounts = make_accounts(make_account)
+    response = run(lambda: accounts_page(api, imap_server=host, limit=len(accounts)))
+
+    assert len(response.json()["items"]) == len(accounts)
+    assert response.json()["next_cursor"] is None
+
+
+def test_filters_and_escaped_search(make_account, api, run):
+    host, accounts = make_accounts(make_account)
+
+    async def scenario():
+        return [
+            (await accounts_page(api, imap_server=host, **params)).json()["items"]
+            for params in ({"email": "carol"}, {"q": "_x"}, {"q": "%"}, {"sender": "erin@"}, {"q": "nobody"})
+        ]
+
+    by_prefix, underscore, percent, sender, nothing = run(scenario)
+
+    assert [item["id"] for item in by_prefix] == [accounts[2].id]
+    # LIKE wildcards in the search are matched literally
+    assert [item["id"] for item in underscore] == [accounts[2].id]
+    assert [item["id"] for item in percent] == [accounts[3].id]
+    assert [item["id"] for item in sender] == [accounts[4].id]
+    assert nothing == []
+
+
+def test_secrets_only_on_request(make_account, api, run):
+    host, accounts = make_accounts(make_account)
+
+    async def scenario():
+        plain = await accounts_page(api, imap_server=host, limit=1)
+        secret = await accounts_page(api, imap_server=host, limit=1, include_secrets="true")
+        anonymous = await api.get("/admin/api/accounts", {"imap_server": host})
+        return plain, secret, anonymous
+
+    plain, secret, anonymous = run(scenario)
+
+    assert "password" not in plain.json()["items"][0]
+    assert "access_token" not in plain.json()["items"][0]
+    assert secret.json()["items"][0]["access_token"] == accounts[0].access_token
+    assert anonymous.status == 401
@@ -0,0 +1,108 @@
+import contextvars
+
+import pytest
+
+import circuit_breaker
+from circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker
+
+HOST = "imap.example.com"
+OPEN_SECONDS = 30
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(circuit_breaker.time, "monotonic", lambda: now[0])
+    return now
+
+
+@pytest.fixture
+def breaker(clock):
+    return CircuitBreaker(enabled=True, failure_rate=0.5, min_requests=4, window=60, open_seconds=OPEN_SECONDS)
+
+
+def state(breaker):
+    return breaker.stats()[HOST]["state"]
+
+
+def trip(breaker):
+    for _ in range(4):
+        assert breaker.allow(HOST)
+        breaker.record_failure(HOST)
+        if state(breaker) == OPEN:
+            return
+    raise AssertionError("circuit did not open")
+
+
+def in_request(fn):
+    # Each request runs in its own context, as asyncio tasks and threadpool calls do
+    return contextvars.Context().run(fn)
+
+
+def test_closed_open_half_open_closed(breaker, clock):
+    assert breaker.allow(HOST)
+    breaker.record_success(HOST)
+    assert state(breaker) == CLOSED
+
+    trip(breaker)
+    assert not breaker.allow(HOST)
+    assert breaker.retry_after(HOST) == OPEN_SECONDS
+
+    clock[0] += OPEN_SECONDS
+    probe = contextvars.Context()
+    assert probe.run(breaker.allow, HOST)
+    assert state(breaker) == HALF_OPEN
+    # Only one probe at a time
+    assert not in_request(lambda: breaker.allow(HOST))
+
+    probe.run(breaker.record_success, HOST)
+    assert state(breaker) == CLOSED
+    assert breaker.stats()[HOST]["requests"] == 0
+    assert in_request(lambda: breaker.allow(HOST))
+
+
+def test_failed_probe_opens_the_circuit_again(breaker, clock):
+    trip(breaker)
+    clock[0] += OPEN_SECONDS
+    probe = contextvars.Context()
+    assert probe.run(breaker.allow, HOST)
+
+    probe.run(breaker.record_failure, HOST)
+    assert state(breaker) == OPEN
+    assert breaker.retry_after(HOST) == OPEN_SECONDS
+
+
+def test_only_the_probe_decides_a_half_open_circuit(breaker, clock):
+    straggler = contextvars.Context()
+    assert straggler.run(breaker.allow, HOST)
+    trip(breaker)
+    clock[0] += OPEN_SECONDS
+    probe = contextvars.Context()
+    assert probe.run(breaker.allow, HOST)
+
+    # A call started before the circuit opened reports back late
+    straggler.run(breaker.record_success, HOST)
+    assert state(breaker) == HALF_OPEN
+    in_request(lambda: breaker.record_failure(HOST))
+    assert state(breaker) == HALF_OPEN
+
+    probe.run(breaker.record_success, HOST)
+    assert state(breaker) == CLOSED
+
+
+def test_lost_probe_is_replaced(breaker, clock):
+    trip(breaker)
+    clock[0] += OPEN_SECONDS
+    lost = contextvars.Context()
+    assert lost.run(breaker.allow, HOST)
+    clock[0] += OPEN_SECONDS / 2
+    assert not in_request(lambda: breaker.allow(HOST))
+
+    clock[0] += OPEN_SECONDS
+    probe = contextvars.Context()
+    assert probe.run(breaker.allow, HOST)
+    # The first probe no longer holds the circuit
+    lost.run(breaker.record_failure, HOST)
+    assert state(breaker) == HALF_OPEN
+    probe.run(breaker.record_success, HOST)
+    assert state(breaker) == CLOSED
@@ -0,0 +1,140 @@
+import csv
+import io
+import time
+
+import pytest
+from sqlalchemy import text
+
+import database
+import db_browser
+from db_browser import RowCounter, TableCatalog
+
+ROWS = 7
+
+
+@pytest.fixture(scope="module")
+def browse_tables():
+    with database.engine.begin() as conn:
+        conn.execute(text("CREATE TABLE browse_pairs (a INTEGER, b TEXT, note TEXT, PRIMARY KEY (a, b))"))
+        conn.execute(text("CREATE TABLE browse_items (id INTEGER PRIMARY KEY, name TEXT)"))
+        conn.execute(text("CREATE TABLE browse_log (line TEXT)"))
+        for i in range(ROWS):
+            conn.execute(text("INSERT INTO browse_pairs VALUES (:a, :b, :note)"), {"a": i // 3, "b": f"k{i}", "note": None})
+            conn.execute(text("INSERT INTO browse_items (name) VALUES (:name)"), {"name": f"item {i}"})
+            conn.execute(text("INSERT INTO browse_log VALUES (:line)"), {"line": f"line {i}"})
+    db_browser.catalog.invalidate()
+    yield db_browser.catalog
+    with database.engine.begin() as conn:
+        for name in ("browse_pairs", "browse_items", "browse_log"):
+            conn.execute(text(f"DROP TABLE {name}"))
+    db_browser.catalog.invalidate()
+
+
+def table_page(api, name, **params):
+    return api.get(f"/admin/api/db/table/{name}", params, admin=True)
+
+
+def test_keyset_pages_on_a_composite_key(browse_tables, api, run):
+    async def walk():
+        rows, cursor = [], None
+        while True:
+            response = await table_page(api, "browse_pairs", limit=3, **({"cursor": cursor} if cursor else {}))
+            assert response.status == 200
+            page = response.json()
+            rows.append(page["rows"])
+            cursor = page["next_cursor"]
+            if cursor is None:
+                return rows, page
+
+    pages, last = run(walk)
+
+    assert [len(page) for page in pages] == [3, 3, 1]
+    keys = [(row["a"], row["b"]) for page in pages for row in page]
+    assert keys == sorted(keys) and len(set(keys)) == ROWS
+    assert last["columns"] == ["a", "b", "note"]
+
+
+def test_table_without_primary_key_pages_by_offset(browse_tables):
+    info = browse_tables.get("browse_log")
+    first, cursor = db_browser.fetch_page(info, 5)
+    rest, _ = db_browser.fetch_page(info, 5, offset=5)
+
+    assert cursor is None
+    assert len(first) == 5 and len(rest) == ROWS - 5
+
+
+def test_bad_cursor_and_table_names_are_rejected(browse_tables, api, run):
+    async def scenario():
+        return [
+            await table_page(api, "browse_pairs", cursor="[1]"),
+            await table_page(api, "browse_pairs", cursor="not json"),
+            await table_page(api, "no_such_table"),
+            await table_page(api, "bad-name"),
+        ]
+
+    statuses = [response.status for response in run(scenario)]
+
+    assert statuses == [400, 400, 404, 400]
+
+
+def wait_for_count(counter, info, expected):
+    deadline = time.monotonic() + 5
+    while counter.get(info)[0] != expected:
+        assert time.monotonic() < deadline, "count was not refreshed"
+        time.sleep(0.01)
+
+
+def test_counts_start_estimated_and_are_refreshed(browse_tables):
+    info = browse_tables.get("browse_items")
+    with database.engine.begin() as conn:
+        conn.execute(text("DELETE FROM browse_items WHERE id = 1"))
+    counter = RowCounter(ttl=60)
+
+    # The estimate is MAX(id): an upper bound once rows were deleted
+    assert counter.get(info) == (ROWS, True)
+    wait_for_count(counter, info, ROWS - 1)
+
+    with database.engine.begin() as conn:
+        conn.execute(text("INSERT INTO browse_items (name) VALUES ('late')"))
+    # Served from the cache until it goes stale
+    assert counter.get(info) == (ROWS - 1, False)
+    counter.ttl = 0
+    assert counter.get(info) == (ROWS - 1, True)
+    wait_for_count(counter, info, ROWS)
+
+
+def test_catalog_is_cached_until_invalidated():
+    catalog = TableCatalog(ttl=60)
+    assert "browse_late" not in catalog.tables()
+    with database.engine.begin() as conn:
+        conn.execute(text("CREATE TABLE browse_late (id INTEGER PRIMARY KEY)"))
+    try:
+        assert catalog.get("browse_late") is None
+        catalog.invalidate()
+        assert catalog.get("browse_late").primary_key == ("id",)
+    finally:
+        with database.engine.begin() as conn:
+            conn.execute(text("DROP TABLE browse_late"))
+
+
+def test_export_streams_csv_and_ndjson(browse_tables, api, run, monkeypatch):
+    monkeypatch.setattr(db_browser, "EXPORT_BATCH_SIZE", 2)
+
+    async def scenario():
+        export = "/admin/api/db/table/browse_pairs/export"
+        return (
+            await api.get(export, {"format": "csv"}, admin=True),
+            await api.get(export, {"format": "ndjson"}, admin=True),
+            await api.get(export, {"format": "xml"}, admin=True),
+        )
+
+    as_csv, as_ndjson, unknown = run(scenario)
+
+    rows = list(csv.reader(io.StringIO(as_csv.body.decode())))
+    assert rows[0] == ["a", "b", "note"]
+    assert rows[1:] == [[str(i // 3), f"k{i}", ""] for i in range(ROWS)]
+    assert as_csv.headers["content-disposition"] == 'attachment; filename="browse_pairs.csv"'
+    lines = as_ndjson.lines()
+    assert [line["b"] for line in lines] == [f"k{i}" for i in range(ROWS)]
+    assert lines[0]["note"] is None
+    assert unknown.status == 400
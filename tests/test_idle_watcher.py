@@ -0,0 +1,45 @@
+import asyncio
+
+import crud
+import idle_watcher
+import imap_pool
+import mail_service
+
+
+async def wait_until(predicate, timeout: float = 5):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not predicate():
+        assert asyncio.get_running_loop().time() < deadline, "condition not reached"
+        await asyncio.sleep(0.02)
+
+
+def test_watcher_keeps_status_fields_for_other_workers(fake, db, account, run):
+    refreshed = []
+
+    async def scenario():
+        manager = idle_watcher.IdleWatcherManager(enabled=True, account_ttl=60, connect=imap_pool.async_pool._connect)
+        manager.add_listener(refreshed.append)
+        await manager.start()
+        try:
+            manager.touch(account)
+            # The first sync fills the cache
+            await wait_until(lambda: refreshed and manager.is_fresh(account.id))
+            fake.add_message(account.email, fake.senders[0], "Pushed message")
+            await wait_until(lambda: len(refreshed) == 2 and manager.is_fresh(account.id))
+        finally:
+            await manager.stop()
+
+    run(scenario)
+
+    db.expire_all()
+    state = crud.get_mailbox_sync_state(db, account.id, imap_pool.DEFAULT_MAILBOX)
+    cached = mail_service.load_cached_result(db, account.id, 5)
+    assert refreshed == [account.id, account.id]
+    assert cached["payload"][0]["subject"] == "Pushed message"
+    assert state.uidnext == int(cached["ids"][0]) + 1 and state.message_count == 31
+
+    # A worker without the watcher is served by STATUS alone
+    fake.reset_stats()
+    emails = mail_service.fetch_recent_emails(account, db=db)
+    assert emails[0]["subject"] == "Pushed message"
+    assert set(fake.stats()["commands"]) <= {"STATUS", "LOGIN", "CAPABILITY", "SELECT"}
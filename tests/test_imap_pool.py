@@ -0,0 +1,50 @@
+import threading
+
+import imap_pool
+from imap_pool import ImapConnectionPool, PooledSession
+
+
+def test_unhealthy_idle_session_is_dropped_without_logout(fake, account, monkeypatch):
+    pool = ImapConnectionPool(healthcheck_after=0, connect=imap_pool.pool._connect)
+    first = pool.acquire(account, 5)
+    pool.release(first)
+    monkeypatch.setattr(PooledSession, "noop", lambda self: False)
+    fake.reset_stats()
+
+    second = pool.acquire(account, 5)
+    try:
+        assert second is not first
+        assert not second.reused
+        assert first.conn.sock.fileno() == -1
+        assert "LOGOUT" not in fake.stats()["commands"]
+    finally:
+        pool.release(second, discard=True)
+        pool.close_all()
+
+
+def test_discarded_session_is_not_logged_out(fake, account):
+    pool = ImapConnectionPool(connect=imap_pool.pool._connect)
+    session = pool.acquire(account, 5)
+    fake.reset_stats()
+
+    pool.release(session, discard=True)
+
+    assert "LOGOUT" not in fake.stats()["commands"]
+    assert pool.stats()["idle_sessions"] == 0
+
+
+def test_concurrent_invalidations_are_all_counted():
+    key = imap_pool.account_key("counted@example.com", "imap.example.com")
+    before = imap_pool.generation(key)
+
+    def bump():
+        for _ in range(500):
+            imap_pool.invalidate(*key)
+
+    threads = [threading.Thread(target=bump) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+
+    assert imap_pool.generation(key) == before + 8 * 500
@@ -0,0 +1,119 @@
+import config
+import mail_batch
+import mail_service
+import main
+
+
+def messages(api, account, **headers):
+    return api.get("/api/mail/messages", {"mail_id": account.mail_id, "token": account.access_token}, headers=headers)
+
+
+def test_unchanged_messages_answer_304(fake, account, api, run):
+    async def scenario():
+        first = await messages(api, account)
+        etag = first.headers["etag"]
+        same = await messages(api, account, **{"If-None-Match": etag})
+        weak = await messages(api, account, **{"If-None-Match": f'"other", W/{etag}'})
+        fake.add_message(account.email, fake.senders[0], "Fresh message")
+        changed = await messages(api, account, **{"If-None-Match": etag})
+        return first, same, weak, changed
+
+    first, same, weak, changed = run(scenario)
+
+    assert first.status == 200 and len(first.json()) == 5
+    assert first.headers["cache-control"] == "private, no-cache"
+    assert same.status == 304 and same.body == b""
+    assert same.headers["etag"] == first.headers["etag"]
+    assert weak.status == 304
+    assert changed.status == 200
+    assert changed.headers["etag"] != first.headers["etag"]
+    assert changed.json()[0]["subject"] == "Fresh message"
+
+
+def test_etag_depends_on_the_sender_filter(fake, account, api, run):
+    async def scenario():
+        default = await messages(api, account)
+        other = await api.get(
+            "/api/mail/messages",
+            {"mail_id": account.mail_id, "token": account.access_token, "sender": fake.senders[1]},
+            headers={"If-None-Match": default.headers["etag"]},
+        )
+        return default, other
+
+    default, other = run(scenario)
+
+    assert other.status == 200
+    assert other.headers["etag"] != default.headers["etag"]
+
+
+def test_errors_carry_no_etag(account, api, run):
+    response = run(lambda: api.get("/api/mail/messages", {"mail_id": account.mail_id, "token": "wrong"}))
+
+    assert response.status == 403
+    assert "etag" not in response.headers
+
+
+def test_etag_matches():
+    assert main.etag_matches('"abc"', '"abc"')
+    assert main.etag_matches('W/"abc"', '"abc"')
+    assert main.etag_matches('"x", "abc"', '"abc"')
+    assert main.etag_matches("*", '"abc"')
+    assert not main.etag_matches('"abcd"', '"abc"')
+    assert not main.etag_matches(None, '"abc"')
+
+
+def batch_items(fake, make_account, monkeypatch):
+    good, rejected, broken = make_account(), make_account(password="bad-password"), make_account()
+    original = mail_service.fetch_recent_emails_async
+
+    async def fetch(account, **kwargs):
+        if account.id == broken.id:
+            raise RuntimeError("boom")
+        return await original(account, **kwargs)
+
+    monkeypatch.setattr(mail_service, "fetch_recent_emails_async", fetch)
+    return [
+        {"mail_id": good.mail_id, "token": good.access_token},
+        {"mail_id": good.mail_id, "token": "wrong"},
+        {"mail_id": "no-such-mailbox", "token": "x"},
+        {"mail_id": rejected.mail_id, "token": rejected.access_token},
+        {"mail_id": broken.mail_id, "token": broken.access_token},
+        {"mail_id": good.mail_id, "token": good.access_token, "sender": fake.senders[1]},
+    ]
+
+
+def test_batch_reports_each_failure_in_its_own_entry(fake, make_account, api, run, monkeypatch):
+    items = batch_items(fake, make_account, monkeypatch)
+    response = run(lambda: api.post("/api/mail/messages/batch", items))
+
+    assert response.status == 200
+    entries = response.json()
+    assert [entry["index"] for entry in entries] == list(range(len(items)))
+    assert [entry["status"] for entry in entries] == [200, 403, 404, 200, 200, 200]
+    assert len(entries[0]["result"]) == 5
+    assert entries[1]["result"] == {"error": "Invalid token"}
+    assert entries[2]["result"] == {"error": "Mail ID not found"}
+    assert entries[3]["result"] == {"error": mail_service.GENERIC_AUTH_ERROR}
+    assert entries[4]["result"] == {"error": mail_service.GENERIC_FETCH_ERROR}
+    assert all(fake.senders[1] in email["subject"] for email in entries[5]["result"])
+    assert [mail_batch.failed(entry) for entry in entries] == [False, True, True, True, True, False]
+
+
+def test_batch_streams_every_entry_as_ndjson(fake, make_account, api, run, monkeypatch):
+    items = batch_items(fake, make_account, monkeypatch)
+    response = run(lambda: api.post("/api/mail/messages/batch", items, params={"stream": "true"}))
+
+    assert response.status == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    entries = response.lines()
+    assert sorted(entry["index"] for entry in entries) == list(range(len(items)))
+    statuses = {entry["index"]: entry["status"] for entry in entries}
+    assert statuses == {0: 200, 1: 403, 2: 404, 3: 200, 4: 200, 5: 200}
+
+
+def test_batch_rejects_too_many_items(api, run, monkeypatch):
+    monkeypatch.setattr(config, "MAIL_BATCH_MAX_ITEMS", 2)
+    items = [{"mail_id": "m", "token": "t"}] * 3
+    response = run(lambda: api.post("/api/mail/messages/batch", items))
+
+    assert response.status == 413
@@ -0,0 +1,201 @@
+import json
+import os
+from email.message import EmailMessage
+from email.policy import SMTP
+
+import pytest
+
+import mail_detail
+import mail_service
+from aioimap import AsyncImapClient
+
+PDF = b"%PDF-1.4 " + bytes(range(256)) * 8
+
+
+def message(sender, subject, plain=None, html=None, attachment=None) -> bytes:
+    msg = EmailMessage(policy=SMTP)
+    msg["From"] = sender
+    msg["To"] = "user@example.com"
+    msg["Subject"] = subject
+    if plain is not None:
+        msg.set_content(plain)
+    if html is not None:
+        if plain is None:
+            msg.set_content(html, subtype="html")
+        else:
+            msg.add_alternative(html, subtype="html")
+    if attachment is not None:
+        msg.add_attachment(PDF, maintype="application", subtype="pdf", filename=attachment)
+    return msg.as_bytes()
+
+
+@pytest.fixture
+def deliver(fake, account):
+    def deliver(subject, **parts):
+        raw = message(fake.senders[0], subject, **parts)
+        return fake.add_message(account.email, fake.senders[0], subject, raw=raw)
+
+    return deliver
+
+
+@pytest.fixture
+def commands(monkeypatch):
+    """IMAP commands sent by the asyncio client, as ``(method, args)``."""
+    sent = []
+    original = AsyncImapClient.pipeline
+
+    async def recording_pipeline(self, batch):
+        sent.extend(batch)
+        return await original(self, batch)
+
+    monkeypatch.setattr(AsyncImapClient, "pipeline", recording_pipeline)
+    return sent
+
+
+def fetched_items(commands):
+    return [args[-1] for method, args in commands if method == "uid" and args[0] == "FETCH"]
+
+
+def test_alternative_message_shows_the_plain_text_part(account, deliver, run):
+    uid = deliver("Alternative", plain="Your code is 482913\n", html="<p>Your code is <b>482913</b></p>")
+    detail = run(lambda: mail_detail.fetch_message_detail(account, uid))
+
+    assert detail["content_type"] == "text/plain"
+    assert detail["text"].strip() == "Your code is 482913"
+    assert detail["code"] == "482913"
+    assert detail["attachments"] == []
+
+
+def test_html_only_message_is_converted_to_text(account, deliver, run):
+    uid = deliver("Html only", html="<html><body><p>Code: <b>771204</b></p><script>x()</script></body></html>")
+    detail = run(lambda: mail_detail.fetch_message_detail(account, uid))
+
+    assert detail["content_type"] == "text/html"
+    assert "<" not in detail["text"] and "x()" not in detail["text"]
+    assert "771204" in detail["text"]
+
+
+def test_attachments_are_listed_but_not_downloaded(account, deliver, run, commands):
+    uid = deliver("Nested", plain="See the attached file\n", html="<p>See the attached file</p>", attachment="Résumé.pdf")
+    detail = run(lambda: mail_detail.fetch_message_detail(account, uid))
+
+    assert detail["text"].strip() == "See the attached file"
+    assert [attachment["section"] for attachment in detail["attachments"]] == ["2"]
+    assert detail["attachments"][0]["filename"] == "Résumé.pdf"
+    assert detail["attachments"][0]["content_type"] == "application/pdf"
+    # The plain part is nested in the multipart/alternative at section 1
+    assert fetched_items(commands)[-1] == "(UID BODY.PEEK[1.1])"
+
+
+def test_attachment_is_fetched_by_nested_section(account, deliver, run):
+    uid = deliver("Attachment", plain="Invoice attached\n", html="<p>Invoice attached</p>", attachment="invoice.pdf")
+    part, data = run(lambda: mail_detail.fetch_attachment(account, uid, "2"))
+    assert part.filename == "invoice.pdf"
+    assert data == PDF
+
+    part, data = run(lambda: mail_detail.fetch_attachment(account, uid, "1.2"))
+    assert part.content_type == "text/html"
+    assert run(lambda: mail_detail.fetch_attachment(account, uid, "3")) is None
+
+
+def test_long_body_is_fetched_partially(account, deliver, run, commands, monkeypatch):
+    monkeypatch.setattr(mail_detail.app_config, "MAIL_BODY_MAX_BYTES", 64)
+    uid = deliver("Long", plain="Code 123456 " + "filler " * 100)
+    detail = run(lambda: mail_detail.fetch_message_detail(account, uid))
+
+    assert detail["truncated"] is True
+    assert detail["text"].startswith("Code 123456")
+    assert fetched_items(commands)[-1] == "(UID BODY.PEEK[1]<0.64>)"
+
+
+def test_missing_message_returns_none(account, run):
+    assert run(lambda: mail_detail.fetch_message_detail(account, 99999)) is None
+
+
+def test_cached_detail_is_served_without_imap(fake, db, account, deliver, run):
+    uid = deliver("Cached", plain="Your code is 550011\n")
+    # A mailbox sync records the folder's UIDVALIDITY, which keys the cache
+    run(lambda: mail_service.fetch_recent_emails_async(account, db=db))
+    first = run(lambda: mail_detail.fetch_message_detail(account, uid, db=db))
+    fake.reset_stats()
+    again = run(lambda: mail_detail.fetch_message_detail(account, uid, db=db))
+
+    assert again == first
+    assert fake.stats()["connections"] == 0 and fake.stats()["total_commands"] == 0
+
+
+def test_body_cache_evicts_least_recently_used_within_size_bound():
+    cache = mail_detail.BodyCache(max_bytes=100, directory="")
+    cache.put("a", {"id": "a"}, 40)
+    cache.put("b", {"id": "b"}, 40)
+    assert cache.lookup("a") == {"id": "a"}
+    cache.put("c", {"id": "c"}, 40)
+
+    assert cache.lookup("b") is None
+    assert cache.lookup("a") and cache.lookup("c")
+    assert cache.stats()["bytes"] == 80 and cache.stats()["evictions"] == 1
+    # An entry larger than the whole cache is not stored
+    cache.put("d", {"id": "d"}, 101)
+    assert cache.lookup("d") is None and cache.stats()["bytes"] == 80
+
+
+def test_disk_tier_survives_eviction_and_is_trimmed(tmp_path):
+    cache = mail_detail.BodyCache(max_bytes=150, directory=str(tmp_path / "bodies"), disk_bytes=300)
+    keys = [(1, "INBOX", 7, uid) for uid in range(3)]
+    for age, key in enumerate(keys):
+        payload = json.dumps({"id": key[3], "text": "x" * 100}).encode()
+        cache.put(key, json.loads(payload), len(payload))
+        cache.save(key, payload)
+        os.utime(cache._path(key), (1000 + age, 1000 + age))
+
+    files = os.listdir(cache.directory)
+    # 3 x ~125 bytes exceed the 300 byte limit: the oldest file is removed
+    assert len(files) == 2 and os.path.basename(cache._path(keys[0])) not in files
+    assert all(os.stat(os.path.join(cache.directory, name)).st_mode & 0o777 == 0o600 for name in files)
+    assert cache.lookup(keys[1]) is None  # Evicted from memory
+    assert cache.load(keys[1])["id"] == 1
+    assert cache.lookup(keys[1])["id"] == 1
+
+    cache.invalidate(1)
+    assert os.listdir(cache.directory) == []
+
+
+def test_disk_tier_does_not_follow_symlinks(tmp_path):
+    directory = tmp_path / "bodies"
+    directory.mkdir()
+    target = tmp_path / "elsewhere.json"
+    target.write_text('{"id": "planted"}')
+    cache = mail_detail.BodyCache(max_bytes=1000, directory=str(directory))
+    key = (1, "INBOX", 7, 1)
+    os.symlink(target, cache._path(key))
+
+    assert cache.load(key) is None
+    cache.save(key, b'{"id": 1}')
+    assert target.read_text() == '{"id": "planted"}'
+
+
+def test_parse_values_handles_literals_quotes_and_nil():
+    raw = b'* 1 FETCH (UID 7 BODY[HEADER.FIELDS (SUBJECT)] {11}\r\nSubject: x\n FLAGS (\\Seen) X "a \\"q\\"" Y NIL)'
+    [_, _, _, values] = mail_detail.parse_values(raw)
+
+    assert values == ["UID", "7", "BODY[HEADER.FIELDS (SUBJECT)]", b"Subject: x\n", "FLAGS", ["\\Seen"], "X", 'a "q"', "Y", None]
+
+
+def test_rfc2231_parameters_are_decoded():
+    params = mail_detail._params(["NAME*0*", "utf-8''%E2%82%AC%20rates", "NAME*1", " 2024.pdf", "CHARSET", "utf-8"])
+    assert params == {"charset": "utf-8", "name": "€ rates 2024.pdf"}
+
+
+def test_body_parts_number_nested_sections():
+    structure = mail_detail.parse_values(
+        b'((("TEXT" "PLAIN" ("CHARSET" "utf-8") NIL NIL "7BIT" 10 1 NIL NIL NIL NIL)'
+        b'("TEXT" "HTML" ("CHARSET" "utf-8") NIL NIL "7BIT" 20 1 NIL NIL NIL NIL) "ALTERNATIVE")'
+        b'("APPLICATION" "PDF" ("NAME" "a.pdf") NIL NIL "BASE64" 300 NIL ("ATTACHMENT" ("FILENAME" "a.pdf")) NIL NIL)'
+        b' "MIXED")'
+    )[0]
+    parts = mail_detail.body_parts(structure)
+    text_part = mail_detail.choose_text_part(parts)
+
+    assert [part.section for part in parts] == ["1.1", "1.2", "2"]
+    assert text_part.section == "1.1"
+    assert [part.section for part in mail_detail.attachment_parts(parts, text_part)] == ["2"]
@@ -0,0 +1,111 @@
+import re
+
+import pytest
+
+import crud
+import mail_service
+import metrics
+from aioimap import AsyncImapClient
+
+
+def test_async_fetch_pipelines_select_with_search(fake, db, account, run, monkeypatch):
+    pipelines = []
+    original = AsyncImapClient.pipeline
+
+    async def recording_pipeline(self, commands):
+        pipelines.append([method for method, _ in commands])
+        return await original(self, commands)
+
+    monkeypatch.setattr(AsyncImapClient, "pipeline", recording_pipeline)
+    fake.reset_stats()
+    emails = run(lambda: mail_service.fetch_recent_emails_async(account, db=db))
+
+    assert len(emails) == 5
+    assert all(fake.senders[0] in email["subject"] for email in emails)
+    uids = [int(email["id"]) for email in emails]
+    assert uids == sorted(uids, reverse=True)
+    assert all(email["code"] for email in emails)
+    # SELECT and the first search share one round trip
+    assert any("select" in methods and "uid" in methods for methods in pipelines)
+    # The capabilities came with the LOGIN response
+    assert "CAPABILITY" not in fake.stats()["commands"]
+
+
+def test_async_fetch_serves_unchanged_mailbox_from_cache(fake, db, account, run):
+    async def scenario():
+        first = await mail_service.fetch_recent_emails_async(account, db=db)
+        fake.reset_stats()
+        again = await mail_service.fetch_recent_emails_async(account, db=db)
+        unchanged_commands = fake.stats()["commands"]
+        fake.add_message(account.email, fake.senders[0], "Fresh message")
+        fresh = await mail_service.fetch_recent_emails_async(account, db=db)
+        return first, again, unchanged_commands, fresh
+
+    first, again, unchanged_commands, fresh = run(scenario)
+
+    assert again == first
+    assert "SEARCH" not in unchanged_commands and "FETCH" not in unchanged_commands
+    # INBOX stays selected on the pooled session: it is re-SELECTed, not sent STATUS
+    assert "STATUS" not in unchanged_commands and "SELECT" in unchanged_commands
+    assert fresh[0]["subject"] == "Fresh message"
+    assert fresh[1:] == first[:4]
+
+
+def test_sync_fetch_matches_async_fetch(fake, db, account, run):
+    emails = mail_service.fetch_recent_emails(account, db=db)
+    cached = run(lambda: mail_service.fetch_recent_emails_async(account, db=db))
+
+    assert len(emails) == 5
+    assert [email["id"] for email in emails] == [email["id"] for email in cached]
+
+
+def test_sync_fetch_reselects_instead_of_status_on_selected_mailbox(fake, db, account, run):
+    first = mail_service.fetch_recent_emails(account, db=db)
+    fake.reset_stats()
+    again = mail_service.fetch_recent_emails(account, db=db)
+    unchanged_commands = fake.stats()["commands"]
+    fake.add_message(account.email, fake.senders[0], "Fresh message")
+    fresh = mail_service.fetch_recent_emails(account, db=db)
+
+    assert again == first
+    assert "STATUS" not in unchanged_commands and "SEARCH" not in unchanged_commands
+    assert fresh[0]["subject"] == "Fresh message"
+
+
+@pytest.mark.parametrize("folder", ["垃圾邮件", "Entwürfe & Co"])
+def test_non_ascii_folder_is_sent_in_modified_utf7(fake, db, make_account, run, folder):
+    account = make_account(folders=f"INBOX,{folder}")
+    fake.add_message(account.email, fake.senders[0], "Code in a non-ASCII folder", folder=folder)
+
+    emails = run(lambda: mail_service.fetch_recent_emails_async(account, db=db))
+    assert emails[0]["subject"] == "Code in a non-ASCII folder"
+    assert emails[0]["folder"] == folder
+
+    # imaplib only sends ASCII: the sync path must encode the name as well
+    crud.delete_mailbox_cache(db, account.id)
+    emails = mail_service.fetch_recent_emails(account, db=db)
+    assert emails[0]["folder"] == folder
+
+
+def phase_labels():
+    return set(re.findall(r'imap_phase_duration_seconds_count\{phase="([^"]+)"\}', metrics.render()))
+
+
+def test_round_trips_are_recorded_under_a_fixed_set_of_phases(fake, db, make_account, run):
+    account = make_account(folders="INBOX," + ",".join(fake.folders))
+    run(lambda: mail_service.fetch_recent_emails_async(account, db=db))
+    mail_service.fetch_recent_emails(make_account(), db=db)
+
+    assert phase_labels() <= {"connect", "login", "select", "status", "search", "fetch", "pipeline", "parse", "cache_write"}
+    # The blocking client sends pipelined commands one by one
+    assert {"select", "search", "fetch"} <= phase_labels()
+
+
+def test_command_phase_labels():
+    search = ("uid", ("SEARCH", "FROM x"))
+    assert mail_service._command_phase("pipeline", ([("select", ("INBOX",)), search],)) == "pipeline"
+    # SELECT of the selected mailbox does not go on the wire
+    assert mail_service._command_phase("pipeline", ([("select", ("INBOX",)), search],), "INBOX") == "search"
+    assert mail_service._command_phase("pipeline", ([("status", ("Junk", "(UIDNEXT)"))] * 3,)) == "pipeline"
+    assert mail_service._command_phase("esearch", ("FROM x", "MAX")) == "search"
+    assert mail_service._command_phase("uid", ("FETCH", "1:5", "(UID)")) == "fetch"
@@ -0,0 +1,155 @@
+import os
+import threading
+import time
+
+import pytest
+
+import shared_cache
+
+
+@pytest.fixture
+def cache(tmp_path):
+    directory = tmp_path / "shared"
+    return shared_cache.SharedCache(directory=str(directory), enabled=True, max_entries=32, max_age=60)
+
+
+def entry_files(cache):
+    return [name for name in os.listdir(cache.directory) if name != "generations" and not name.endswith(".lock")]
+
+
+def test_put_and_get_respect_generation(cache):
+    cache.put("result:a", 1, ["x"])
+    assert cache.get("result:a", 1, 60) == ["x"]
+    cache.bump(1)
+    assert cache.get("result:a", 1, 60) is None
+
+
+def test_sweep_removes_expired_entries_and_idle_locks(cache):
+    cache.put("result:old", 1, ["x"])
+    with cache.lease("result:old", 1):
+        pass
+    old = time.time() - 120
+    for name in os.listdir(cache.directory):
+        if name != "generations":
+            os.utime(os.path.join(cache.directory, name), (old, old))
+    # Storing an entry sweeps once enough were stored since the last sweep
+    cache.put("result:new", 1, ["y"])
+    cache.put("result:new", 1, ["y"])
+
+    assert cache.get("result:new", 1, 60) == ["y"]
+    assert cache.read("result:old", 600) is None
+    assert not [name for name in os.listdir(cache.directory) if name.endswith(".lock")]
+
+
+def test_sweep_keeps_held_locks(cache):
+    with cache.lease("result:a", 1):
+        lock = [name for name in os.listdir(cache.directory) if name.endswith(".lock")][0]
+        old = time.time() - 120
+        os.utime(os.path.join(cache.directory, lock), (old, old))
+        cache.sweep()
+        assert lock in os.listdir(cache.directory)
+
+
+def test_entry_count_is_capped(cache):
+    # One sweep per max_entries / 16 stores
+    for index in range(200):
+        cache.put(f"result:{index}", 1, [index])
+    assert len(entry_files(cache)) <= cache.max_entries + cache.max_entries // 16
+    cache.sweep()
+    assert len(entry_files(cache)) == cache.max_entries
+    # The newest entries are kept
+    assert cache.get("result:199", 1, 60) == [199]
+
+
+def test_lease_blocks_until_released(cache):
+    acquired = threading.Event()
+    release = threading.Event()
+
+    def holder():
+        with cache.lease("result:a", 5):
+            acquired.set()
+            release.wait(5)
+
+    thread = threading.Thread(target=holder)
+    thread.start()
+    acquired.wait(5)
+    threading.Timer(0.2, release.set).start()
+    started = time.monotonic()
+    with cache.lease("result:a", 5) as waited:
+        elapsed = time.monotonic() - started
+    thread.join()
+
+    assert waited is True
+    assert 0.1 < elapsed < 2
+
+
+def test_lease_gives_up_after_wait(cache):
+    acquired = threading.Event()
+    release = threading.Event()
+
+    def holder():
+        with cache.lease("result:a", 5):
+            acquired.set()
+            release.wait(5)
+
+    thread = threading.Thread(target=holder)
+    thread.start()
+    acquired.wait(5)
+    started = time.monotonic()
+    with cache.lease("result:a", 0.2) as waited:
+        elapsed = time.monotonic() - started
+    release.set()
+    thread.join()
+
+    assert waited is True
+    assert elapsed < 1
+
+
+def test_async_lease_waits_without_blocking_the_loop(cache):
+    import asyncio
+
+    async def scenario():
+        ticks = 0
+
+        async def holder(ready):
+            async with cache.lease_async("result:a", 5):
+                ready.set()
+                await asyncio.sleep(0.2)
+
+        async def ticker():
+            nonlocal ticks
+            for _ in range(10):
+                await asyncio.sleep(0.01)
+                ticks += 1
+
+        ready = asyncio.Event()
+        holding = asyncio.create_task(holder(ready))
+        await ready.wait()
+        counting = asyncio.create_task(ticker())
+        async with cache.lease_async("result:a", 5) as waited:
+            pass
+        await asyncio.gather(holding, counting)
+        return waited, ticks
+
+    waited, ticks = asyncio.run(scenario())
+    assert waited is True
+    assert ticks == 10
+
+
+def test_unsafe_directories_disable_the_cache(tmp_path):
+    loose = tmp_path / "loose"
+    loose.mkdir(mode=0o755)
+    loose.chmod(0o755)
+    link = tmp_path / "link"
+    link.symlink_to(tmp_path / "shared-target")
+    (tmp_path / "shared-target").mkdir(mode=0o700)
+
+    assert not shared_cache.SharedCache(directory=str(loose), enabled=True).enabled
+    assert not shared_cache.SharedCache(directory=str(link), enabled=True).enabled
+
+
+def test_symlinked_entry_is_not_followed(cache, tmp_path):
+    target = tmp_path / "elsewhere"
+    target.write_bytes(b"\0" * 64)
+    os.symlink(target, cache._path("result:a"))
+    assert cache.read("result:a", 60) is None
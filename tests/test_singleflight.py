@@ -0,0 +1,120 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from singleflight import SingleFlight
+
+CALLERS = 8
+
+
+def test_threads_share_one_call():
+    flight = SingleFlight()
+    calls = []
+    started = threading.Event()
+    release = threading.Event()
+
+    def work():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return object()
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(flight.do("key", work))) for _ in range(CALLERS)]
+    threads[0].start()
+    started.wait(5)
+    for thread in threads[1:]:
+        thread.start()
+    # Let the followers reach the wait before the leader finishes
+    time.sleep(0.1)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert len(calls) == 1
+    assert len(results) == CALLERS
+    assert all(result is results[0] for result in results)
+    assert flight.in_flight() == 0
+
+
+def test_threads_share_one_exception():
+    flight = SingleFlight()
+    calls = []
+    started = threading.Event()
+    release = threading.Event()
+
+    def work():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        raise ValueError("boom")
+
+    errors = []
+
+    def caller():
+        try:
+            flight.do("key", work)
+        except ValueError as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=caller) for _ in range(CALLERS)]
+    threads[0].start()
+    started.wait(5)
+    for thread in threads[1:]:
+        thread.start()
+    time.sleep(0.1)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert len(calls) == 1
+    assert len(errors) == CALLERS
+    assert all(error is errors[0] for error in errors)
+    assert flight.in_flight() == 0
+
+
+def test_tasks_share_one_call():
+    flight = SingleFlight()
+    calls = []
+
+    async def work():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return object()
+
+    async def main():
+        return await asyncio.gather(*(flight.do_async("key", work) for _ in range(CALLERS)))
+
+    results = asyncio.run(main())
+    assert len(calls) == 1
+    assert all(result is results[0] for result in results)
+    assert flight.in_flight() == 0
+
+
+def test_tasks_share_one_exception():
+    flight = SingleFlight()
+    calls = []
+
+    async def work():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        raise ValueError("boom")
+
+    async def main():
+        return await asyncio.gather(*(flight.do_async("key", work) for _ in range(CALLERS)), return_exceptions=True)
+
+    errors = asyncio.run(main())
+    assert len(calls) == 1
+    assert all(isinstance(error, ValueError) and error is errors[0] for error in errors)
+    assert flight.in_flight() == 0
+
+
+def test_key_is_free_after_completion():
+    flight = SingleFlight()
+    assert flight.do("key", lambda: 1) == 1
+    assert flight.do("key", lambda: 2) == 2
+    with pytest.raises(KeyError):
+        flight.do("key", lambda: {}["missing"])
+    assert flight.do("key", lambda: 3) == 3